@@ -2,32 +2,44 @@
 
 print("[INFO] Pulse: app.py is starting execution...")
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, Response, stream_with_context, make_response
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt, decode_token
 from flask_bcrypt import Bcrypt
-from flask_socketio import SocketIO, emit
+from werkzeug.middleware.proxy_fix import ProxyFix
+from flask_socketio import SocketIO, emit, join_room, ConnectionRefusedError
+import hmac
 import os
-import threading
 import time
-import requests
 from datetime import datetime, timedelta
 
-import google.generativeai as genai
 import database
-import telebot
-from telebot import types
+import notifier
+import bus
+import leader
+import offload
+import static_assets
+import json_codec
+import login_guard
+import metrics
+import query_profiler
 import json
+import gzip
+import zlib
 
 from dotenv import load_dotenv
 
 load_dotenv()
 print(f"DEBUG: Loaded BOT_TOKEN from .env: {os.getenv('BOT_TOKEN')[:5] if os.getenv('BOT_TOKEN') else 'NONE'}...")
 
-# Serve static files from the 't/operator-ai-pro' directory
+# Frontend from 't/operator-ai-pro', or its hashed build (static_assets.py);
+# served by serve_static below rather than Flask's own static route
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-static_folder = os.path.join(BASE_DIR, 't', 'operator-ai-pro')
-app = Flask(__name__, static_url_path='', static_folder=static_folder)
+app = Flask(__name__, static_folder=None)
+app.json = json_codec.FastJSONProvider(app)
+app.static_folder = static_assets.STATIC_ROOT
+# Behind nginx/Apache: hand file bodies to the proxy (X-Sendfile)
+app.config['USE_X_SENDFILE'] = os.getenv("USE_X_SENDFILE") == "1"
 CORS(app) 
 
 # Security Setup
@@ -41,7 +53,39 @@ if not app.config['JWT_SECRET_KEY']:
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 jwt = JWTManager(app)
 bcrypt = Bcrypt(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+
+# Behind Render's (or any) reverse proxy, take the client IP from the
+# X-Forwarded-For hops it appends -- the login limiter keys on it
+PROXY_HOPS = int(os.getenv("PROXY_HOPS", "0"))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS, x_proto=PROXY_HOPS)
+
+# --- Multi-Worker Support ---
+# With MESSAGE_QUEUE set, Socket.IO emits and queue transitions cross worker
+# processes (see bus.py), and single-instance jobs run only in the process
+# holding the leader lease (see leader.py).
+message_bus = bus.get_bus()
+socketio_options = {}
+if bus.MESSAGE_QUEUE.startswith(('redis://', 'rediss://')):
+    socketio_options['message_queue'] = bus.MESSAGE_QUEUE
+elif message_bus is not None:
+    from socketio_bus import BusClientManager
+    socketio_options['client_manager'] = BusClientManager(message_bus)
+# Blocking request work goes to a thread pool under gevent (see offload.py);
+# wrapped before SocketIO so /socket.io traffic stays on the event loop.
+app.wsgi_app = offload.BlockingWorkMiddleware(app.wsgi_app)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='gevent' if offload.EVENTED else 'threading', **socketio_options)
+
+if message_bus is not None:
+    # Keep every worker's position index and reminder heap in step
+    database.add_transition_listener(lambda before, after: message_bus.publish('queue_transitions', (before, after)))
+    message_bus.subscribe('queue_transitions', lambda change: database.apply_remote_transition(*change))
+    database.add_duration_listener(lambda service_id, duration: message_bus.publish('service_durations', (service_id, duration)))
+    message_bus.subscribe('service_durations', lambda change: database.position_index.set_duration(*change))
+    database.add_scope_listener(lambda state: message_bus.publish('scope_touches', state))
+    message_bus.subscribe('scope_touches', database.bump_scopes)
+
+elector = leader.LeaderElector()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -51,16 +95,29 @@ if not BOT_TOKEN:
 if not GEMINI_API_KEY:
     print("FATAL: GEMINI_API_KEY is missing!")
 
-if BOT_TOKEN and GEMINI_API_KEY:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-flash-latest')
-        print("Gemini AI initialized.")
-    except Exception as e:
-        print(f"[ERROR] Gemini Init Error: {e}")
-        model = None
-else:
-    model = None
+# --- Lazy SDK Clients ---
+# google.generativeai and telebot take most of a cold start to import, so the
+# Gemini model and the Telegram bot are built on first use, not at import.
+_model = None
+_bot = None
+_clients_lock = offload.Lock()
+
+def get_model():
+    """Gemini chat model, configured on first use; None without keys or on init failure."""
+    global _model
+    if _model is None:
+        with _clients_lock:
+            if _model is None:
+                _model = False
+                if BOT_TOKEN and GEMINI_API_KEY:
+                    try:
+                        import google.generativeai as genai
+                        genai.configure(api_key=GEMINI_API_KEY)
+                        _model = genai.GenerativeModel('gemini-flash-latest')
+                        print("Gemini AI initialized.")
+                    except Exception as e:
+                        print(f"[ERROR] Gemini Init Error: {e}")
+    return _model or None
 
 # In-memory storage for AI chat sessions
 chat_sessions = {}
@@ -81,7 +138,11 @@ def realtime_proxy():
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/sdp"
         }
-        res = requests.post(url, data=sdp_offer, headers=headers)
+        import requests
+        with metrics.outbound('openai'):
+            res = requests.post(url, data=sdp_offer, headers=headers)
+        if res.status_code >= 400:
+            metrics.OUTBOUND_ERRORS.inc('openai')
         print(f"[DEBUG] OpenAI API Response: {res.status_code}")
         return res.text, res.status_code
     except Exception as e:
@@ -99,23 +160,33 @@ class DummyBot:
     def callback_query_handler(self, *args, **kwargs):
         return lambda f: f
 
-bot = DummyBot()
-if BOT_TOKEN:
+def get_bot():
+    """Telegram bot with the handlers below registered, built on first use (DummyBot without a token)."""
+    global _bot
+    if _bot is None:
+        with _clients_lock:
+            if _bot is None:
+                _bot = _build_bot()
+    return _bot
+
+def _build_bot():
+    if not BOT_TOKEN:
+        print("[WARN] BOT_TOKEN missing in .env! Bot functions will NOT work.")
+        return DummyBot()
     try:
+        import telebot
         bot = telebot.TeleBot(BOT_TOKEN)
+        bot.register_message_handler(send_welcome, commands=['start'])
+        bot.register_message_handler(handle_contact, content_types=['contact'])
+        bot.register_callback_query_handler(handle_rating, func=lambda call: call.data.startswith('rate_'))
         print(f"Telegram Bot initialized with token: {BOT_TOKEN[:5]}...{BOT_TOKEN[-5:] if len(BOT_TOKEN) > 10 else ''}")
+        return bot
     except Exception as e:
         print(f"[ERROR] Bot Init Error (Check your token!): {e}")
-        bot = DummyBot()
-else:
-    print("[WARN] BOT_TOKEN missing in .env! Bot functions will NOT work.")
+        return DummyBot()
 
 # In-memory storage for pending sessions (chat_id -> uid)
 pending_uids = {}
-DATA_FILE = "verifications.json" 
-
-# Initialize DB
-database.init_db()
 
 # --- Auto Admin Creation for Deployment ---
 def auto_create_admin():
@@ -129,9 +200,6 @@ def auto_create_admin():
     else:
         print("DEBUG: No ADMIN_PHONE/ADMIN_PASS env vars found for auto-creation.")
 
-# Run initial setup always on import/startup
-auto_create_admin()
-
 # --- RBAC Helpers ---
 from functools import wraps
 def role_required(roles):
@@ -146,14 +214,146 @@ def role_required(roles):
         return decorated_function
     return decorator
 
+# --- Conditional GET ---
+def etag_from_scopes(parts):
+    """Answer 304 while the scopes a polled view reads are unchanged.
+
+    parts() returns the (scope, scope_id) pairs and plain values (dates,
+    caller scope) for database.scope_etag; it runs after the JWT check.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag = database.scope_etag(*parts())
+            # Weak match: compressed responses carry the ETag as W/"..."
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            # Browsers revalidate every poll instead of trusting a stale copy
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+def _today():
+    return datetime.now().strftime('%Y-%m-%d')
+
+# --- Micro-Cache ---
+# Public hot endpoints share one computation per query string for a couple of
+# seconds (microcache.py); database.py drops the entries of a scope when it
+# changes. Only successful payloads are cached -- compute() raises otherwise.
+BOT_INFO_TTL = float(os.getenv("BOT_INFO_TTL", "300"))
+
+def cached_payload(name, compute, tags=(), ttl=None):
+    key = (name, tuple(sorted(request.args.items(multi=True))))
+    return database.response_cache.get(key, compute, ttl=ttl, tags=tags)
+
+# --- Real-time Rooms ---
+# Sockets authenticate on connect and are joined to the rooms they may see:
+# admins/staff (JWT) to their org or branch, system admins to 'system', and
+# tracker pages (ticket id) to their ticket room, which receives a
+# 'ticket_delta' (position/ETA/status) whenever its line moves. Hallway
+# displays (branch id) join the branch's board room and get a 'board_snapshot'
+# on connect and whenever the board changes (see board.py).
+# Queue events go only to the rooms of the ticket they are about.
+
+def org_room(org_id):
+    return f"org:{org_id}"
+
+def branch_room(branch_id):
+    return f"branch:{branch_id}"
+
+def ticket_room(queue_id):
+    return f"ticket:{queue_id}"
+
+def board_room(branch_id):
+    return f"board:{branch_id}"
+
+def queue_rooms(queue):
+    rooms = ['system', ticket_room(queue['id'])]
+    if queue.get('org_id'):
+        rooms.append(org_room(queue['org_id']))
+    if queue.get('branch_id'):
+        rooms.append(branch_room(queue['branch_id']))
+    return rooms
+
+def publish_queue_event(queue, payload):
+    """Emit 'queue_updated' to everyone allowed to see this ticket, once each."""
+    payload = dict(payload, queue_id=queue['id'], org_id=queue.get('org_id'))
+    metrics.SOCKET_EMITS.inc('queue_updated')
+    offload.call_on_loop(lambda: socketio.emit('queue_updated', payload, to=queue_rooms(queue)))
+
+def emit_ticket_delta(queue_id, payload):
+    # Only this process's trackers: every worker computes and pushes its own deltas
+    metrics.SOCKET_EMITS.inc('ticket_delta')
+    offload.call_on_loop(lambda: socketio.emit('ticket_delta', payload, to=ticket_room(queue_id), ignore_queue=True))
+
+def emit_board_snapshot(branch_id, snapshot):
+    # Only this process's displays: every worker rebuilds and pushes its own boards
+    metrics.SOCKET_EMITS.inc('board_snapshot')
+    offload.call_on_loop(lambda: socketio.emit('board_snapshot', snapshot, to=board_room(branch_id), ignore_queue=True))
+
+@socketio.on('connect')
+def socket_connect(auth=None):
+    accepted = _join_socket_rooms(auth or {})
+    metrics.SOCKET_CLIENTS.inc()
+    return accepted
+
+@socketio.on('disconnect')
+def socket_disconnect(*args):
+    metrics.SOCKET_CLIENTS.dec()
+
+def _join_socket_rooms(auth):
+    token = auth.get('token') or request.args.get('token')
+    ticket = auth.get('ticket') or request.args.get('ticket')
+    board = auth.get('board') or request.args.get('board')
+    if token:
+        try:
+            claims = decode_token(token)
+        except Exception:
+            raise ConnectionRefusedError('unauthorized')
+        role = claims.get('role')
+        if role == 'system_admin':
+            join_room('system')
+        elif role == 'org_admin' and claims.get('org_id'):
+            join_room(org_room(claims['org_id']))
+        elif claims.get('branch_id'):
+            join_room(branch_room(claims['branch_id']))
+        elif claims.get('org_id'):
+            join_room(org_room(claims['org_id']))
+        else:
+            raise ConnectionRefusedError('no scope')
+        return True
+    if ticket:
+        q = offload.run_blocking(database.get_queue, ticket)
+        if not q:
+            raise ConnectionRefusedError('unknown ticket')
+        join_room(ticket_room(q['id']))
+        return True
+    if board:
+        # Public, like the hallway screen itself: ticket numbers and counts only
+        snapshot = offload.run_blocking(database.board_snapshots.get, board)
+        if snapshot is None:
+            raise ConnectionRefusedError('unknown branch')
+        join_room(board_room(board))
+        emit('board_snapshot', snapshot)
+        metrics.SOCKET_EMITS.inc('board_snapshot')
+        return True
+    raise ConnectionRefusedError('unauthorized')
+
 # --- Bot Handlers ---
+# Registered on the bot by _build_bot()
 
-@bot.message_handler(commands=['start'])
 def send_welcome(message):
+    from telebot import types
     args = message.text.split()
     if len(args) > 1:
         session_uid = args[1]
-        save_session_uid(session_uid, message.chat.id)
+        database.save_session_uid(session_uid, message.chat.id)
         pending_uids[message.chat.id] = session_uid
         
     markup = types.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
@@ -164,50 +364,21 @@ def send_welcome(message):
         "👋 <b>Assalomu alaykum!</b>\n\n"
         "Tasdiqlash kodini olish uchun iltimos <b>'Raqamni yuborish'</b> tugmasini bosing."
     )
-    bot.send_message(message.chat.id, welcome_text, parse_mode='HTML', reply_markup=markup)
-
-def save_session_uid(uid, chat_id):
-    data = {}
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            try: data = json.load(f)
-            except: data = {}
-    
-    data[f"uid_{uid}"] = {
-        "user_id": chat_id,
-        "timestamp": datetime.now().isoformat()
-    }
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
-
-def update_uid_with_phone(uid, phone_number):
-    data = {}
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            try: data = json.load(f)
-            except: data = {}
-    
-    key = f"uid_{uid}"
-    if key in data:
-        data[key]["phone"] = phone_number
-        data[key]["verified"] = True
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
-
-@bot.message_handler(content_types=['contact'])
+    get_bot().send_message(message.chat.id, welcome_text, parse_mode='HTML', reply_markup=markup)
+
 def handle_contact(message):
+    from telebot import types
     if message.contact is not None:
         phone = message.contact.phone_number
         database.add_user(phone, message.from_user.id, message.from_user.username)
 
         if message.chat.id in pending_uids:
             uid = pending_uids[message.chat.id]
-            update_uid_with_phone(uid, phone)
+            database.update_uid_with_phone(uid, phone)
             del pending_uids[message.chat.id]
         
-        bot.send_message(message.chat.id, "✅ Rahmat! Raqamingiz tasdiqlandi.", reply_markup=types.ReplyKeyboardRemove())
+        get_bot().send_message(message.chat.id, "✅ Rahmat! Raqamingiz tasdiqlandi.", reply_markup=types.ReplyKeyboardRemove())
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('rate_'))
 def handle_rating(call):
     # Format: rate_queueid_stars
     parts = call.data.split('_')
@@ -219,12 +390,12 @@ def handle_rating(call):
         database.add_rating(q_id, stars, "Telegram orqali baholandi")
         
         # Edit message to confirm
-        bot.edit_message_text(
+        get_bot().edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
             text=f"⭐️ Rahmat! Siz {stars} ball bilan baholadingiz. Fikringiz biz uchun muhim!"
         )
-        bot.answer_callback_query(call.id, "Baholash uchun rahmat!")
+        get_bot().answer_callback_query(call.id, "Baholash uchun rahmat!")
 
 @app.after_request
 def add_security_headers(response):
@@ -235,20 +406,85 @@ def add_security_headers(response):
     response.headers['Content-Security-Policy'] = "default-src 'self'; script-src 'self' 'unsafe-inline' https://cdn.socket.io https://cdn.jsdelivr.net; style-src 'self' 'unsafe-inline' https://fonts.googleapis.com https://cdnjs.cloudflare.com; font-src 'self' https://fonts.gstatic.com data: https://cdnjs.cloudflare.com; connect-src 'self'; img-src 'self' data:;"
     return response
 
+# --- Response Compression ---
+# JSON bodies of GZIP_MIN_SIZE bytes or more are gzipped for clients that
+# accept it; streamed listings (size unknown up front) always are, chunk by
+# chunk. Static files come pre-compressed from static_assets.py instead.
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+@app.after_request
+def compress_json_response(response):
+    if (response.status_code != 200 or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers or response.direct_passthrough):
+        return response
+    if not response.is_streamed and (response.content_length or 0) < GZIP_MIN_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    if response.is_streamed:
+        response.response = _gzip_stream(response.response)
+    else:
+        response.set_data(gzip.compress(response.get_data(), GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # Same content, different bytes than the identity encoding
+        response.set_etag(etag, weak=True)
+    return response
+
 @app.route('/ping')
 def ping():
     return "Pong! Server is alive.", 200
 
+# --- Login Throttling ---
+def login_throttled(phone):
+    """429 response when this IP or phone is out of login attempts (see login_guard.py), else None."""
+    retry_after = login_guard.throttle(request.remote_addr, phone)
+    if not retry_after:
+        return None
+    response = jsonify({"success": False, "message": f"Juda ko'p urinish. {retry_after} soniyadan keyin qayta urinib ko'ring"})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def password_matches(pw_hash, password):
+    try:
+        return login_guard.check_password(bcrypt.check_password_hash, pw_hash, password)
+    except login_guard.PasswordCheckBusy:
+        return None
+
+def server_busy():
+    response = jsonify({"success": False, "message": "Server band. Birozdan keyin qayta urinib ko'ring"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 # --- Flask Routes ---
 
 @app.route('/api/admin/login', methods=['POST'])
 def admin_login():
     data = request.json
-    # 1. Anti-Brute-Force: Artificial Delay
-    time.sleep(1.0) 
-    
     phone = data.get('phone', '').strip()
     password = data.get('password', '').strip()
+    # Anti-brute-force: per IP/phone token buckets instead of a fixed sleep
+    throttled = login_throttled(phone)
+    if throttled:
+        return throttled
     print(f"Login attempt: phone='{phone}', password_length={len(password) if password else 0}")
     
     import sys
@@ -267,7 +503,11 @@ def admin_login():
         conn.close()
         if user: admin = dict(user)
 
-    if admin and bcrypt.check_password_hash(admin['password_hash'], password):
+    matches = password_matches(admin['password_hash'], password) if admin else False
+    if matches is None:
+        return server_busy()
+    if matches:
+        login_guard.forgive(phone)
         # Create token with additional claims for RBAC
         access_token = create_access_token(
             identity=phone,
@@ -338,7 +578,7 @@ def super_create_admin():
 
 @app.route('/')
 def serve_index():
-    return send_from_directory(app.static_folder, 'index.html')
+    return static_assets.send_asset('index.html')
 
 @app.route('/api/health')
 def health_check():
@@ -362,7 +602,9 @@ def diagnostic():
         },
         "cwd": os.getcwd(),
         "files": os.listdir('.'),
-        "db_writable": os.access('.', os.W_OK)
+        "db_writable": os.access('.', os.W_OK),
+        "telegram_outbox": database.get_outbox_stats(),
+        "response_cache": database.response_cache.stats()
     })
 
 @app.before_request
@@ -383,6 +625,52 @@ def log_request_end(response):
     print(f"[REQ] {request.remote_addr} - [{request.method}] {request.path} - {status_color}{response.status_code}{reset_color} ({duration:.3f}s)")
     return response
 
+# --- Metrics ---
+# Per-route latency and SQLite work of every request, plus the counters and
+# gauges declared in metrics.py, in Prometheus text format at /metrics. Routes
+# are labelled by their URL rule (/api/queue/<q_id>), never the raw path.
+# With METRICS_TOKEN set, scrapes must send it as a bearer token; without it
+# only direct (not proxied) scrapes from the loopback interface are served.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+LOOPBACK_ADDRS = ('127.0.0.1', '::1')
+
+metrics.WAITING_TICKETS.collect = lambda: {(branch_id,): waiting for branch_id, waiting in database.get_branch_waiting().items()}
+
+@app.before_request
+def start_request_metrics():
+    request.metrics_started = time.perf_counter()
+    request.query_stats = query_profiler.start(f"{request.method} {request.path}")
+
+@app.after_request
+def record_request_metrics(response):
+    started = getattr(request, 'metrics_started', None)
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+    stats = request.query_stats
+    metrics.SQLITE_QUERIES_PER_REQUEST.observe(stats.count, route)
+    metrics.SQLITE_SECONDS_PER_REQUEST.observe(stats.seconds, route)
+    query_profiler.finish(stats)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            return jsonify({"success": False, "message": "Unauthorized"}), 401
+    elif request.remote_addr not in LOOPBACK_ADDRS or 'X-Forwarded-For' in request.headers:
+        # A local reverse proxy connects from loopback too: forwarded requests are not local
+        return jsonify({"success": False, "message": "Forbidden"}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/queries')
+@role_required(['system_admin'])
+def debug_queries():
+    """Top SQL statement shapes and recent N+1 patterns (QUERY_PROFILE=1, see query_profiler.py)."""
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    return jsonify(query_profiler.report(limit, request.args.get('order', 'total')))
+
 # Static serving for API-related tools if needed
 # (Catch-all moved to end)
 
@@ -423,7 +711,7 @@ def sync_queue():
                         f"⏳ Taxminiy kutish vaqti: {pos_data['estimated_wait']} daqiqa\n\n"
                         "Sizning navbatingiz yaqinlashganda xabar beramiz."
                     )
-                    bot.send_message(chat_id, msg, parse_mode='HTML')
+                    notifier.send_message(chat_id, msg, parse_mode='HTML')
                 except: pass
             # ---------------------------
 
@@ -432,14 +720,10 @@ def sync_queue():
     return jsonify({"success": False, "message": "Bu vaqt band yoki ma'lumotlar bazasida xatolik"}), 400
 
 @app.route('/api/staff-load', methods=['GET'])
+@etag_from_scopes(lambda: (('all', ''), _today()))
 def get_staff_load():
-    queues = database.get_todays_queues()
-    staff_loads = {}
-    for q in queues.values():
-        if q.get('status') == 'waiting' and q.get('staff_id'):
-            sid = q.get('staff_id')
-            staff_loads[sid] = staff_loads.get(sid, 0) + 1
-    return jsonify({"success": True, "loads": staff_loads})
+    # Waiting tickets per staff member for today, from the daily counters
+    return jsonify({"success": True, "loads": database.get_staff_loads()})
 
 @app.route('/api/verify', methods=['POST'])
 def verify_phone():
@@ -465,12 +749,25 @@ def get_queue_pos(q_id):
         return jsonify({"success": True, "data": pos})
     return jsonify({"success": False, "message": "Queue not found"}), 404
 
+@app.route('/api/board/<string:branch_id>', methods=['GET'])
+def get_branch_board(branch_id):
+    # Same snapshot the displays receive over Socket.IO
+    board = database.board_snapshots.get(branch_id)
+    if board is None:
+        return jsonify({"success": False, "message": "Filial topilmadi"}), 404
+    return jsonify({"success": True, "data": board})
+
 @app.route('/api/branch-wait-times', methods=['GET'])
+@etag_from_scopes(lambda: (('branch', request.args.get('branch_id')), _today()))
 def get_branch_wait_times():
     branch_id = request.args.get('branch_id')
     if not branch_id:
         return jsonify({"success": False, "message": "branch_id required"}), 400
     
+    return jsonify(cached_payload('branch-wait-times', lambda: _branch_wait_times(branch_id),
+                                  tags=[('branch', branch_id)]))
+
+def _branch_wait_times(branch_id):
     conn = database.get_db_connection()
     today = datetime.now().strftime('%Y-%m-%d')
     try:
@@ -486,11 +783,12 @@ def get_branch_wait_times():
                 "people": count,
                 "wait_time": (count + 1) * svc['estimated_duration']
             }
-        return jsonify({"success": True, "wait_times": wait_times})
+        return {"success": True, "wait_times": wait_times}
     finally:
         conn.close()
 
 @app.route('/api/booked-slots', methods=['GET'])
+@etag_from_scopes(lambda: (('branch', request.args.get('branch_id')),))
 def get_booked():
     date = request.args.get('date')
     branch_id = request.args.get('branch_id')
@@ -499,40 +797,59 @@ def get_booked():
     if not date or not branch_id:
         return jsonify({"success": False, "message": "date and branch_id required"}), 400
         
-    slots = database.get_booked_slots(date, branch_id, staff_id)
-    return jsonify({"success": True, "slots": slots})
+    return jsonify(cached_payload(
+        'booked-slots', lambda: {"success": True, "slots": database.get_booked_slots(date, branch_id, staff_id)},
+        tags=[('branch', branch_id)]))
 
 @app.route('/api/branches', methods=['GET'])
 def get_public_branches():
     org_id = request.args.get('org_id')
-    return jsonify({"success": True, "branches": database.get_branches(org_id)})
+    return jsonify(cached_payload('branches', lambda: {"success": True, "branches": database.get_branches(org_id)},
+                                  tags=[('catalog', '')]))
 
 @app.route('/api/admin/queues', methods=['GET'])
 @jwt_required()
 def admin_get_queues():
     claims = get_jwt()
     role = claims.get("role")
-    org_id = claims.get("org_id")
     
-    queues_list = database.get_all_queues_list()
+    # Filter by org_id if not system_admin (system_admin may pass ?org_id=)
+    org_id = request.args.get('org_id') if role == 'system_admin' else claims.get("org_id")
     
-    # Filter by org_id if not system_admin
-    if role != 'system_admin' and org_id:
-        queues_list = [q for q in queues_list if q.get('org_id') == org_id]
+    cursor = None
+    if request.args.get('cursor'):
+        cursor = database.decode_queue_cursor(request.args['cursor'])
+        if not cursor:
+            return jsonify({"success": False, "message": "Invalid cursor"}), 400
     
-    conn = database.get_db_connection()
-    services = conn.execute('SELECT id, name_uz FROM services').fetchall()
-    conn.close()
-    service_map = {s['id']: s['name_uz'] for s in services}
+    entries = database.iter_queues_page(
+        org_id=org_id,
+        status=request.args.get('status'),
+        date_from=request.args.get('from'),
+        date_to=request.args.get('to'),
+        branch_id=request.args.get('branch_id'),
+        service_id=request.args.get('service_id'),
+        cursor=cursor,
+        limit=request.args.get('limit', type=int),
+        encoded=True,
+        oldest_first=request.args.get('order') == 'asc'
+    )
     
-    queues_dict = {}
-    for q in queues_list:
-        q_dict = dict(q)
-        s_id = q_dict.get('service_id')
-        q_dict['service'] = service_map.get(s_id, 'Umumiy')
-        queues_dict[q_dict['id']] = q_dict
-
-    return jsonify({"success": True, "queues": queues_dict})
+    def generate():
+        # Streamed as {"success": true, "queues": {id: queue, ...}, "next_cursor": ...};
+        # SQLite encodes each '"id":{...}' entry itself
+        yield '{"success": true, "queues": {'
+        next_cursor = None
+        first = True
+        for entry in entries:
+            if isinstance(entry, tuple):
+                next_cursor = entry[1]
+                continue
+            yield entry if first else ',' + entry
+            first = False
+        yield '}, "next_cursor": ' + json_codec.dumps(next_cursor) + '}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 @app.route('/api/admin/stats', methods=['GET'])
 @jwt_required()
@@ -543,14 +860,35 @@ def admin_get_stats():
     stats = database.get_admin_stats(org_id)
     return jsonify({"success": True, "stats": stats})
 
+def _analytics_etag_parts():
+    claims = get_jwt()
+    org_id = claims.get("org_id") if claims.get("role") != "system_admin" else None
+    branch_id = request.args.get('branch_id')
+    scope = ('branch', branch_id) if branch_id else (('org', org_id) if org_id else ('all', ''))
+    # Ratings can also arrive from the standalone bot process, which doesn't
+    # bump this process's counters: let the ETag expire every minute as well.
+    return (scope, org_id, _today(), int(time.time() // 60))
+
 @app.route('/api/admin/analytics', methods=['GET'])
 @jwt_required()
+@etag_from_scopes(_analytics_etag_parts)
 def admin_get_analytics():
     claims = get_jwt()
     # Filter by org_id if not system_admin
     org_id = claims.get("org_id") if claims.get("role") != "system_admin" else None
     
-    data = database.get_analytics_data(org_id)
+    # Optional ?from=YYYY-MM-DD&to=YYYY-MM-DD (defaults to today)
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    try:
+        for d in (date_from, date_to):
+            if d: datetime.strptime(d, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({"success": False, "message": "Sana formati: YYYY-MM-DD"}), 400
+    if date_from and date_to and date_from > date_to:
+        date_from, date_to = date_to, date_from
+    
+    data = database.get_analytics_data(org_id, date_from, date_to, request.args.get('branch_id'))
     return jsonify({"success": True, "data": data})
 
 @app.route('/api/admin/call_next', methods=['POST'])
@@ -559,21 +897,15 @@ def admin_call_next():
     claims = get_jwt()
     org_id = claims.get("org_id") if claims.get("role") != "system_admin" else None
     
-    current_queues = database.get_todays_queues(org_id).values() 
-    waiting_list = [q for q in current_queues if q['status'] == 'waiting']
-    waiting_list.sort(key=lambda x: x['created_at']) 
-    
-    if not waiting_list:
+    # Oldest waiting ticket straight from the (org_id, status, created_at) index
+    next_client = database.call_next_in_org(org_id)
+    if not next_client:
         return jsonify({"success": False, "message": "Kutayotganlar yo'q"})
     
-    next_client = waiting_list[0]
-    database.update_queue_status(next_client['id'], 'serving')
-    
-    # Verify the item belongs to the caller's org for security (optional here since filtered above)
     notify_user_call(next_client)
     
     # Emit real-time update
-    socketio.emit('queue_updated', {'type': 'call_next', 'queue_id': next_client['id'], 'org_id': next_client.get('org_id')})
+    publish_queue_event(next_client, {'type': 'call_next'})
     
     return jsonify({"success": True, "queue": database.get_queue(next_client['id'])})
 
@@ -598,7 +930,7 @@ def admin_update_status():
              return jsonify({"success": False, "message": "Sizda bu amal uchun ruxsat yo'q"}), 403
 
         database.update_queue_status(q_id, new_status)
-        socketio.emit('queue_updated', {'type': 'status_change', 'queue_id': q_id, 'status': new_status, 'org_id': q.get('org_id')})
+        publish_queue_event(q, {'type': 'status_change', 'status': new_status})
         return jsonify({"success": True})
     return jsonify({"success": False, "message": "Invalid data"}), 400
 
@@ -616,30 +948,23 @@ def admin_transfer_queue():
     user_org_id = claims.get("org_id")
     user_role = claims.get("role")
     
-    # 1. Verify queue and permission
-    q = database.get_queue(q_id)
-    if not q: return jsonify({"success": False, "message": "Navbat topilmadi"}), 404
-    
-    if user_role != 'system_admin' and str(q.get('org_id')) != str(user_org_id):
-        return jsonify({"success": False, "message": "Ruxsat yo'q"}), 403
+    # 1. Verify queue and permission, then update it on the same connection
+    with database.transaction() as conn:
+        q = database.get_queue(q_id)
+        if not q: return jsonify({"success": False, "message": "Navbat topilmadi"}), 404
         
-    # 2. Update Queue: Status -> waiting, Svc -> new, Staff -> None
-    conn = database.get_db_connection()
-    try:
-        conn.execute('UPDATE queues SET status = "waiting", service_id = ?, staff_id = NULL WHERE id = ?', (new_svc_id, q_id))
-        conn.commit()
-    finally:
-        conn.close()
+        if user_role != 'system_admin' and str(q.get('org_id')) != str(user_org_id):
+            return jsonify({"success": False, "message": "Ruxsat yo'q"}), 403
+            
+        # 2. Update Queue: Status -> waiting, Svc -> new, Staff -> None
+        database.transfer_queue(q_id, new_svc_id)
+        svc = conn.execute('SELECT name_uz FROM services WHERE id = ?', (new_svc_id,)).fetchone()
         
     # 3. Notify user via Telegram
     try:
         phone = database.normalize_phone(q.get('phone', ''))
         user = database.get_user(phone)
         if user and user.get('user_id'):
-            # Fetch service name for nice message
-            conn = database.get_db_connection()
-            svc = conn.execute('SELECT name_uz FROM services WHERE id = ?', (new_svc_id,)).fetchone()
-            conn.close()
             svc_name = svc['name_uz'] if svc else "yangi bo'lim"
             
             msg = (
@@ -648,10 +973,10 @@ def admin_transfer_queue():
                 f"Raqamingiz: <b>{q['number']}</b>\n"
                 f"Iltimos, navbat kuting."
             )
-            bot.send_message(user['user_id'], msg, parse_mode='HTML')
+            notifier.send_message(user['user_id'], msg, parse_mode='HTML')
     except Exception as e: print(f"Transfer notify error: {e}")
     
-    socketio.emit('queue_updated', {'type': 'transfer', 'queue_id': q_id, 'new_service': new_svc_id, 'org_id': q.get('org_id')})
+    publish_queue_event(q, {'type': 'transfer', 'new_service': new_svc_id})
     return jsonify({"success": True})
 
 # --- Org Admin Settings API ---
@@ -708,12 +1033,19 @@ def login():
     
     if not phone or not password:
         return jsonify({"success": False, "message": "Phone and Password required"}), 400
+    throttled = login_throttled(phone)
+    if throttled:
+        return throttled
         
     user = database.get_user(phone)
     if not user:
         return jsonify({"success": False, "message": "User not found"}), 401
         
-    if bcrypt.check_password_hash(user['password_hash'], password):
+    matches = password_matches(user['password_hash'], password)
+    if matches is None:
+        return server_busy()
+    if matches:
+        login_guard.forgive(phone)
         # Create JWT token
         role = user.get('role', 'staff')
         access_token = create_access_token(identity=user['user_id'], additional_claims={
@@ -737,6 +1069,7 @@ def login():
 
 @app.route('/api/staff/queues', methods=['GET'])
 @jwt_required()
+@etag_from_scopes(lambda: (('branch', get_jwt().get('branch_id')),))
 def get_staff_queues():
     claims = get_jwt()
     branch_id = claims.get("branch_id")
@@ -767,31 +1100,16 @@ def staff_call_next():
     claims = get_jwt()
     branch_id = claims.get("branch_id")
     
-    conn = database.get_db_connection()
-    # Find oldest waiting
-    queue = conn.execute('''
-        SELECT * FROM queues 
-        WHERE branch_id = ? AND status = 'waiting'
-        ORDER BY created_at ASC LIMIT 1
-    ''', (branch_id,)).fetchone()
+    # Find oldest waiting and mark it called
+    q_dict = database.call_next_in_branch(branch_id)
     
-    if queue:
-        # Update status
-        now_iso = datetime.now().isoformat()
-        conn.execute("UPDATE queues SET status = 'called', called_at = ? WHERE id = ?", (now_iso, queue['id']))
-        conn.commit()
-        
+    if q_dict:
         # Notify
-        socketio.emit('queue_update', {'org_id': queue['org_id']}, to=queue['org_id'])
-        
-        q_dict = dict(queue)
-        q_dict['status'] = 'called'
+        publish_queue_event(q_dict, {'type': 'call_next'})
         notify_user_call(q_dict)
 
-        conn.close()
         return jsonify({"success": True, "queue": q_dict})
     
-    conn.close()
     return jsonify({"success": False, "message": "Navbat yo'q"}), 404
 
 @app.route('/api/staff/complete', methods=['POST'])
@@ -811,16 +1129,11 @@ def staff_complete():
         if user and user.get('user_id'):
             chat_id = user['user_id']
             try:
-                # Send feedback request
-                markup = telebot.types.InlineKeyboardMarkup()
-                markup.row(
-                   telebot.types.InlineKeyboardButton("⭐️ 1", callback_data=f"rate_{q_id}_1"),
-                   telebot.types.InlineKeyboardButton("⭐️ 2", callback_data=f"rate_{q_id}_2"),
-                   telebot.types.InlineKeyboardButton("⭐️ 3", callback_data=f"rate_{q_id}_3"),
-                   telebot.types.InlineKeyboardButton("⭐️ 4", callback_data=f"rate_{q_id}_4"),
-                   telebot.types.InlineKeyboardButton("⭐️ 5", callback_data=f"rate_{q_id}_5")
-                )
-                bot.send_message(chat_id, "✅ Xizmat yakunlandi! Iltimos, xizmat ko'rsatish sifatini baholang:", reply_markup=markup)
+                # Send feedback request (Bot API inline keyboard JSON, queued in the outbox)
+                markup = {"inline_keyboard": [[
+                    {"text": f"⭐️ {i}", "callback_data": f"rate_{q_id}_{i}"} for i in range(1, 6)
+                ]]}
+                notifier.send_message(chat_id, "✅ Xizmat yakunlandi! Iltimos, xizmat ko'rsatish sifatini baholang:", reply_markup=markup)
             except Exception as e:
                 print(f"Error sending feedback request: {e}")
 
@@ -859,45 +1172,37 @@ def get_ratings():
 def staff_no_show():
     data = request.json
     q_id = data.get('queue_id')
-    conn = database.get_db_connection()
-    now_iso = datetime.now().isoformat()
-    conn.execute("UPDATE queues SET status = 'no-show', completed_at = ? WHERE id = ?", (now_iso, q_id))
-    conn.commit()
-    conn.close()
+    database.update_queue_status(q_id, 'no-show')
     return jsonify({"success": True})
 
 def notify_user_call(queue_item):
     try:
         phone = database.normalize_phone(queue_item.get('phone', ''))
         user = database.get_user(phone)
+        msg = (
+            f"🎉 <b>Diqqat! Navbatingiz yetib keldi!</b>\n\n"
+            f"Raqamingiz: <b>{queue_item['number']}</b>\n"
+            f"Iltimos, operator oldiga boring."
+        )
         if user and user.get('user_id'):
-            msg = (
-                f"🎉 <b>Diqqat! Navbatingiz yetib keldi!</b>\n\n"
-                f"Raqamingiz: <b>{queue_item['number']}</b>\n"
-                f"Iltimos, operator oldiga boring."
-            )
-            bot.send_message(user['user_id'], msg, parse_mode='HTML')
+            notifier.send_message(user['user_id'], msg, parse_mode='HTML')
         else:
-            # Fallback: Check JSON if not in DB
-            if os.path.exists(DATA_FILE):
-                with open(DATA_FILE, 'r') as f:
-                    ver_data = json.load(f)
-                    # Try to find by phone
-                    for key, val in ver_data.items():
-                         if val.get('phone') == phone or key == phone:
-                             bot.send_message(val['user_id'], msg, parse_mode='HTML')
-                             break
+            # Fallback: a login session that shared this phone
+            ver = database.find_verification_by_phone(phone)
+            if ver and ver.get('user_id'):
+                notifier.send_message(ver['user_id'], msg, parse_mode='HTML')
     except Exception as e:
         print(f"❌ Notification error: {e}")
 
+def _fetch_bot_info():
+    with metrics.outbound('telegram'):
+        return {"success": True, "username": get_bot().get_me().username}
+
 @app.route('/api/config/bot', methods=['GET'])
 def get_bot_info():
     try:
-        bot_info = bot.get_me()
-        return jsonify({
-            "success": True, 
-            "username": bot_info.username
-        })
+        # One Telegram round trip per BOT_INFO_TTL instead of one per page load
+        return jsonify(cached_payload('bot-info', _fetch_bot_info, ttl=BOT_INFO_TTL))
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
@@ -918,22 +1223,17 @@ def send_verification_code():
     if user and user.get('user_id'):
         chat_id = user['user_id']
         
-    # Check JSON
-    if not chat_id and os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r') as f:
-                ver_data = json.load(f)
-                if uid and f"uid_{uid}" in ver_data:
-                    chat_id = ver_data[f"uid_{uid}"].get('user_id')
-                elif phone_norm in ver_data:
-                    chat_id = ver_data[phone_norm].get('user_id')
-        except: pass
+    # Check verification sessions
+    if not chat_id:
+        ver = (database.get_verification_by_uid(uid) if uid else None) or database.find_verification_by_phone(phone_norm)
+        if ver:
+            chat_id = ver.get('user_id')
 
     if chat_id:
         import random
         code = str(random.randint(1000, 9999))
         try:
-            bot.send_message(chat_id, f"🔐 Kirish kodi: {code}")
+            notifier.send_message(chat_id, f"🔐 Kirish kodi: {code}")
             return jsonify({"success": True, "message": "Kod yuborildi", "code": code}) 
         except: pass
     
@@ -982,7 +1282,7 @@ def transfer_patient():
     if database.add_queue(new_queue_data):
         # 3. Mark current queue as "transferred" or just completed
         database.update_queue_status(current_queue_id, 'completed') 
-        socketio.emit('queue_update', {'org_id': current_q['org_id']}, to=current_q['org_id'])
+        publish_queue_event(current_q, {'type': 'transfer', 'new_service': new_service_id})
         return jsonify({"success": True, "message": "Bemor muvaffaqiyatli o'tkazildi"})
     
     return jsonify({"success": False, "message": "Error creating transfer queue"}), 500
@@ -1025,29 +1325,25 @@ def check_auth_status():
     uid = data.get('uid')
     phone = data.get('phone')
     
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r') as f:
-                ver_data = json.load(f)
-                
-                # Check UID
-                if uid and f"uid_{uid}" in ver_data:
-                    return jsonify({"success": True, "found": True, "data": ver_data[f"uid_{uid}"]})
-                
-                # Check Phone
-                if phone:
-                    phone_key = database.normalize_phone(phone)
-                    for key, val in ver_data.items():
-                        if key == phone or key == phone_key or (isinstance(val, dict) and val.get('phone') == phone_key):
-                             # SYNC TO DB: Important!
-                             if val.get('user_id'):
-                                 database.add_user(phone, val['user_id'], val.get('username', 'user'))
-                             
-                             return jsonify({"success": True, "found": True, "data": val})
-
-        except:
-            pass
-            
+    try:
+        # Check UID
+        if uid:
+            val = database.get_verification_by_uid(uid)
+            if val:
+                return jsonify({"success": True, "found": True, "data": val})
+
+        # Check Phone
+        if phone:
+            val = database.find_verification_by_phone(phone)
+            if val:
+                # SYNC TO DB: Important!
+                if val.get('user_id'):
+                    database.add_user(phone, val['user_id'], val.get('username', 'user'))
+
+                return jsonify({"success": True, "found": True, "data": val})
+    except Exception as e:
+        print(f"Check status error: {e}")
+
     return jsonify({"success": True, "found": False})
 
 @app.route('/api/chat', methods=['POST'])
@@ -1074,10 +1370,11 @@ def chat_ai():
         # Management of AI History per User (Phone based)
         chat_id = phone or "guest"
         if chat_id not in chat_sessions:
-            chat_sessions[chat_id] = model.start_chat(history=[])
+            chat_sessions[chat_id] = get_model().start_chat(history=[])
         
         chat = chat_sessions[chat_id]
-        response = chat.send_message(f"System Context: {context}\n\nUser Question: {user_message}")
+        with metrics.outbound('gemini'):
+            response = chat.send_message(f"System Context: {context}\n\nUser Question: {user_message}")
         
         return jsonify({"response": response.text})
     except Exception as e:
@@ -1147,61 +1444,88 @@ def init_admin_page():
 # --- Catch-all for Static Assets (Must be last) ---
 @app.route('/<path:path>')
 def serve_static(path):
-    return send_from_directory(app.static_folder, path)
+    return static_assets.send_asset(path)
+
+REMINDER_MESSAGES = {
+    1: "⏳ 1 soat qoldi. Raqam: {number}",
+    2: "⏱ 30 daqiqa qoldi!",
+    3: "🚨 10 daqiqa qoldi! Shoshiling.",
+}
+
+def send_reminder(q_id, level):
+    # Level update and outbox row commit together, so a reminder is queued once
+    with database.transaction():
+        target = database.get_reminder_target(q_id)
+        if not target or target['status'] != 'waiting' or not target.get('chat_id'):
+            return
+        if database.update_notification_level(q_id, level):
+            notifier.send_message(target['chat_id'], REMINDER_MESSAGES[level].format(number=target['number']))
 
 def notification_scheduler():
+    # Sleeps until the next reminder deadline (at most a minute) and only
+    # touches the reminders that are due; bookings update the heap directly.
     while True:
+        elector.wait_until_leader()
         try:
-            queues = database.get_todays_queues()
-            now = datetime.now()
-            for q_id, q in queues.items():
-                if q['status'] != 'waiting' or not q.get('date') or not q.get('time'):
-                    continue
-                
-                user = database.get_user(q['phone'])
-                if not user: continue
-                    
-                appt_dt = datetime.fromisoformat(f"{q['date']}T{q['time']}")
-                minutes_left = (appt_dt - now).total_seconds() / 60
-                
-                level = q.get('notification_level', 0)
-                msg = None
-                
-                if 55 <= minutes_left <= 65 and level < 1:
-                    msg = f"⏳ 1 soat qoldi. Raqam: {q['number']}"
-                    level = 1
-                elif 25 <= minutes_left <= 35 and level < 2:
-                    msg = f"⏱ 30 daqiqa qoldi!"
-                    level = 2
-                elif 5 <= minutes_left <= 15 and level < 3:
-                    msg = f"🚨 10 daqiqa qoldi! Shoshiling."
-                    level = 3
-                
-                if msg:
-                    requests.post(f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage", 
-                                  json={"chat_id": user['user_id'], "text": msg})
-                    database.update_notification_level(q_id, level)
+            with query_profiler.profile('notification_scheduler'):
+                reminders = database.ensure_reminders()
+                for q_id, level in reminders.pop_due():
+                    send_reminder(q_id, level)
+            next_due = reminders.next_due()
+            timeout = 60
+            if next_due is not None:
+                timeout = min(timeout, max(0.0, (next_due - datetime.now()).total_seconds()))
+            metrics.tick('notification_scheduler')
+            reminders.wait(timeout)
         except Exception as e:
             print(f"Scheduler error: {e}")
-        time.sleep(60)
+            time.sleep(60)
 
-# Startup logic
-print("Operator AI System is preparing to run...")
-print(f"Environment Check: BOT_TOKEN={'set' if BOT_TOKEN else 'MISSING'}, GEMINI={'set' if GEMINI_API_KEY else 'MISSING'}")
+COUNTERS_RECONCILE_SECONDS = int(os.getenv("COUNTERS_RECONCILE_SECONDS", "600"))
+
+def counters_reconciler():
+    # Repairs drift from rows written outside database.py (seed scripts, manual SQL)
+    while True:
+        elector.wait_until_leader()
+        try:
+            with query_profiler.profile('counters_reconciler'):
+                database.reconcile_daily_counters(datetime.now().strftime('%Y-%m-%d'))
+            metrics.tick('counters_reconciler')
+        except Exception as e:
+            print(f"Counters reconcile error: {e}")
+        time.sleep(COUNTERS_RECONCILE_SECONDS)
 
-# Start scheduler thread
-try:
-    threading.Thread(target=notification_scheduler, daemon=True).start()
-    print("Notification scheduler thread started.")
-except Exception as e:
-    print(f"[ERROR] Error starting scheduler: {e}")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+
+def archive_worker():
+    # Keeps the live queues table small; history stays readable via queues_all
+    while True:
+        elector.wait_until_leader()
+        try:
+            with query_profiler.profile('archive_worker'):
+                database.archive_finished_queues(ARCHIVE_AFTER_DAYS)
+            metrics.tick('archive_worker')
+        except Exception as e:
+            print(f"Archive error: {e}")
+        time.sleep(3600)
+
+# --- Startup ---
+# Importing this module only defines the app and its routes. create_app()
+# brings the database up to date (a no-op when the schema is current) and
+# ensures the env-configured admin; background services -- reminders,
+# counters, archiving, the Telegram outbox, socket pushers and bot polling --
+# start only when asked for (serve.py does). They all run on native threads
+# (offload.start_thread): under gevent their SQLite calls and waits would
+# otherwise stall the event loop.
 
-# Start Bot Polling thread
 def run_bot_polling():
     while True:
         try:
             if BOT_TOKEN:
+                # getUpdates allows one poller per token: only the leader polls
+                elector.wait_until_leader()
                 print("Bot status: Attempting to connect to Telegram... (Polling)")
+                bot = get_bot()
                 bot.remove_webhook()
                 bot.infinity_polling(timeout=20, long_polling_timeout=20)
             else:
@@ -1211,32 +1535,60 @@ def run_bot_polling():
             print(f"[ERROR] Bot Polling Error (Retrying in 5s): {e}")
             time.sleep(5)
 
-try:
-    print("Attempting to start Bot background service...")
-    bot_thread = threading.Thread(target=run_bot_polling, daemon=True)
-    bot_thread.start()
-    print("Bot background service started (threading).")
-except Exception as e:
-    print(f"[ERROR] Error starting bot polling: {e}")
+_startup_lock = offload.Lock()
+_db_ready = False
+_services_started = False
 
+def start_background_services():
+    global _services_started
+    with _startup_lock:
+        if _services_started:
+            return
+        _services_started = True
 
-if __name__ == '__main__':
+    print("Operator AI System is preparing to run...")
+    print(f"Environment Check: BOT_TOKEN={'set' if BOT_TOKEN else 'MISSING'}, GEMINI={'set' if GEMINI_API_KEY else 'MISSING'}")
+
+    # Start scheduler thread
     try:
-        # Check static folder
-        abs_static = os.path.abspath(app.static_folder)
-        abs_static = os.path.abspath(app.static_folder)
-        print(f"Static folder: {abs_static}")
-        print(f"Folder exists: {os.path.exists(abs_static)}")
-        if os.path.exists(abs_static):
-            print(f"Files in static: {os.listdir(abs_static)[:5]}...")
-            
-        # Use dynamic port for Render
-        port = int(os.environ.get("PORT", 5000))
-        print(f"Running script mode on 0.0.0.0:{port}")
-        
-        # Run with threading
-        socketio.run(app, port=port, host='0.0.0.0', debug=False, use_reloader=False, allow_unsafe_werkzeug=True)
+        elector.start()
+        elector.on_lost(lambda: get_bot().stop_polling())
+        offload.start_thread(notification_scheduler)
+        print("Notification scheduler thread started.")
+        offload.start_thread(counters_reconciler)
+        offload.start_thread(archive_worker)
+        notifier.start(BOT_TOKEN)
+        database.delta_publisher.start(emit_ticket_delta, database.get_line_positions, database.get_queue_position)
+        database.board_snapshots.start(emit_board_snapshot, database.get_branch_board)
     except Exception as e:
-        print(f"CRITICAL CRASH ON STARTUP: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"[ERROR] Error starting scheduler: {e}")
+
+    # Start Bot Polling thread
+    try:
+        print("Attempting to start Bot background service...")
+        offload.start_thread(run_bot_polling)
+        print("Bot background service started (threading).")
+    except Exception as e:
+        print(f"[ERROR] Error starting bot polling: {e}")
+
+def create_app(start_services=False):
+    """Ready the app to serve: migrate the database, ensure the env admin and,
+    with start_services, start the background services. Safe to call twice."""
+    global _db_ready
+    with _startup_lock:
+        if not _db_ready:
+            database.init_db()
+            auto_create_admin()
+            _db_ready = True
+    if start_services:
+        start_background_services()
+    return app
+
+
+if __name__ == '__main__':
+    # The server entry point is serve.py: gevent has to patch the stdlib
+    # before this module is imported, so hand over to a fresh interpreter.
+    import sys
+    print("app.py is not a server entry point; starting serve.py")
+    elector.release()
+    os.execv(sys.executable, [sys.executable, os.path.join(BASE_DIR, 'serve.py')])
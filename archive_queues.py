@@ -0,0 +1,16 @@
+import argparse
+import database
+
+def main():
+    parser = argparse.ArgumentParser(description="Move finished queues into queues_archive in small batches")
+    parser.add_argument("--older-than-days", type=int, default=90)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between batches")
+    args = parser.parse_args()
+
+    database.init_db()
+    moved = database.archive_finished_queues(args.older_than_days, args.batch_size, args.pause)
+    print(f"✅ {moved} ta navbat arxivlandi")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import argparse
+import database
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild hourly/daily analytics rollups from the queues table")
+    parser.add_argument("--from", dest="date_from", help="YYYY-MM-DD (default: beginning of history)")
+    parser.add_argument("--to", dest="date_to", help="YYYY-MM-DD (default: end of history)")
+    args = parser.parse_args()
+
+    database.init_db()
+    rows = database.backfill_analytics_rollups(args.date_from, args.date_to)
+    print(f"✅ Analytics rollups rebuilt: {rows} hourly rows ({args.date_from or 'start'} .. {args.date_to or 'end'})")
+
+if __name__ == "__main__":
+    main()
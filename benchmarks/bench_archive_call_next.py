@@ -0,0 +1,103 @@
+"""call-next latency as finished history grows, before and after archiving.
+
+For each history size a fresh database gets that many finished tickets
+(older than the archive cutoff) plus a live waiting line, then
+database.call_next_in_branch() is timed with the history in the hot table
+and again after archive_finished_queues() has moved it out.
+
+    python benchmarks/bench_archive_call_next.py --sizes 10000 100000 1000000 5000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import database
+
+def fill_history(conn, n, branch_ids, service_ids, rng):
+    start = datetime.now() - timedelta(days=400)
+    batch = []
+    for i in range(n):
+        created = start + timedelta(seconds=i * 5)
+        batch.append((
+            f"h{i}", f"+99890{i % 10000000:07d}", f"A-{i % 1000:03d}",
+            rng.choice(('completed', 'completed', 'completed', 'no-show', 'cancelled')),
+            created.strftime('%Y-%m-%d'), created.strftime('%H:%M'),
+            rng.choice(service_ids), rng.choice(branch_ids), "org_bench",
+            created.isoformat(), (created + timedelta(minutes=20)).isoformat()
+        ))
+        if len(batch) == 50000:
+            conn.executemany('''
+                INSERT INTO queues (id, phone, number, status, date, time, service_id, branch_id, org_id, created_at, completed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+            conn.commit()
+            batch = []
+    if batch:
+        conn.executemany('''
+            INSERT INTO queues (id, phone, number, status, date, time, service_id, branch_id, org_id, created_at, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', batch)
+        conn.commit()
+
+def fill_waiting(conn, n, branch_id, service_ids, tag):
+    now = datetime.now()
+    conn.executemany('''
+        INSERT INTO queues (id, phone, number, status, date, service_id, branch_id, org_id, created_at)
+        VALUES (?, ?, ?, 'waiting', ?, ?, ?, 'org_bench', ?)
+    ''', [(f"w{tag}{i}", f"+99891{i:07d}", f"B-{i:03d}", now.strftime('%Y-%m-%d'),
+           service_ids[i % len(service_ids)], branch_id, (now + timedelta(seconds=i)).isoformat()) for i in range(n)])
+    conn.commit()
+
+def time_call_next(branch_id, calls):
+    samples = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        database.call_next_in_branch(branch_id)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+def run(size, calls, rng):
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(prefix="bench_arch_"), "bench.db")
+    database.close_all_connections()
+    database.init_db()
+    conn = database.get_db_connection()
+    branch_ids = [f"br{i}" for i in range(10)]
+    service_ids = [f"svc{i}" for i in range(40)]
+
+    fill_history(conn, size, branch_ids, service_ids, rng)
+    fill_waiting(conn, calls, branch_ids[0], service_ids, "a")
+    hot = time_call_next(branch_ids[0], calls)
+
+    started = time.perf_counter()
+    database.archive_finished_queues(older_than_days=30, batch_size=5000, pause=0)
+    archive_secs = time.perf_counter() - started
+    fill_waiting(conn, calls, branch_ids[0], service_ids, "b")
+    cold = time_call_next(branch_ids[0], calls)
+
+    live = conn.execute('SELECT COUNT(*) FROM queues').fetchone()[0]
+    print(f"{size:>10,} | {hot[0]:7.3f} / {hot[1]:7.3f} | {cold[0]:7.3f} / {cold[1]:7.3f} | {live:>9,} | {archive_secs:7.1f}s")
+    database.close_all_connections()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print("   history | call-next ms p50 / p95 (hot) | after archive p50 / p95 | live rows | archive time")
+    for size in args.sizes:
+        run(size, args.calls, rng)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Cold start of app.py: import time and create_app().
+
+Runs `python -X importtime -c "import app"` in fresh interpreters (after one
+warm-up run so bytecode caches exist), reports the best total and the
+heaviest top-level imports, then times create_app() against a new database
+(migrations run) and against an up-to-date one (migrations skipped). Exits
+with status 1 when the import exceeds --max-import-ms or pulls in one of the
+SDKs that must stay lazy, so it can guard against regressions in CI.
+
+    python benchmarks/bench_cold_start.py --max-import-ms 900
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported on first use only (see app.get_model / app.get_bot)
+LAZY_MODULES = ("google.generativeai", "telebot")
+
+CREATE_APP = """
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+print(f"{(imported - started) * 1000:.1f} {(time.perf_counter() - imported) * 1000:.1f}")
+"""
+
+def run(env, *args):
+    return subprocess.run([sys.executable, *args], cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True)
+
+def importtime(env):
+    """{module: (self_us, cumulative_us, depth)} for one `import app`."""
+    stderr = run(env, "-X", "importtime", "-c", "import app").stderr
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-import-ms", type=float, default=900)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_cold_start_")
+    env = dict(os.environ, DB_NAME=os.path.join(work, "bench.db"), JWT_SECRET_KEY="k" * 32,
+               BOT_TOKEN="", GEMINI_API_KEY="", ADMIN_PHONE="", ADMIN_PASS="")
+    run(env, "-c", "import app")   # warm-up: bytecode caches
+
+    runs = [importtime(env) for _ in range(args.repeat)]
+    best = min(runs, key=lambda modules: modules["app"][1])
+    total_ms = best["app"][1] / 1000
+    print(f"import app: {total_ms:.0f} ms (best of {args.repeat})")
+    top_level = sorted(((cum, name) for name, (_, cum, depth) in best.items() if depth == 1), reverse=True)
+    for cumulative_us, name in top_level[:args.top]:
+        print(f"  {name:<32}{cumulative_us / 1000:>8.1f} ms")
+
+    fresh = run(env, "-c", CREATE_APP).stdout.split()
+    current = run(env, "-c", CREATE_APP).stdout.split()
+    print(f"create_app(), new database:     {float(fresh[-1]):>8.1f} ms")
+    print(f"create_app(), schema current:   {float(current[-1]):>8.1f} ms")
+
+    failures = []
+    if total_ms > args.max_import_ms:
+        failures.append(f"import app took {total_ms:.0f} ms (limit {args.max_import_ms:.0f} ms)")
+    for module in LAZY_MODULES:
+        if module in best:
+            failures.append(f"{module} is imported at startup")
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
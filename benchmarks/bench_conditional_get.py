@@ -0,0 +1,74 @@
+"""Polled endpoints: full response vs 304 Not Modified from scope ETags.
+
+Seeds one branch with --tickets active tickets, then requests each polled
+endpoint --requests times through the Flask test client, once without and
+once with If-None-Match, and reports per-request latency.
+
+    python benchmarks/bench_conditional_get.py --tickets 2000 --requests 300
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+def seed(database, tickets):
+    today = datetime.now().strftime('%Y-%m-%d')
+    with database.transaction():
+        org_id = database.add_organization("Bench Org")
+        branch_id = database.add_branch(org_id, "Branch", "Street")
+        services = [database.add_service(org_id, branch_id, f"Svc {s}", 15) for s in range(6)]
+        for t in range(tickets):
+            database.add_queue({
+                "id": str(uuid.uuid4()), "phone": f"+998{t:09d}", "number": f"A-{t:05d}", "date": today,
+                "serviceId": services[t % len(services)], "branchId": branch_id, "org_id": org_id,
+                "staffId": f"doc{t % 10}", "time": f"{8 + t % 10:02d}:{t % 60:02d}"
+            })
+    return org_id, branch_id, today
+
+def timed(client, url, headers, requests):
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(url, headers=headers)
+    return (time.perf_counter() - started) / requests * 1000, response
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="bench_etag_"), "bench.db")
+    import database
+    database.init_db()
+    org_id, branch_id, today = seed(database, args.tickets)
+
+    import app as server
+    from flask_jwt_extended import create_access_token
+    with server.app.app_context():
+        token = create_access_token("bench", additional_claims={"role": "staff", "org_id": org_id, "branch_id": branch_id})
+    auth = {"Authorization": f"Bearer {token}"}
+    endpoints = [
+        ("/api/staff/queues", auth),
+        ("/api/admin/analytics", auth),
+        (f"/api/branch-wait-times?branch_id={branch_id}", {}),
+        ("/api/staff-load", {}),
+        (f"/api/booked-slots?date={today}&branch_id={branch_id}", {}),
+    ]
+
+    client = server.app.test_client()
+    print(f"{'endpoint':<28}{'200 ms':>10}{'304 ms':>10}{'speedup':>10}")
+    for url, headers in endpoints:
+        full_ms, response = timed(client, url, headers, args.requests)
+        etag = response.headers["ETag"]
+        cond_ms, response = timed(client, url, dict(headers, **{"If-None-Match": etag}), args.requests)
+        assert response.status_code == 304, (url, response.status_code)
+        print(f"{url.split('?')[0]:<28}{full_ms:>10.3f}{cond_ms:>10.3f}{full_ms / cond_ms:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
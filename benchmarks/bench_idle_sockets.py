@@ -0,0 +1,219 @@
+"""Idle Socket.IO connections held by one server process.
+
+Seeds --sockets tickets, starts serve.py in a subprocess and opens one
+WebSocket tracker connection per ticket (raw Engine.IO v4 over asyncio, no
+client library), then holds them for --hold seconds answering the server's
+pings. While holding it samples the server's RSS, OS thread count and the
+latency of GET /ping, so the gevent and threading modes can be compared.
+
+    python benchmarks/bench_idle_sockets.py --sockets 10000 --hold 40
+    python benchmarks/bench_idle_sockets.py --sockets 500 --mode threading
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+def seed(database, count):
+    today = datetime.now().strftime('%Y-%m-%d')
+    tickets = []
+    with database.transaction():
+        org_id = database.add_organization("Bench Org")
+        branch_id = database.add_branch(org_id, "Branch", "Street")
+        service_id = database.add_service(org_id, branch_id, "Svc", 15)
+        for t in range(count):
+            q_id = str(uuid.uuid4())
+            database.add_queue({
+                "id": q_id, "phone": f"+998{t:09d}", "number": f"A-{t:05d}", "date": today,
+                "serviceId": service_id, "branchId": branch_id, "org_id": org_id
+            })
+            tickets.append(q_id)
+    return tickets
+
+# --- Minimal WebSocket / Engine.IO client ---
+
+def ws_frame(text, opcode=0x1):
+    payload = text.encode() if isinstance(text, str) else text
+    mask = os.urandom(4)
+    n = len(payload)
+    if n < 126:
+        header = struct.pack('!BB', 0x80 | opcode, 0x80 | n)
+    elif n < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, n)
+    return header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+async def ws_read(reader):
+    b1, b2 = await reader.readexactly(2)
+    n = b2 & 0x7F
+    if n == 126:
+        n = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif n == 127:
+        n = struct.unpack('!Q', await reader.readexactly(8))[0]
+    return b1 & 0x0F, await reader.readexactly(n)
+
+class Tracker:
+    def __init__(self, port, ticket, stats):
+        self.port = port
+        self.ticket = ticket
+        self.stats = stats
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((
+            "GET /socket.io/?EIO=4&transport=websocket HTTP/1.1\r\n"
+            f"Host: 127.0.0.1:{self.port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        status = await reader.readuntil(b"\r\n\r\n")
+        if b" 101 " not in status.split(b"\r\n", 1)[0]:
+            raise ConnectionError(status.split(b"\r\n", 1)[0].decode())
+        opcode, packet = await ws_read(reader)          # Engine.IO open: 0{...}
+        writer.write(ws_frame("40" + json.dumps({"ticket": self.ticket})))
+        while True:
+            opcode, packet = await ws_read(reader)
+            if packet.startswith(b"40"):
+                break
+            if packet.startswith(b"44"):
+                raise ConnectionError(packet.decode())
+        self.reader, self.writer = reader, writer
+
+    async def hold(self):
+        try:
+            while True:
+                opcode, packet = await ws_read(self.reader)
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    self.writer.write(ws_frame(packet, opcode=0xA))
+                elif packet == b"2":
+                    self.stats['pings'] += 1
+                    self.writer.write(ws_frame("3"))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        self.stats['dropped'] += 1
+
+# --- Server probes ---
+
+def proc_stats(pid):
+    stats = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "Threads:")):
+                key, value = line.split(":", 1)
+                stats[key] = int(value.split()[0])
+    stats["fds"] = len(os.listdir(f"/proc/{pid}/fd"))
+    return stats
+
+def ping(port):
+    started = time.perf_counter()
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/ping", timeout=10) as res:
+        res.read()
+    return (time.perf_counter() - started) * 1000
+
+async def run(args, tickets, server):
+    stats = {'pings': 0, 'dropped': 0}
+    gate = asyncio.Semaphore(args.concurrency)
+    trackers, failures = [], []
+
+    async def open_one(ticket):
+        async with gate:
+            tracker = Tracker(args.port, ticket, stats)
+            try:
+                await tracker.connect()
+                trackers.append(tracker)
+            except Exception as e:
+                failures.append(repr(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(open_one(t) for t in tickets))
+    connect_secs = time.perf_counter() - started
+    holders = [asyncio.ensure_future(t.hold()) for t in trackers]
+
+    loop = asyncio.get_running_loop()
+    samples, latencies = [], []
+    deadline = time.monotonic() + args.hold
+    while time.monotonic() < deadline:
+        samples.append(proc_stats(server.pid))
+        latencies.append(await loop.run_in_executor(None, ping, args.port))
+        await asyncio.sleep(1)
+
+    for h in holders:
+        h.cancel()
+    for t in trackers:
+        t.writer.close()
+    return connect_secs, len(trackers), failures, stats, samples, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sockets", type=int, default=10000)
+    parser.add_argument("--hold", type=int, default=40, help="seconds; >25 covers one Engine.IO ping")
+    parser.add_argument("--mode", choices=("gevent", "threading"), default="gevent")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--concurrency", type=int, default=200, help="handshakes in flight")
+    args = parser.parse_args()
+
+    # The server holds about two descriptors per WebSocket; the limit is inherited
+    needed = args.sockets * 2 + 1000
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (max(hard, needed), max(hard, needed)))
+    except (ValueError, OSError):
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        if hard < needed:
+            print(f"Warning: open file limit {hard} is too low for {args.sockets} sockets (need ~{needed})")
+
+    workdir = tempfile.mkdtemp(prefix="bench_idle_")
+    os.environ["DB_NAME"] = os.path.join(workdir, "bench.db")
+    import database
+    database.init_db()
+    tickets = seed(database, args.sockets)
+
+    env = dict(os.environ, PORT=str(args.port), SERVER_MODE=args.mode)
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log:
+        server = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "serve.py")],
+                                  env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        for _ in range(100):
+            try:
+                ping(args.port)
+                break
+            except OSError:
+                time.sleep(0.2)
+        else:
+            sys.exit(f"Server did not start, see {log_path}")
+        baseline = proc_stats(server.pid)
+        connect_secs, connected, failures, stats, samples, latencies = asyncio.run(run(args, tickets, server))
+    finally:
+        server.terminate()
+        server.wait()
+
+    peak_rss = max(s["VmRSS"] for s in samples) / 1024
+    peak_threads = max(s["Threads"] for s in samples)
+    print(f"Mode: {args.mode}")
+    print(f"Connected {connected}/{args.sockets} sockets in {connect_secs:.1f}s "
+          f"({len(failures)} failed{': ' + failures[0] if failures else ''})")
+    print(f"Held {args.hold}s: {stats['pings']} Engine.IO pings answered, {stats['dropped']} dropped")
+    print(f"Server RSS {baseline['VmRSS'] / 1024:.0f} MB idle -> {peak_rss:.0f} MB peak "
+          f"({(peak_rss - baseline['VmRSS'] / 1024) * 1024 / max(connected, 1):.1f} KB/socket); "
+          f"OS threads {baseline['Threads']} -> {peak_threads}; fds {max(s['fds'] for s in samples)}")
+    print(f"GET /ping while holding: p50 {statistics.median(latencies):.1f} ms, max {max(latencies):.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Admin queue listing: JSON encoding time and bytes on the wire.
+
+Seeds --rows queue rows, then
+  1. encodes all of them page by page (database.iter_queues_page) three ways:
+     dict rows through the stdlib json module (the previous code path), dict
+     rows through json_codec (orjson when installed) and SQLite's own
+     json_object (encoded=True, what /api/admin/queues streams);
+  2. fetches every page of /api/admin/queues through the Flask test client
+     with and without Accept-Encoding: gzip and reports body bytes and time.
+
+    python benchmarks/bench_json_listing.py --rows 10000
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+def seed(database, rows):
+    start = datetime.now() - timedelta(days=30)
+    with database.transaction():
+        org_id = database.add_organization("Bench Org")
+        branch_id = database.add_branch(org_id, "Branch", "Street")
+        services = [database.add_service(org_id, branch_id, f"Xizmat {s}", 15) for s in range(6)]
+        for r in range(rows):
+            database.add_queue({
+                "id": str(uuid.uuid4()), "phone": f"+998{r:09d}", "number": f"A-{r:05d}",
+                "date": (start + timedelta(days=r % 30)).strftime('%Y-%m-%d'),
+                "serviceId": services[r % len(services)], "branchId": branch_id, "org_id": org_id,
+                "staffId": f"doc{r % 10}", "time": f"{8 + (r // 30) // 60:02d}:{(r // 30) % 60:02d}"
+            })
+    return org_id
+
+def encode_all(database, org_id, encode_row, encoded=False):
+    """Full listing body, page by page. Returns (seconds, bytes)."""
+    started = time.perf_counter()
+    size, cursor = 0, None
+    while True:
+        parts = []
+        for row in database.iter_queues_page(org_id=org_id, cursor=cursor, limit=database.QUEUE_PAGE_MAX,
+                                             encoded=encoded):
+            if isinstance(row, tuple):
+                cursor = row[1]
+            else:
+                parts.append(encode_row(row))
+        size += len(','.join(parts).encode('utf-8'))
+        if cursor is None:
+            return time.perf_counter() - started, size
+        cursor = database.decode_queue_cursor(cursor)
+
+def fetch_all(client, headers):
+    started = time.perf_counter()
+    size, pages, cursor = 0, 0, None
+    while True:
+        response = client.get("/api/admin/queues?limit=1000" + (f"&cursor={cursor}" if cursor else ""), headers=headers)
+        body = response.get_data()
+        size += len(body)
+        pages += 1
+        if response.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        cursor = json.loads(body)["next_cursor"]
+        if not cursor:
+            return time.perf_counter() - started, size, pages
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="bench_json_"), "bench.db")
+    import database
+    import json_codec
+    database.init_db()
+    org_id = seed(database, args.rows)
+
+    print(f"Encoding {args.rows} rows ({'orjson' if json_codec.orjson else 'stdlib fallback'} available)")
+    for label, encode_row, encoded in (
+        ("dict + json.dumps", lambda row: json.dumps(row['id']) + ':' + json.dumps(row), False),
+        ("dict + json_codec", lambda row: json_codec.dumps(row['id']) + ':' + json_codec.dumps(row), False),
+        ("SQLite json_object", lambda entry: entry, True),
+    ):
+        seconds, size = encode_all(database, org_id, encode_row, encoded)
+        print(f"  {label:<22}{seconds * 1000:>9.1f} ms{size / 1024:>10.0f} KB")
+
+    import app as server
+    from flask_jwt_extended import create_access_token
+    with server.app.app_context():
+        token = create_access_token("bench", additional_claims={"role": "admin", "org_id": org_id})
+    auth = {"Authorization": f"Bearer {token}"}
+    client = server.app.test_client()
+    print("GET /api/admin/queues, all pages")
+    for label, headers in (("identity", auth), ("gzip", dict(auth, **{"Accept-Encoding": "gzip"}))):
+        seconds, size, pages = fetch_all(client, headers)
+        print(f"  {label:<22}{seconds * 1000:>9.1f} ms{size / 1024:>10.0f} KB  ({pages} pages)")
+
+if __name__ == "__main__":
+    main()
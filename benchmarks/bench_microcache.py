@@ -0,0 +1,68 @@
+"""Public hot endpoints with and without the response micro-cache.
+
+Seeds one branch with --tickets active tickets, then --threads threads each
+request the patient-page endpoints --requests times through the Flask test
+client, once with the cache effectively off (TTL 0: concurrent identical
+requests still share one computation) and once with the default TTL. Prints
+throughput and the cache counters.
+
+    python benchmarks/bench_microcache.py --tickets 2000 --threads 16 --requests 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_conditional_get import seed
+
+def run(client, urls, threads, requests):
+    def worker():
+        for i in range(requests):
+            response = client.get(urls[i % len(urls)])
+            assert response.status_code == 200, response.status_code
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return threads * requests / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="bench_microcache_"), "bench.db")
+    import database
+    database.init_db()
+    org_id, branch_id, today = seed(database, args.tickets)
+
+    import app as server
+    cache = database.response_cache
+    urls = [
+        "/api/branches",
+        f"/api/branch-wait-times?branch_id={branch_id}",
+        f"/api/booked-slots?date={today}&branch_id={branch_id}",
+    ]
+    client = server.app.test_client()
+    default_ttl = cache.ttl
+    for label, ttl in (("ttl=0 (single flight only)", 0), (f"ttl={default_ttl:g}s", default_ttl)):
+        cache.ttl = ttl
+        cache.clear()
+        before = cache.stats()
+        rps = run(client, urls, args.threads, args.requests)
+        after = cache.stats()
+        counters = {k: after[k] - before[k] for k in ("hits", "misses", "coalesced")}
+        print(f"{label:<28}{rps:>10.0f} req/s  {counters}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Queue position index vs COUNT(*): consistency check and lookup timing.
+
+Seeds waiting tickets across several services of one branch, replays random
+call-next / complete / transfer / cancel / new-booking transitions through
+database.py, then checks every waiting ticket against the SQL answer and
+times both lookups.
+
+    python benchmarks/bench_queue_index.py --waiting 2000 --transitions 3000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+def sql_people_ahead(conn, q_id):
+    target = conn.execute('SELECT service_id, branch_id, created_at FROM queues WHERE id = ?', (q_id,)).fetchone()
+    return conn.execute('''
+        SELECT COUNT(*) FROM queues
+        WHERE service_id = ? AND branch_id = ? AND status = "waiting" AND created_at < ?
+    ''', (target['service_id'], target['branch_id'], target['created_at'])).fetchone()[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--waiting", type=int, default=2000)
+    parser.add_argument("--services", type=int, default=8)
+    parser.add_argument("--transitions", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="bench_qidx_"), "bench.db")
+    import database
+    rng = random.Random(args.seed)
+
+    database.init_db()
+    org_id = database.add_organization("Bench Clinic")
+    branch_id = database.add_branch(org_id, "Main", "Bench street 1")
+    services = [database.add_service(org_id, branch_id, f"Xona {i}", rng.choice([10, 15, 20])) for i in range(args.services)]
+    clock = datetime.now() - timedelta(hours=6)
+
+    def book():
+        nonlocal clock
+        clock += timedelta(milliseconds=rng.randint(0, 2000))  # ties are allowed on purpose
+        q_id = str(uuid.uuid4())
+        database.add_queue({
+            "id": q_id, "phone": f"+99890{rng.randint(0, 9999999):07d}", "number": "A",
+            "serviceId": rng.choice(services), "branchId": branch_id,
+            "created_at": clock.isoformat(timespec='seconds')
+        })
+        return q_id
+
+    with database.transaction():
+        for _ in range(args.waiting):
+            book()
+
+    conn = database.get_db_connection()
+    database.get_queue_position("warm-up")  # builds the index from SQLite
+    for _ in range(args.transitions):
+        action = rng.random()
+        waiting = [r['id'] for r in conn.execute("SELECT id FROM queues WHERE status = 'waiting' LIMIT 50").fetchall()]
+        if action < 0.3 or not waiting:
+            book()
+        elif action < 0.55:
+            database.call_next_in_branch(branch_id)
+        elif action < 0.7:
+            database.update_queue_status(rng.choice(waiting), rng.choice(['completed', 'no-show', 'cancelled']))
+        elif action < 0.85:
+            database.transfer_queue(rng.choice(waiting), rng.choice(services))
+        else:
+            with database.transaction():
+                database.update_queue_status(rng.choice(waiting), 'serving')
+
+    mismatches = database.position_index.verify(conn)
+    ids = [r['id'] for r in conn.execute("SELECT id FROM queues WHERE status = 'waiting'").fetchall()]
+    print(f"waiting after replay: {len(ids)}, mismatches vs SQL: {len(mismatches)}")
+    for q_id, reason in mismatches[:10]:
+        print(f"  {q_id}: {reason}")
+
+    started = time.perf_counter()
+    for q_id in ids:
+        sql_people_ahead(conn, q_id)
+    sql_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for q_id in ids:
+        database.get_queue_position(q_id)
+    index_time = time.perf_counter() - started
+
+    n = max(len(ids), 1)
+    print(f"SQL COUNT(*):   {sql_time / n * 1e6:8.1f} us/lookup")
+    print(f"position index: {index_time / n * 1e6:8.1f} us/lookup")
+    database.close_all_connections()
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Requests/sec for /api/queue-position before and after connection pooling.
+
+"before" uses the original open-per-call sqlite3 connection, "after" uses the
+pooled, WAL-tuned connection from database.get_db_connection().
+
+    python benchmarks/bench_queue_position.py --waiting 2000 --requests 5000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+def legacy_connection():
+    import database
+    conn = sqlite3.connect(database.DB_NAME)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def seed(database, waiting):
+    database.init_db()
+    org_id = database.add_organization("Bench Clinic")
+    branch_id = database.add_branch(org_id, "Main", "Bench street 1")
+    svc_id = database.add_service(org_id, branch_id, "Terapevt", 15)
+    start = datetime.now() - timedelta(hours=3)
+    ids = []
+    with database.transaction():
+        for i in range(waiting):
+            q_id = str(uuid.uuid4())
+            database.add_queue({
+                "id": q_id,
+                "phone": f"+99890{i:07d}",
+                "number": f"A-{i:04d}",
+                "serviceId": svc_id,
+                "branchId": branch_id,
+                "created_at": (start + timedelta(seconds=i)).isoformat()
+            })
+            ids.append(q_id)
+    return ids
+
+def run(client, ids, n_requests):
+    started = time.perf_counter()
+    for i in range(n_requests):
+        res = client.get(f"/api/queue-position/{ids[(i * 7919) % len(ids)]}")
+        assert res.status_code == 200, res.status_code
+    return n_requests / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--waiting", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_qpos_")
+    os.environ["DB_NAME"] = os.path.join(tmp_dir, "bench.db")
+
+    import database
+    ids = seed(database, args.waiting)
+
+    from app import app
+    client = app.test_client()
+
+    pooled_connection = database.get_db_connection
+    database.get_db_connection = legacy_connection
+    before = run(client, ids, args.requests)
+
+    database.get_db_connection = pooled_connection
+    after = run(client, ids, args.requests)
+
+    print(f"waiting tickets: {args.waiting}, requests: {args.requests}")
+    print(f"before (connect per call): {before:8.1f} req/s")
+    print(f"after  (pooled + WAL):     {after:8.1f} req/s  ({after / before:.2f}x)")
+    database.close_all_connections()
+
+if __name__ == "__main__":
+    main()
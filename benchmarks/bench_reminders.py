@@ -0,0 +1,144 @@
+"""Reminder scheduler: a simulated day of appointments, CPU cost per tick.
+
+Seeds a day of waiting tickets with appointment times, builds the reminder
+heap from SQLite, then replays the day minute by minute on a simulated clock
+with bookings being added, moved and cancelled between ticks. Checks that
+every remaining appointment got each reminder level exactly once and fails
+(exit code 1) if the p99 CPU time of a tick exceeds the budget. The old
+"rescan every row each minute" loop is timed on the same data for reference.
+
+    python benchmarks/bench_reminders.py --appointments 50000 --max-tick-ms 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+DAY = datetime(2031, 3, 4)
+
+def legacy_tick(rows, users, now):
+    # Shape of the old notification_scheduler pass, minus the SQL and HTTP
+    due = 0
+    for q in rows:
+        if q['status'] != 'waiting':
+            continue
+        if users.get(q['phone']) is None:
+            continue
+        appt_dt = datetime.fromisoformat(f"{q['date']}T{q['time']}")
+        minutes_left = (appt_dt - now).total_seconds() / 60
+        level = q['notification_level']
+        if (55 <= minutes_left <= 65 and level < 1) or (25 <= minutes_left <= 35 and level < 2) \
+                or (5 <= minutes_left <= 15 and level < 3):
+            due += 1
+    return due
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--appointments", type=int, default=50000)
+    parser.add_argument("--churn", type=int, default=20, help="bookings added/moved/cancelled per tick")
+    parser.add_argument("--max-tick-ms", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="bench_rem_"), "bench.db")
+    import database
+    from reminders import REMINDER_LEVELS
+
+    rng = random.Random(args.seed)
+    database.init_db()
+    conn = database.get_db_connection()
+    date = DAY.strftime('%Y-%m-%d')
+    rows = []
+    for i in range(args.appointments):
+        minute = rng.randrange(8 * 60, 20 * 60)
+        rows.append({"id": f"a{i}", "phone": f"+99890{i:07d}", "number": f"A-{i % 1000:03d}", "status": "waiting",
+                     "date": date, "time": f"{minute // 60:02d}:{minute % 60:02d}", "notification_level": 0})
+    conn.executemany('''
+        INSERT INTO queues (id, phone, number, status, date, time, notification_level, created_at)
+        VALUES (:id, :phone, :number, :status, :date, :time, :notification_level, :date)
+    ''', rows)
+    conn.commit()
+
+    started = time.process_time()
+    scheduler = database.ensure_reminders(now=DAY)
+    rebuild_ms = (time.process_time() - started) * 1000
+
+    live = {r['id']: r['time'] for r in rows}
+    ids = list(live)
+    touched = set()
+    fired = {}
+    tick_ms = []
+    churn_ms = []
+    next_id = args.appointments
+    now = DAY + timedelta(hours=6)
+    end = DAY + timedelta(hours=20, minutes=58)
+    while now <= end:
+        started = time.process_time()
+        for _ in range(args.churn):
+            op = rng.random()
+            if op < 0.4:
+                q_id = f"a{next_id}"
+                next_id += 1
+                ids.append(q_id)
+            else:
+                q_id = rng.choice(ids)
+                if q_id not in live:
+                    continue
+            touched.add(q_id)
+            if op < 0.8:
+                minute = rng.randrange(now.hour * 60 + now.minute + 1, 21 * 60)
+                live[q_id] = f"{minute // 60:02d}:{minute % 60:02d}"
+                fired.pop(q_id, None)
+                scheduler.schedule(q_id, date, live[q_id], 0)
+            else:
+                live.pop(q_id, None)
+                fired.pop(q_id, None)
+                scheduler.cancel(q_id)
+        churn_ms.append((time.process_time() - started) * 1000)
+
+        started = time.process_time()
+        due = scheduler.pop_due(now)
+        tick_ms.append((time.process_time() - started) * 1000)
+        for q_id, level in due:
+            fired.setdefault(q_id, []).append(level)
+        now += timedelta(minutes=1)
+
+    # Untouched seeded bookings get 1, 2, 3 exactly once; nobody gets a level twice
+    expected = [level for level, _ in REMINDER_LEVELS]
+    wrong = [q_id for q_id, levels in fired.items() if levels != sorted(set(levels))]
+    missing = [q_id for q_id in live if q_id not in touched and fired.get(q_id) != expected]
+
+    users = {r['phone']: {"user_id": r['id']} for r in rows}
+    legacy_ms = []
+    for minute in range(0, 60, 6):
+        started = time.process_time()
+        legacy_tick(rows, users, DAY + timedelta(hours=12, minutes=minute))
+        legacy_ms.append((time.process_time() - started) * 1000)
+
+    tick_ms.sort()
+    p99 = tick_ms[int(len(tick_ms) * 0.99) - 1]
+    print(f"Appointments: {args.appointments:,}, ticks: {len(tick_ms)}, reminders fired: {sum(len(v) for v in fired.values()):,}")
+    print(f"Heap rebuild from SQLite: {rebuild_ms:.1f} ms CPU")
+    print(f"Tick CPU: median {statistics.median(tick_ms):.3f} ms, p99 {p99:.3f} ms, max {tick_ms[-1]:.3f} ms")
+    print(f"Churn CPU per tick ({args.churn} ops): median {statistics.median(churn_ms):.3f} ms")
+    print(f"Legacy full-scan tick CPU (no SQL/HTTP): median {statistics.median(legacy_ms):.1f} ms")
+    database.close_all_connections()
+
+    if wrong or missing:
+        print(f"❌ {len(wrong)} tickets with repeated/out-of-order levels, {len(missing)} untouched tickets missing reminders")
+        return 1
+    if p99 > args.max_tick_ms:
+        print(f"❌ p99 tick {p99:.3f} ms exceeds budget {args.max_tick_ms} ms")
+        return 1
+    print("✅ every reminder fired once, tick cost within budget")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Socket.IO fan-out cost: broadcast to everyone vs room-scoped publish.
+
+Connects --orgs x --per-org test clients (org admins, branch staff and
+ticket trackers), then publishes queue events for random tickets both the
+old way (socketio.emit to every socket) and through publish_queue_event()
+(only the ticket's org/branch/ticket rooms). Reports emit time and
+how many socket deliveries each event cost.
+
+    python benchmarks/bench_socket_fanout.py --orgs 50 --per-org 100 --events 500
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+ADMINS_PER_ORG = 2
+STAFF_PER_ORG = 3
+BRANCHES_PER_ORG = 3
+SERVICES_PER_BRANCH = 4
+
+def seed(database, orgs, trackers_per_org):
+    today = datetime.now().strftime('%Y-%m-%d')
+    layout = []
+    with database.transaction():
+        for o in range(orgs):
+            org_id = database.add_organization(f"Bench Org {o}")
+            branches = []
+            for b in range(BRANCHES_PER_ORG):
+                branch_id = database.add_branch(org_id, f"Branch {b}", "Street")
+                services = [database.add_service(org_id, branch_id, f"Svc {s}", 15) for s in range(SERVICES_PER_BRANCH)]
+                branches.append((branch_id, services))
+            tickets = []
+            for t in range(trackers_per_org):
+                branch_id, services = branches[t % len(branches)]
+                q_id = str(uuid.uuid4())
+                database.add_queue({
+                    "id": q_id, "phone": f"+9989{o:03d}{t:05d}", "number": f"A-{t:03d}", "date": today,
+                    "serviceId": services[t % len(services)], "branchId": branch_id, "org_id": org_id
+                })
+                tickets.append(q_id)
+            layout.append((org_id, branches, tickets))
+    return layout
+
+def received_count(clients):
+    return sum(len(c.get_received()) for c in clients)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orgs", type=int, default=50)
+    parser.add_argument("--per-org", type=int, default=100, help="connected sockets per org")
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="bench_fanout_"), "bench.db")
+    import database
+    database.init_db()
+    trackers_per_org = args.per_org - ADMINS_PER_ORG - STAFF_PER_ORG
+    layout = seed(database, args.orgs, trackers_per_org)
+
+    import app as server
+    from flask_jwt_extended import create_access_token
+    rng = random.Random(args.seed)
+
+    clients = []
+    started = time.perf_counter()
+    with server.app.app_context():
+        for org_id, branches, tickets in layout:
+            for _ in range(ADMINS_PER_ORG):
+                token = create_access_token("bench", additional_claims={"role": "org_admin", "org_id": org_id})
+                clients.append(server.socketio.test_client(server.app, auth={"token": token}))
+            for s in range(STAFF_PER_ORG):
+                token = create_access_token("bench", additional_claims={
+                    "role": "staff", "org_id": org_id, "branch_id": branches[s % len(branches)][0]})
+                clients.append(server.socketio.test_client(server.app, auth={"token": token}))
+            for q_id in tickets:
+                clients.append(server.socketio.test_client(server.app, auth={"ticket": q_id}))
+    connect_secs = time.perf_counter() - started
+    connected = sum(1 for c in clients if c.is_connected())
+    refused = server.socketio.test_client(server.app)
+    received_count(clients)
+
+    all_tickets = [database.get_queue(q_id) for _, _, tickets in layout for q_id in tickets]
+    events = [rng.choice(all_tickets) for _ in range(args.events)]
+
+    results = {}
+    for label in ("broadcast", "rooms"):
+        started = time.perf_counter()
+        for q in events:
+            if label == "broadcast":
+                server.socketio.emit('queue_updated', {'type': 'status_change', 'queue_id': q['id'], 'org_id': q['org_id']})
+            else:
+                server.publish_queue_event(q, {'type': 'status_change'})
+        elapsed = time.perf_counter() - started
+        results[label] = (elapsed, received_count(clients))
+
+    print(f"Connected {connected}/{len(clients)} sockets across {args.orgs} orgs in {connect_secs:.1f}s "
+          f"(unauthenticated socket refused: {not refused.is_connected()})")
+    for label, (elapsed, deliveries) in results.items():
+        print(f"{label:>9}: {elapsed / args.events * 1000:8.3f} ms/event, {deliveries / args.events:8.1f} deliveries/event")
+    speedup = results["broadcast"][0] / results["rooms"][0] if results["rooms"][0] else float('inf')
+    print(f"Room-scoped publish is {speedup:.1f}x cheaper per event")
+
+if __name__ == "__main__":
+    main()
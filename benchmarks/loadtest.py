@@ -0,0 +1,340 @@
+"""Load test: the morning rush against a real server on a temp database.
+
+Seeds a temp database (--branches branches with services, one staff member
+each and --backlog waiting tickets per branch) or copies a --dataset made by
+generate_dataset.py, starts serve.py on it and runs
+--users virtual users for --duration seconds, split by --mix between:
+
+  booking   patients taking a ticket (POST /api/queues)
+  tracker   ticket pages polling their position (/api/queue-position, /api/queue)
+  staff     call-next, then complete (or no-show, 1 in 5)
+  display   hallway screens polling the board and the wait times
+
+Each user keeps one HTTP connection and pauses between requests for its
+role's think time (scaled by --think-scale; 0 = flat out). The first
+--warmup seconds are not counted. Reports count, errors (5xx or no response),
+requests/s and p50/p95/p99 latency per endpoint; --out saves them as JSON and
+--baseline compares against a saved run, exiting with status 1 when p95 or
+throughput regressed by more than --tolerance.
+
+    python benchmarks/loadtest.py --users 60 --duration 30 --out run.json
+    python benchmarks/loadtest.py --users 60 --duration 30 --baseline run.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+SERVICES_PER_BRANCH = 4
+# Mean pause between a user's requests, seconds (before --think-scale)
+THINK_SECONDS = {"booking": 1.0, "tracker": 2.0, "staff": 1.0, "display": 3.0}
+DEFAULT_MIX = "booking=2,tracker=10,staff=1,display=2"
+# Differences below this are noise, whatever the ratio
+MIN_P95_REGRESSION_MS = 2.0
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        role, _, weight = part.partition("=")
+        if role.strip() not in THINK_SECONDS:
+            raise SystemExit(f"unknown role in --mix: {role}")
+        mix[role.strip()] = float(weight or 1)
+    return mix
+
+def seed(database, branches, backlog):
+    """Small catalog plus a waiting backlog. Returns (layout, waiting ticket ids)."""
+    today = datetime.now().strftime('%Y-%m-%d')
+    layout, tickets = [], []
+    with database.transaction():
+        org_id = database.add_organization("Load Test Clinic")
+        for b in range(branches):
+            branch_id = database.add_branch(org_id, f"Filial {b}", "Manzil")
+            services = [database.add_service(org_id, branch_id, f"Xizmat {s}", 15) for s in range(SERVICES_PER_BRANCH)]
+            layout.append((branch_id, org_id, services))
+            for t in range(backlog):
+                q_id = str(uuid.uuid4())
+                database.add_queue({
+                    "id": q_id, "phone": f"+99890{b:03d}{t:04d}", "number": f"S-{t:04d}", "date": today,
+                    "serviceId": services[t % len(services)], "branchId": branch_id, "org_id": org_id,
+                })
+                tickets.append(q_id)
+    return layout, tickets
+
+def load_dataset(database):
+    """Catalog and today's waiting tickets of a generate_dataset.py database. Returns (layout, ticket ids)."""
+    conn = database.get_db_connection()
+    services = defaultdict(list)
+    for row in conn.execute('SELECT id, branch_id FROM services ORDER BY id'):
+        services[row['branch_id']].append(row['id'])
+    layout = [(r['id'], r['org_id'], services[r['id']])
+              for r in conn.execute('SELECT id, org_id FROM branches ORDER BY id') if services[r['id']]]
+    tickets = [r['id'] for r in conn.execute("SELECT id FROM queues WHERE status = 'waiting' AND date = ?",
+                                             (datetime.now().strftime('%Y-%m-%d'),))]
+    conn.close()
+    if not tickets:
+        print("No waiting tickets today in the dataset (generate it with --end today)")
+    return layout, tickets
+
+def staff_tokens(layout):
+    import app as server
+    from flask_jwt_extended import create_access_token
+    with server.app.app_context():
+        return {branch_id: create_access_token(f"staff-{branch_id}", additional_claims={
+            "role": "staff", "org_id": org_id, "branch_id": branch_id}) for branch_id, org_id, _ in layout}
+
+def start_server(work, port, env):
+    log = open(os.path.join(work, "server.log"), "w")
+    process = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "serve.py")], cwd=BASE_DIR,
+                               env=dict(env, PORT=str(port)), stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"server exited with {process.returncode}, see {log.name}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit(f"server did not come up, see {log.name}")
+
+class Recorder:
+    def __init__(self, measure_from):
+        self.measure_from = measure_from
+        self.samples = defaultdict(list)    # endpoint -> [ms]
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, started, status):
+        if started < self.measure_from:
+            return
+        ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.samples[endpoint].append(ms)
+            self.statuses[endpoint][status] += 1
+
+class VirtualUser(threading.Thread):
+    def __init__(self, role, port, recorder, shared, stop_at, think_scale):
+        super().__init__(daemon=True)
+        self.role = role
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        self.recorder = recorder
+        self.shared = shared
+        self.stop_at = stop_at
+        self.think = THINK_SECONDS[role] * think_scale
+        self.rng = random.Random()
+
+    def call(self, endpoint, method, path, body=None, token=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        started = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=None if body is None else json.dumps(body), headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            data, status = b"", 0
+        self.recorder.record(endpoint, started, status)
+        if status == 200:
+            try:
+                return json.loads(data)
+            except ValueError:
+                return None
+        return None
+
+    def pause(self):
+        if self.think:
+            time.sleep(self.rng.expovariate(1 / self.think))
+
+    def run(self):
+        scenario = getattr(self, self.role)
+        while time.perf_counter() < self.stop_at:
+            scenario()
+            self.pause()
+        self.conn.close()
+
+    def booking(self):
+        branch_id, _, services = self.rng.choice(self.shared["layout"])
+        q_id = str(uuid.uuid4())
+        with self.shared["lock"]:
+            self.shared["phones"] += 1
+            n = self.shared["phones"]
+        result = self.call("POST /api/queues", "POST", "/api/queues", {
+            "id": q_id, "phone": f"+99891{n:07d}", "number": f"L-{n:05d}",
+            "date": datetime.now().strftime('%Y-%m-%d'), "serviceId": self.rng.choice(services),
+            "branchId": branch_id,
+        })
+        if result and result.get("success"):
+            self.shared["tickets"].append(q_id)
+
+    def tracker(self):
+        q_id = self.rng.choice(self.shared["tickets"])
+        self.call("GET /api/queue-position/<q_id>", "GET", f"/api/queue-position/{q_id}")
+        if self.rng.random() < 0.2:
+            self.call("GET /api/queue/<q_id>", "GET", f"/api/queue/{q_id}")
+
+    def staff(self):
+        branch_id, _, _ = self.rng.choice(self.shared["layout"])
+        token = self.shared["tokens"][branch_id]
+        result = self.call("POST /api/staff/call-next", "POST", "/api/staff/call-next", {}, token)
+        if not result:
+            return
+        self.pause()
+        if self.rng.random() < 0.2:
+            self.call("POST /api/staff/no-show", "POST", "/api/staff/no-show", {"queue_id": result["queue"]["id"]}, token)
+        else:
+            self.call("POST /api/staff/complete", "POST", "/api/staff/complete", {"queue_id": result["queue"]["id"]}, token)
+
+    def display(self):
+        branch_id, _, _ = self.rng.choice(self.shared["layout"])
+        self.call("GET /api/board/<branch_id>", "GET", f"/api/board/{branch_id}")
+        self.call("GET /api/branch-wait-times", "GET", f"/api/branch-wait-times?branch_id={branch_id}")
+
+def percentile(sorted_ms, p):
+    if not sorted_ms:
+        return 0.0
+    return sorted_ms[min(len(sorted_ms) - 1, max(0, int(round(p / 100 * len(sorted_ms))) - 1))]
+
+def summarize(recorder, seconds):
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        statuses = recorder.statuses[endpoint]
+        endpoints[endpoint] = {
+            "count": len(samples),
+            "errors": sum(n for status, n in statuses.items() if status == 0 or status >= 500),
+            "statuses": {str(status): n for status, n in sorted(statuses.items())},
+            "rps": round(len(samples) / seconds, 2),
+            "p50_ms": round(percentile(samples, 50), 2),
+            "p95_ms": round(percentile(samples, 95), 2),
+            "p99_ms": round(percentile(samples, 99), 2),
+            "max_ms": round(samples[-1], 2),
+        }
+    return endpoints
+
+def print_table(endpoints):
+    print(f"{'endpoint':<36}{'count':>8}{'err':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    for endpoint, s in endpoints.items():
+        print(f"{endpoint:<36}{s['count']:>8}{s['errors']:>6}{s['rps']:>9.1f}"
+              f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}")
+    total = sum(s['count'] for s in endpoints.values())
+    print(f"{'total':<36}{total:>8}{sum(s['errors'] for s in endpoints.values()):>6}"
+          f"{sum(s['rps'] for s in endpoints.values()):>9.1f}")
+
+def compare(endpoints, baseline, tolerance):
+    """Regression messages: p95 up or throughput down by more than tolerance."""
+    failures = []
+    for endpoint, base in baseline["endpoints"].items():
+        current = endpoints.get(endpoint)
+        if current is None:
+            failures.append(f"{endpoint}: no requests in this run")
+            continue
+        if (current["p95_ms"] > base["p95_ms"] * (1 + tolerance)
+                and current["p95_ms"] - base["p95_ms"] > MIN_P95_REGRESSION_MS):
+            failures.append(f"{endpoint}: p95 {base['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            failures.append(f"{endpoint}: {base['rps']:.1f} -> {current['rps']:.1f} req/s")
+        if current["errors"] > base["errors"]:
+            failures.append(f"{endpoint}: errors {base['errors']} -> {current['errors']}")
+    return failures
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--think-scale", type=float, default=1.0)
+    parser.add_argument("--branches", type=int, default=4)
+    parser.add_argument("--backlog", type=int, default=200, help="waiting tickets per branch at start")
+    parser.add_argument("--dataset", help="run against a copy of this generate_dataset.py database instead")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--server-mode", default="gevent", choices=("gevent", "threading"))
+    parser.add_argument("--seed", type=int, help="random seed for user roles")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    work = tempfile.mkdtemp(prefix="loadtest_")
+    env = dict(os.environ, DB_NAME=os.path.join(work, "load.db"), JWT_SECRET_KEY="loadtest-" + "k" * 32,
+               BOT_TOKEN="", GEMINI_API_KEY="", ADMIN_PHONE="", ADMIN_PASS="", SERVER_MODE=args.server_mode)
+    os.environ.update(DB_NAME=env["DB_NAME"], JWT_SECRET_KEY=env["JWT_SECRET_KEY"])
+    import database
+    if args.dataset:
+        shutil.copyfile(args.dataset, database.DB_NAME)
+    database.init_db()
+    if args.dataset:
+        layout, tickets = load_dataset(database)
+    else:
+        layout, tickets = seed(database, args.branches, args.backlog)
+    shared = {"layout": layout, "tickets": tickets, "tokens": staff_tokens(layout),
+              "phones": 0, "lock": threading.Lock()}
+    database.close_all_connections()
+
+    print(f"{len(layout)} branches, {len(tickets)} waiting tickets ({work})")
+    server = start_server(work, args.port, env)
+    try:
+        rng = random.Random(args.seed)
+        roles = rng.choices(list(mix), weights=list(mix.values()), k=args.users)
+        started = time.perf_counter()
+        recorder = Recorder(started + args.warmup)
+        stop_at = started + args.warmup + args.duration
+        users = [VirtualUser(role, args.port, recorder, shared, stop_at, args.think_scale) for role in roles]
+        print(f"{args.users} users ({', '.join(f'{r}={roles.count(r)}' for r in mix)}), "
+              f"{args.warmup:.0f}s warm-up + {args.duration:.0f}s, {args.server_mode} server")
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+    finally:
+        server.terminate()
+        server.wait(10)
+
+    endpoints = summarize(recorder, args.duration)
+    print_table(endpoints)
+    results = {
+        "meta": {"revision": git_revision(), "time": datetime.now().isoformat(timespec="seconds"),
+                 "users": args.users, "duration": args.duration, "mix": mix, "think_scale": args.think_scale,
+                 "branches": args.branches, "backlog": args.backlog, "server_mode": args.server_mode},
+        "endpoints": endpoints,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(endpoints, json.load(f), args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION: {failure}")
+        sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
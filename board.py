@@ -0,0 +1,111 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+import offload
+
+# --- Branch Board Snapshots ---
+# A branch's hallway display ("now serving") is a single snapshot: tickets
+# being served, the next few waiting and today's counts. database.py marks the
+# branches touched by every committed transition -- this process's and, via
+# the bus, every other worker's; after BOARD_WINDOW_MS the flusher rebuilds
+# only those branches that have a cached board and pushes a snapshot to the
+# displays connected to this process when its content changed. A display
+# (re)connecting gets the cached snapshot in one message. Only existing
+# branches are cached, at most BOARD_CACHE_SIZE of them (least recently used
+# dropped first).
+
+BOARD_WINDOW_MS = int(os.getenv("BOARD_WINDOW_MS", "200"))
+BOARD_CACHE_SIZE = int(os.getenv("BOARD_CACHE_SIZE", "1024"))
+
+class BoardSnapshots:
+    def __init__(self, window=BOARD_WINDOW_MS / 1000.0, maxsize=BOARD_CACHE_SIZE):
+        self.window = window
+        self.maxsize = maxsize
+        self._lock = offload.Lock()
+        self._wake = offload.Event()
+        self._dirty = set()      # branch ids
+        self._boards = OrderedDict()   # branch_id -> snapshot (with 'version'), LRU order
+        self._emit = None
+        self._build = None
+
+    def start(self, emit, build):
+        """emit(branch_id, snapshot); build(branch_id) comes from database.py and
+        returns None for an unknown branch."""
+        if self._emit is not None:
+            return
+        self._emit = emit
+        self._build = build
+        offload.start_thread(self._run)
+
+    def get(self, branch_id):
+        """Current snapshot for a branch, built on first use or after midnight;
+        None if there is no such branch."""
+        with self._lock:
+            board = self._boards.get(branch_id)
+            if board is not None:
+                self._boards.move_to_end(branch_id)
+        if board is None or board['date'] != datetime.now().strftime('%Y-%m-%d'):
+            board, _ = self._refresh(branch_id)
+        return board
+
+    def mark(self, before, after):
+        if self._emit is None:
+            return
+        with self._lock:
+            for state in (before, after):
+                # Branches nobody is displaying are rebuilt lazily by get()
+                if state and state.get('branch_id') in self._boards:
+                    self._dirty.add(state['branch_id'])
+        self._wake.set()
+
+    def reset(self):
+        with self._lock:
+            self._boards.clear()
+            self._dirty.clear()
+
+    def _refresh(self, branch_id):
+        board = self._build(branch_id)
+        with self._lock:
+            if board is None:
+                # Unknown (or deleted) branch: never cached
+                self._boards.pop(branch_id, None)
+                return None, False
+            old = self._boards.get(branch_id)
+            if old is not None and {**old, 'version': None} == {**board, 'version': None}:
+                return old, False
+            # Comparable across workers on one host; strictly increasing per branch
+            version = int(time.time() * 1000)
+            if old is not None and version <= old['version']:
+                version = old['version'] + 1
+            board['version'] = version
+            self._boards[branch_id] = board
+            self._boards.move_to_end(branch_id)
+            while len(self._boards) > self.maxsize:
+                self._boards.popitem(last=False)
+        return board, True
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            # Let the rest of the burst land before rebuilding anything
+            time.sleep(self.window)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Board snapshot error: {e}")
+
+    def flush(self):
+        """Rebuild dirty boards and push the changed ones. Returns the number pushed."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        pushed = 0
+        for branch_id in dirty:
+            board, changed = self._refresh(branch_id)
+            if changed:
+                self._emit(branch_id, board)
+                pushed += 1
+        return pushed
+
+board_snapshots = BoardSnapshots()
@@ -1,8 +1,7 @@
 import os
 import telebot
 from telebot import types
-import json
-import datetime
+import database
 
 from dotenv import load_dotenv
 
@@ -14,16 +13,14 @@ if not TOKEN:
     print("Error: BOT_TOKEN not found in environment")
     exit(1)
 
-DATA_FILE = "verifications.json"
-
 # In-memory storage for pending sessions (chat_id -> uid)
 pending_uids = {}
 
 # Initialize Bot
 bot = telebot.TeleBot(TOKEN)
+database.init_db()
 
 def save_verification(user_id, phone_number, username):
-    import database
     # Save to SQLite Database for permanent recognition
     database.add_user(
         phone=phone_number,
@@ -32,39 +29,8 @@ def save_verification(user_id, phone_number, username):
         role='user'
     )
     
-    # Also keep JSON for backward compatibility/backup
-    data = {}
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = {}
-    
-    data[str(phone_number)] = {
-        "user_id": user_id,
-        "username": username,
-        "time": datetime.datetime.now().isoformat()
-    }
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
-
-def update_uid_with_phone(uid, phone_number):
-    data = {}
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            try:
-                data = json.load(f)
-            except:
-                data = {}
-    
-    key = f"uid_{uid}"
-    if key in data:
-        data[key]["phone"] = phone_number
-        data[key]["verified"] = True
-        
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+    # Phone -> chat record used by the site's login check
+    database.save_phone_verification(phone_number, user_id, username)
 
 @bot.message_handler(commands=['start'])
 def send_welcome(message):
@@ -72,7 +38,7 @@ def send_welcome(message):
     args = message.text.split()
     if len(args) > 1:
         session_uid = args[1]
-        save_session_uid(session_uid, message.chat.id)
+        database.save_session_uid(session_uid, message.chat.id)
         pending_uids[message.chat.id] = session_uid
         
     markup = types.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
@@ -85,24 +51,6 @@ def send_welcome(message):
     )
     bot.send_message(message.chat.id, welcome_text, parse_mode='HTML', reply_markup=markup)
 
-def save_session_uid(uid, chat_id):
-    data = {}
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            try:
-                data = json.load(f)
-            except:
-                data = {}
-    
-    # Save mapping UID -> chat_id
-    data[f"uid_{uid}"] = {
-        "user_id": chat_id,
-        "timestamp": datetime.datetime.now().isoformat()
-    }
-    
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
-
 @bot.message_handler(content_types=['contact'])
 def handle_contact(message):
     if message.contact is not None:
@@ -119,7 +67,7 @@ def handle_contact(message):
         # Check if this user had a pending UID session
         if message.chat.id in pending_uids:
             uid = pending_uids[message.chat.id]
-            update_uid_with_phone(uid, phone)
+            database.update_uid_with_phone(uid, phone)
             del pending_uids[message.chat.id]
         
         response_text = "✅ Rahmat! Raqamingiz tasdiqlandi. Saytda kod avtomatik yuboriladi."
@@ -137,7 +85,6 @@ def handle_rating(call):
             q_id = parts[1]
             stars = int(parts[2])
             
-            import database
             if database.add_rating(q_id, stars, "Telegram orqali baholandi"):
                 bot.edit_message_text(
                     chat_id=call.message.chat.id,
@@ -0,0 +1,131 @@
+"""Build the frontend into ASSET_BUILD_DIR (see static_assets.py).
+
+    python build_assets.py
+
+Every CSS/JS/image/audio/manifest file gets a content-hashed copy
+(css/main.css -> css/main.3f2a9c1b.css) next to the original, HTML pages are
+rewritten to reference the hashed names, sw.js gets the hashed precache list
+of the pages it caches, and compressible files get .gz (and, with the Brotli
+package installed, .br) siblings. Re-run after editing t/operator-ai-pro.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+from static_assets import STATIC_SOURCE_DIR, ASSET_BUILD_DIR, ASSET_MANIFEST
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HASHED_EXTENSIONS = {'.css', '.js', '.json', '.png', '.jpg', '.jpeg', '.svg', '.ico', '.webp', '.mp3'}
+COMPRESSIBLE_EXTENSIONS = {'.html', '.css', '.js', '.json', '.svg', '.txt'}
+UNHASHED = {'sw.js'}             # must keep its URL for the browser to find updates
+SKIPPED = {'README.md'}
+# Pages the service worker keeps for offline use (and whose assets it precaches)
+SW_PAGES = ('index.html', 'tracker.html')
+HASH_LENGTH = 10
+
+# src="js/app.js" / href="css/main.css?v=6" -- relative, same-origin references only
+REFERENCE_RE = re.compile(r'''(?P<attr>\b(?:src|href)=)(?P<quote>["'])(?P<path>[^"'#?:]+)(?:\?[^"']*)?(?P=quote)''')
+SW_PRECACHE_RE = re.compile(r'^const PRECACHE = \[.*?\];', re.M | re.S)
+SW_PAGES_RE = re.compile(r'^const PAGES = \[.*?\];', re.M | re.S)
+
+def _source_files():
+    for root, dirs, files in os.walk(STATIC_SOURCE_DIR):
+        dirs.sort()
+        for name in sorted(files):
+            rel = os.path.relpath(os.path.join(root, name), STATIC_SOURCE_DIR).replace(os.sep, '/')
+            if rel not in SKIPPED:
+                yield rel
+
+def _hashed_name(rel, data):
+    stem, ext = os.path.splitext(rel)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+
+def _write(rel, data):
+    path = os.path.join(ASSET_BUILD_DIR, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if os.path.splitext(rel)[1] in COMPRESSIBLE_EXTENSIONS:
+        _write_compressed(path, data)
+
+def _write_compressed(path, data):
+    # mtime=0 keeps rebuilds of unchanged files byte-identical
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        # Tiny files can grow; static_assets.py then sends the original
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+def _rewrite_html(html, assets):
+    """Point references at hashed names. Returns (html, referenced hashed names)."""
+    referenced = []
+    def replace(match):
+        rel = os.path.normpath(match.group('path')).replace(os.sep, '/').lstrip('/')
+        hashed = assets.get(rel)
+        if hashed is None:
+            return match.group(0)
+        referenced.append(hashed)
+        return f"{match.group('attr')}{match.group('quote')}{hashed}{match.group('quote')}"
+    return REFERENCE_RE.sub(replace, html), referenced
+
+def build():
+    if os.path.isdir(ASSET_BUILD_DIR):
+        shutil.rmtree(ASSET_BUILD_DIR)
+    files = list(_source_files())
+    sources = {}
+    for rel in files:
+        with open(os.path.join(STATIC_SOURCE_DIR, rel), 'rb') as f:
+            sources[rel] = f.read()
+
+    # 1. Hashed copies; the unhashed originals stay reachable for old pages
+    assets = {}
+    for rel in files:
+        if rel not in UNHASHED and os.path.splitext(rel)[1] in HASHED_EXTENSIONS:
+            assets[rel] = _hashed_name(rel, sources[rel])
+            _write(assets[rel], sources[rel])
+
+    # 2. Pages, with references rewritten
+    page_assets = {}
+    for rel in files:
+        if rel.endswith('.html'):
+            html, referenced = _rewrite_html(sources[rel].decode('utf-8'), assets)
+            page_assets[rel] = referenced
+            sources[rel] = html.encode('utf-8')
+
+    for rel in files:
+        if rel not in UNHASHED:
+            _write(rel, sources[rel])
+
+    # 3. Service worker precaching exactly the hashed files its pages use
+    precache = sorted({'/' + name for page in SW_PAGES for name in page_assets.get(page, [])})
+    pages = ['/'] + ['/' + page for page in SW_PAGES]
+    sw = sources['sw.js'].decode('utf-8')
+    sw = SW_PRECACHE_RE.sub(lambda _: 'const PRECACHE = ' + json.dumps(precache, indent=4) + ';', sw, count=1)
+    sw = SW_PAGES_RE.sub(lambda _: 'const PAGES = ' + json.dumps(pages) + ';', sw, count=1)
+    _write('sw.js', sw.encode('utf-8'))
+
+    version = hashlib.sha256(json.dumps(assets, sort_keys=True).encode()).hexdigest()[:HASH_LENGTH]
+    with open(os.path.join(ASSET_BUILD_DIR, ASSET_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump({"version": version, "assets": assets, "precache": precache}, f, indent=2, sort_keys=True)
+    return version, assets, precache
+
+def main():
+    version, assets, precache = build()
+    print(f"✅ Built {len(assets)} hashed assets into {ASSET_BUILD_DIR} (version {version}, "
+          f"{len(precache)} precached by sw.js)")
+    if brotli is None:
+        print("Brotli not installed: only .gz siblings were written", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import os
+import pickle
+import time
+import uuid
+import database
+import offload
+
+# --- Cross-Process Message Bus ---
+# Lets several worker processes see each other's events: Socket.IO emits
+# (socketio_bus.py) and committed queue transitions, which keep every
+# process's in-memory position index and reminder heap current.
+#
+#   MESSAGE_QUEUE unset     single process, no bus
+#   MESSAGE_QUEUE=sqlite    bus_messages table in the app database, polled;
+#                           no extra service, processes must share the host
+#   MESSAGE_QUEUE=redis://  Redis pub/sub (needs the redis package)
+
+MESSAGE_QUEUE = os.getenv("MESSAGE_QUEUE", "")
+BUS_POLL_MS = int(os.getenv("BUS_POLL_MS", "50"))
+BUS_RETENTION_SECONDS = 60
+
+class SQLiteBus:
+    def __init__(self, poll=BUS_POLL_MS / 1000.0):
+        self.origin = uuid.uuid4().hex
+        self.poll = poll
+        self._subscribers = {}   # channel -> [(callback, include_own)]
+        self._lock = offload.Lock()
+        self._thread = None
+
+    def publish(self, channel, data):
+        database.publish_bus_message(channel, self.origin, pickle.dumps(data))
+
+    def subscribe(self, channel, callback, include_own=False):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append((callback, include_own))
+            if self._thread is None:
+                # Only messages published from now on
+                cursor = database.get_bus_cursor()
+                self._thread = offload.start_thread(self._run, cursor)
+
+    def _dispatch(self, channel, origin, data):
+        for callback, include_own in list(self._subscribers.get(channel, ())):
+            if include_own or origin != self.origin:
+                try:
+                    callback(data)
+                except Exception as e:
+                    print(f"Bus subscriber error on {channel}: {e}")
+
+    def _run(self, cursor):
+        next_prune = time.monotonic() + BUS_RETENTION_SECONDS
+        while True:
+            try:
+                rows = database.read_bus_messages(cursor)
+                for row in rows:
+                    cursor = row['id']
+                    self._dispatch(row['channel'], row['origin'], pickle.loads(row['payload']))
+                if time.monotonic() >= next_prune:
+                    database.prune_bus_messages(BUS_RETENTION_SECONDS)
+                    next_prune = time.monotonic() + BUS_RETENTION_SECONDS
+                if not rows:
+                    time.sleep(self.poll)
+            except Exception as e:
+                print(f"Bus poll error: {e}")
+                time.sleep(1)
+
+class RedisBus:
+    def __init__(self, url):
+        import redis
+        self.origin = uuid.uuid4().hex
+        self._redis = redis.Redis.from_url(url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._subscribers = {}
+        self._lock = offload.Lock()
+        self._thread = None
+
+    def publish(self, channel, data):
+        self._redis.publish(f"open:{channel}", pickle.dumps((self.origin, data)))
+
+    def subscribe(self, channel, callback, include_own=False):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append((callback, include_own))
+            self._pubsub.subscribe(f"open:{channel}")
+            if self._thread is None:
+                self._thread = offload.start_thread(self._run)
+
+    def _run(self):
+        while True:
+            try:
+                for message in self._pubsub.listen():
+                    channel = message['channel'].decode().split(':', 1)[1]
+                    origin, data = pickle.loads(message['data'])
+                    for callback, include_own in list(self._subscribers.get(channel, ())):
+                        if include_own or origin != self.origin:
+                            callback(data)
+            except Exception as e:
+                print(f"Redis bus error: {e}")
+                time.sleep(1)
+
+_bus = None
+
+def get_bus():
+    """The process-wide bus for MESSAGE_QUEUE, or None when running single-process."""
+    global _bus
+    if _bus is None and MESSAGE_QUEUE:
+        if MESSAGE_QUEUE == 'sqlite':
+            _bus = SQLiteBus()
+        elif MESSAGE_QUEUE.startswith(('redis://', 'rediss://')):
+            _bus = RedisBus(MESSAGE_QUEUE)
+        else:
+            raise ValueError(f"Unsupported MESSAGE_QUEUE: {MESSAGE_QUEUE}")
+    return _bus
@@ -0,0 +1,185 @@
+"""Concurrency check: bursts of simultaneous requests through serve.py.
+
+Starts serve.py (gevent by default) on a throwaway database and fires rounds
+of requests that all start at once -- ticket positions (the first round
+builds the position index while others wait for it), branch boards, bookings,
+staff call-next and admin logins (bcrypt bounds) -- so pool threads contend
+on every shared lock. The check fails (exit code 1) if any request hangs past
+its timeout, answers 5xx (503 from a busy login is allowed), or the server
+log shows gevent primitives used from the wrong thread.
+
+    python check_concurrency.py [--threads 32] [--rounds 10] [--backlog 5000]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUEST_TIMEOUT = 15
+ADMIN_PHONE = "+998900000001"
+ADMIN_PASS = "concurrency-check"
+LOG_ERRORS = ("InvalidThreadUseError", "LoopExit", "Traceback")
+
+def seed(database, backlog, branches=2):
+    today = datetime.now().strftime('%Y-%m-%d')
+    layout, tickets = [], []
+    with database.transaction():
+        org_id = database.add_organization("Concurrency Check Clinic")
+        for b in range(branches):
+            branch_id = database.add_branch(org_id, f"Filial {b}", "Manzil")
+            service_id = database.add_service(org_id, branch_id, "Xizmat", 15)
+            layout.append((branch_id, org_id, service_id))
+            for t in range(backlog):
+                q_id = str(uuid.uuid4())
+                database.add_queue({
+                    "id": q_id, "phone": f"+99890{b:03d}{t:04d}", "number": f"C-{t:04d}", "date": today,
+                    "serviceId": service_id, "branchId": branch_id, "org_id": org_id,
+                })
+                tickets.append(q_id)
+    return layout, tickets
+
+def staff_tokens(layout):
+    import app as server
+    from flask_jwt_extended import create_access_token
+    with server.app.app_context():
+        return {branch_id: create_access_token(f"staff-{branch_id}", additional_claims={
+            "role": "staff", "org_id": org_id, "branch_id": branch_id}) for branch_id, org_id, _ in layout}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(work, port, env):
+    log = open(os.path.join(work, "server.log"), "w")
+    process = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "serve.py")], cwd=BASE_DIR,
+                               env=dict(env, PORT=str(port)), stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"server exited with {process.returncode}, see {log.name}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                return process, log.name
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit(f"server did not come up, see {log.name}")
+
+def call(port, method, path, body=None, token=None):
+    """Returns (status or error text, seconds)."""
+    started = time.perf_counter()
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=REQUEST_TIMEOUT)
+    try:
+        conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - started
+    except OSError as e:
+        return f"{type(e).__name__}: {e}", time.perf_counter() - started
+    finally:
+        conn.close()
+
+def request_for(i, rnd, layout, tickets, tokens):
+    """The i-th request of a round: mostly positions, plus every other kind of traffic."""
+    branch_id, _, service_id = layout[i % len(layout)]
+    kind = i % 8
+    if kind == 5:
+        return "GET", f"/api/board/{branch_id}", None, None
+    if kind == 6:
+        n = rnd * 1000 + i
+        return "POST", "/api/queues", {
+            "id": str(uuid.uuid4()), "phone": f"+99891{n:07d}", "number": f"B-{n:05d}",
+            "date": datetime.now().strftime('%Y-%m-%d'), "serviceId": service_id, "branchId": branch_id,
+        }, None
+    if kind == 7:
+        if rnd % 2:
+            return "POST", "/api/staff/call-next", {}, tokens[branch_id]
+        return "POST", "/api/admin/login", {"phone": ADMIN_PHONE, "password": ADMIN_PASS}, None
+    return "GET", f"/api/queue-position/{tickets[(rnd * 97 + i) % len(tickets)]}", None, None
+
+def run_round(port, rnd, threads, layout, tickets, tokens):
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+
+    def worker(i):
+        method, path, body, token = request_for(i, rnd, layout, tickets, tokens)
+        barrier.wait()
+        results[i] = (f"{method} {path.split('/')[2]}",) + call(port, method, path, body, token)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return results
+
+def check():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--backlog", type=int, default=5000, help="waiting tickets per branch")
+    parser.add_argument("--server-mode", default="gevent", choices=("gevent", "threading"))
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="concurrency_")
+    env = dict(os.environ, DB_NAME=os.path.join(work, "check.db"), JWT_SECRET_KEY="concurrency-" + "k" * 32,
+               BOT_TOKEN="", GEMINI_API_KEY="", ADMIN_PHONE=ADMIN_PHONE, ADMIN_PASS=ADMIN_PASS,
+               SERVER_MODE=args.server_mode)
+    os.environ.update(DB_NAME=env["DB_NAME"], JWT_SECRET_KEY=env["JWT_SECRET_KEY"])
+    import database
+    database.init_db()
+    layout, tickets = seed(database, args.backlog)
+    tokens = staff_tokens(layout)
+    database.close_all_connections()
+
+    port = free_port()
+    process, log_path = start_server(work, port, env)
+    failures = []
+    try:
+        for rnd in range(args.rounds):
+            started = time.perf_counter()
+            results = run_round(port, rnd, args.threads, layout, tickets, tokens)
+            slowest = max(seconds for _, _, seconds in results)
+            print(f"Round {rnd + 1}: {args.threads} requests in {time.perf_counter() - started:.2f}s "
+                  f"(slowest {slowest * 1000:.0f} ms)")
+            for name, status, seconds in results:
+                if not isinstance(status, int):
+                    failures.append(f"round {rnd + 1} {name}: {status} after {seconds:.1f}s")
+                elif status >= 500 and not (status == 503 and 'login' in name):
+                    failures.append(f"round {rnd + 1} {name}: HTTP {status}")
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    with open(log_path) as f:
+        log = f.read()
+    for marker in LOG_ERRORS:
+        if marker in log:
+            failures.append(f"server log contains {marker}, see {log_path}")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print(f"✅ {args.rounds} rounds of {args.threads} simultaneous requests, no hangs or server errors")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(check())
@@ -0,0 +1,122 @@
+"""Multi-worker check: SQLite message bus delivery, board pushes and leader fail-over.
+
+Spawns two worker processes sharing one throwaway database. Each joins the
+leader election, subscribes to the SQLite bus and holds the board of one
+branch. The check fails (exit code 1) unless a message published by one
+process reaches the other, a ticket booked in one process pushes the board
+and a ticket delta in both, exactly one process leads, and the survivor
+takes the lease after the leader is killed.
+
+    python check_multiworker.py
+"""
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+os.environ.setdefault("DB_NAME", os.path.join(tempfile.mkdtemp(prefix="multiworker_"), "multiworker.db"))
+
+LEASE_SECONDS = 2
+
+def worker(name, out, branch):
+    import bus
+    import database
+    import leader
+    elector = leader.LeaderElector(ttl=LEASE_SECONDS).start()
+    message_bus = bus.SQLiteBus()
+    message_bus.subscribe('check', lambda data: out.put((name, 'message', data)))
+    # Wired like app.py does with MESSAGE_QUEUE set
+    database.add_transition_listener(lambda before, after: message_bus.publish('queue_transitions', (before, after)))
+    message_bus.subscribe('queue_transitions', lambda change: database.apply_remote_transition(*change))
+    database.board_snapshots.start(lambda branch_id, board: out.put((name, 'board', board['next'])),
+                                   database.get_branch_board)
+    database.board_snapshots.get(branch['branch_id'])
+    database.delta_publisher.start(lambda queue_id, delta: out.put((name, 'delta', delta['status'])),
+                                   database.get_line_positions, database.get_queue_position)
+    time.sleep(0.5)
+    message_bus.publish('check', f"hello from {name}")
+    if name == 'w1':
+        database.add_queue({
+            "id": str(uuid.uuid4()), "phone": "+998900000001", "number": "M-1",
+            "date": datetime.now().strftime('%Y-%m-%d'), **branch,
+        })
+    while True:
+        out.put((name, 'leader', elector.is_leader))
+        time.sleep(0.2)
+
+def _collect(out, seconds):
+    events = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            events.append(out.get(timeout=0.1) + (time.monotonic(),))
+        except queue.Empty:
+            pass
+    return events
+
+def check():
+    import database
+    database.init_db()
+    org_id = database.add_organization("Multi-worker Check")
+    branch_id = database.add_branch(org_id, "Filial", "Manzil")
+    branch = {"branch_id": branch_id, "branchId": branch_id, "org_id": org_id,
+              "serviceId": database.add_service(org_id, branch_id, "Xizmat", 15)}
+    database.close_all_connections()
+    ctx = multiprocessing.get_context('spawn')
+    out = ctx.Queue()
+    procs = {name: ctx.Process(target=worker, args=(name, out, branch), daemon=True) for name in ('w1', 'w2')}
+    for p in procs.values():
+        p.start()
+
+    failures = []
+    events = _collect(out, 3)
+    messages = {(name, data) for name, kind, data, _ in events if kind == 'message'}
+    if messages != {('w1', 'hello from w2'), ('w2', 'hello from w1')}:
+        failures.append(f"bus delivery: {sorted(messages)}")
+    latest = {}
+    for name, kind, data, _ in events:
+        if kind == 'leader':
+            latest[name] = data
+    leaders = [name for name, is_leader in latest.items() if is_leader]
+    print(f"Bus messages: {sorted(messages)}")
+    boards = sorted({name for name, kind, data, _ in events if kind == 'board' and data})
+    print(f"Board pushed by: {boards}")
+    if boards != ['w1', 'w2']:
+        failures.append(f"board push after a booking in w1: {boards}")
+    deltas = sorted({name for name, kind, data, _ in events if kind == 'delta' and data == 'waiting'})
+    print(f"Ticket delta pushed by: {deltas}")
+    if deltas != ['w1', 'w2']:
+        failures.append(f"ticket delta after a booking in w1: {deltas}")
+    print(f"Leaders before kill: {leaders}")
+    if len(leaders) != 1:
+        failures.append(f"expected one leader, got {leaders}")
+    else:
+        dead = leaders[0]
+        survivor = 'w2' if dead == 'w1' else 'w1'
+        procs[dead].kill()
+        killed_at = time.monotonic()
+        took_over = None
+        for name, kind, data, seen_at in _collect(out, LEASE_SECONDS * 3):
+            if name == survivor and kind == 'leader' and data and took_over is None:
+                took_over = seen_at - killed_at
+        print(f"Killed {dead}; {survivor} took over after {took_over:.1f}s" if took_over is not None
+              else f"Killed {dead}; {survivor} never took over")
+        if took_over is None:
+            failures.append("no fail-over after the leader died")
+
+    for p in procs.values():
+        if p.is_alive():
+            p.kill()
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ bus crosses processes, boards and deltas pushed in every worker, single leader, fail-over works")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(check())
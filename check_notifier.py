@@ -0,0 +1,133 @@
+"""End-to-end check of the Telegram outbox against a local stub Bot API.
+
+Starts an HTTP server that stands in for api.telegram.org, queues messages
+for chats that succeed, fail transiently, hit flood control or are blocked,
+and fails (exit code 1) unless every message ends in the expected state and
+the global / per-chat rate limits were respected.
+
+    python check_notifier.py
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="notifier_"), "notifier.db")
+
+import database
+import notifier
+
+GLOBAL_RATE = 20
+CHAT_RATE = 4
+
+class StubTelegram(BaseHTTPRequestHandler):
+    calls = []            # (monotonic time, chat_id, text)
+    seen = {}             # chat_id -> requests received
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        chat_id = str(body['chat_id'])
+        with self.lock:
+            self.seen[chat_id] = self.seen.get(chat_id, 0) + 1
+            nth = self.seen[chat_id]
+            self.calls.append((time.monotonic(), chat_id, body.get('text')))
+        if chat_id == 'blocked':
+            self._reply(403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"})
+        elif chat_id == 'flaky' and nth <= 2:
+            self._reply(502, {"ok": False, "error_code": 502, "description": "Bad Gateway"})
+        elif chat_id == 'down':
+            self._reply(500, {"ok": False, "error_code": 500, "description": "Internal Server Error"})
+        elif chat_id == 'flood' and nth == 1:
+            self._reply(429, {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                              "parameters": {"retry_after": 1}})
+        else:
+            self._reply(200, {"ok": True, "result": {"message_id": nth}})
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def _wait_for_drain(timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = database.get_outbox_stats()
+        if not stats.get('pending') and not stats.get('sending'):
+            return stats
+        time.sleep(0.1)
+    return database.get_outbox_stats()
+
+def _statuses():
+    conn = database.get_db_connection()
+    rows = conn.execute('SELECT chat_id, status, attempts FROM telegram_outbox').fetchall()
+    return [dict(r) for r in rows]
+
+def check():
+    database.init_db()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubTelegram)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    failures = []
+    started = time.perf_counter()
+    fanout = 40
+    for i in range(fanout):
+        notifier.send_message(f"chat{i}", f"fan-out {i}")
+    for i in range(3):
+        notifier.send_message("burst", f"burst {i}", parse_mode='HTML')
+    for chat_id in ('flaky', 'blocked', 'flood', 'down'):
+        notifier.send_message(chat_id, chat_id)
+    enqueue_ms = (time.perf_counter() - started) * 1000
+
+    notifier.start("TEST:TOKEN", api_base=f"http://127.0.0.1:{server.server_port}",
+                    workers=4, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE,
+                    max_attempts=3, backoff_base=0.05, poll_interval=0.1)
+    stats = _wait_for_drain(timeout=30)
+    notifier.stop()
+    server.shutdown()
+
+    by_chat = {}
+    for row in _statuses():
+        by_chat.setdefault(row['chat_id'], []).append(row)
+    expect = {'flaky': ('sent', 3), 'blocked': ('dead', 1), 'flood': ('sent', 1), 'down': ('dead', 3)}
+    for chat_id, (status, attempts) in expect.items():
+        row = by_chat[chat_id][0]
+        if (row['status'], row['attempts']) != (status, attempts):
+            failures.append(f"{chat_id}: got {row['status']}/{row['attempts']} expected {status}/{attempts}")
+    fan_rows = [r for k, rows in by_chat.items() if k.startswith('chat') or k == 'burst' for r in rows]
+    if any(r['status'] != 'sent' for r in fan_rows):
+        failures.append("not every regular message was delivered")
+
+    # Global bucket: starts full (capacity = rate), then refills at GLOBAL_RATE/s
+    calls = sorted(StubTelegram.calls)
+    span = calls[-1][0] - calls[0][0]
+    min_span = (len(calls) - GLOBAL_RATE) / GLOBAL_RATE
+    if span < min_span * 0.9:
+        failures.append(f"{len(calls)} calls in {span:.2f}s exceeds the global rate of {GLOBAL_RATE}/s")
+    burst = [t for t, chat_id, _ in calls if chat_id == 'burst']
+    gaps = [b - a for a, b in zip(burst, burst[1:])]
+    if gaps and min(gaps) < (1 / CHAT_RATE) * 0.9:
+        failures.append(f"per-chat gaps {[round(g, 2) for g in gaps]} below 1/{CHAT_RATE}s")
+
+    print(f"Queued {sum(len(r) for r in by_chat.values())} messages in {enqueue_ms:.1f} ms")
+    print(f"Outbox after drain: {stats}")
+    print(f"Stub received {len(calls)} calls over {span:.2f}s; burst gaps {[round(g, 2) for g in gaps]}")
+    database.close_all_connections()
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ outbox delivered, retried, dead-lettered and rate limited as expected")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(check())
@@ -0,0 +1,250 @@
+"""EXPLAIN QUERY PLAN check for the queries in database.py.
+
+Runs every query helper against a throwaway database, captures the SQL that
+actually reaches SQLite and fails (exit code 1) if a filtered statement falls
+back to a full table SCAN, or does not use the index EXPECTED_INDEXES lists
+for it (any SEARCH is not enough: a SEARCH on a low-selectivity prefix such as
+status=? still reads most of the table). A new filtered statement needs an
+entry there.
+
+    python check_query_plans.py
+"""
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="qplan_"), "qplan.db")
+
+import database
+from query_profiler import normalize_sql
+
+def _seed():
+    org_id = database.add_organization("Plan Check")
+    branch_id = database.add_branch(org_id, "Main", "Street 1")
+    svc_id = database.add_service(org_id, branch_id, "Terapevt", 15)
+    today = datetime.now().strftime('%Y-%m-%d')
+    database.add_user("+998901112233", "1001", "staff", "staff", "hash", org_id, branch_id)
+    database.add_queue({
+        "id": "plan_q1", "phone": "+998901112233", "number": "A-001",
+        "date": today, "time": "10:00", "staffId": "staff_1",
+        "serviceId": svc_id, "branchId": branch_id, "org_id": org_id
+    })
+    return org_id, branch_id, svc_id, today
+
+def _workload(org_id, branch_id, svc_id, today):
+    phone = "+998901112233"
+    database.get_org_services(org_id)
+    database.get_branches(org_id)
+    database.get_branches()
+    database.get_organizations()
+    database.get_booked_slots(today, branch_id)
+    database.get_booked_slots(today, branch_id, "staff_1")
+    database.get_queue("plan_q1")
+    database.get_queues_by_phone(phone)
+    database.get_queues_by_phone(phone, today)
+    database.get_patient_history(phone)
+    database.get_todays_queues()
+    database.get_todays_queues(org_id)
+    list(database.iter_queues_page())
+    list(database.iter_queues_page(org_id=org_id, cursor=(today + "T23:59:59", "zzz")))
+    list(database.iter_queues_page(org_id=org_id, status="waiting", date_from=today, date_to=today))
+    list(database.iter_queues_page(branch_id=branch_id, service_id=svc_id, limit=1))
+    # Admin dashboard: ticket being served, next waiting ticket
+    list(database.iter_queues_page(org_id=org_id, status="serving", limit=1))
+    list(database.iter_queues_page(org_id=org_id, status="waiting", limit=1, oldest_first=True))
+    database.get_queue_position("plan_q1")
+    database.get_branch_board(branch_id)
+    database.get_user(phone)
+    database.save_session_uid("plan_uid", "1001")
+    database.update_uid_with_phone("plan_uid", phone)
+    database.save_phone_verification(phone, "1001", "staff")
+    database.get_verification_by_uid("plan_uid")
+    database.find_verification_by_phone(phone)
+    database.get_admin_user(phone)
+    database.check_system_admin_exists()
+    database.get_admin_stats()
+    database.get_admin_stats(org_id)
+    database.get_staff_loads()
+    database.get_analytics_data()
+    database.get_analytics_data(org_id)
+    database.get_analytics_data(org_id, "2025-01-01", "2025-12-31")
+    database.get_analytics_data(None, "2025-01-15", today, branch_id)
+    database.add_rating("plan_q1", 5, "ok")
+    database.get_average_ratings()
+    database.get_average_ratings(org_id)
+    database.get_recent_feedback()
+    database.get_recent_feedback(org_id)
+    database.update_queue_notes("plan_q1", "notes")
+    database.update_notification_level("plan_q1", 1)
+    database.get_reminder_target("plan_q1")
+    database.ensure_reminders()
+    database.transfer_queue("plan_q1", svc_id)
+    database.call_next_in_branch(branch_id)
+    database.transfer_queue("plan_q1", svc_id)
+    database.call_next_in_org(org_id)
+    database.transfer_queue("plan_q1", svc_id)
+    database.call_next_in_org()
+    database.update_queue_status("plan_q1", "completed")
+    database.update_organization(org_id, "Plan Check 2")
+    database.add_queue({
+        "id": "plan_q2", "phone": phone, "number": "A-002",
+        "date": today, "time": "10:00", "staffId": "staff_1",
+        "serviceId": svc_id, "branchId": branch_id, "org_id": org_id
+    })
+    database.archive_finished_queues(older_than_days=0, pause=0)
+    database.get_queue("plan_q1")
+    database.get_patient_history(phone)
+    database.get_recent_feedback(org_id)
+    database.delete_service(svc_id, org_id)
+    outbox_id = database.enqueue_outbox("1001", {"chat_id": "1001", "text": "hi"})
+    database.claim_outbox()
+    database.retry_outbox(outbox_id, 0, "503")
+    database.claim_outbox()
+    database.mark_outbox_sent(outbox_id)
+    database.dead_letter_outbox(outbox_id, "403")
+    database.prune_outbox()
+    database.publish_bus_message("queue_transitions", "plan", b"x")
+    database.read_bus_messages(database.get_bus_cursor() - 1)
+    database.prune_bus_messages()
+    database.acquire_lease("background-jobs", "plan", 30)
+    database.release_lease("background-jobs", "plan")
+
+CHECKED_VERBS = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+# Statement shape (query_profiler.normalize_sql; first match wins) -> indexes
+# its plan must use. 'PRIMARY KEY' stands for a rowid or WITHOUT ROWID key;
+# statements over queues_all name one index per half of the view.
+EXPECTED_INDEXES = [
+    # Catalog
+    (r'^SELECT \* FROM services WHERE org_id = \?$', ['idx_services_org']),
+    (r'^SELECT \* FROM branches WHERE org_id = \?$', ['idx_branches_org']),
+    (r'FROM branches b LEFT JOIN organizations o .* WHERE b\.id = \?$',
+     ['sqlite_autoindex_branches_1', 'sqlite_autoindex_organizations_1']),
+    (r'^(SELECT .* FROM|DELETE FROM) services WHERE id = \?', ['sqlite_autoindex_services_1']),
+    (r'^UPDATE organizations SET .* WHERE id = \?$', ['sqlite_autoindex_organizations_1']),
+    # Users and verification sessions
+    (r'^SELECT \* FROM users WHERE phone = \?', ['sqlite_autoindex_users_1']),
+    (r'^SELECT COUNT\(\*\) FROM users WHERE role = ', ['idx_users_role']),
+    (r'^SELECT COUNT\(\*\) FROM users WHERE org_id = \?$', ['idx_users_org']),
+    (r'^DELETE FROM verifications WHERE expires_at < \?$', ['idx_verifications_expires']),
+    (r'verifications .*WHERE key = \?', ['sqlite_autoindex_verifications_1']),
+    (r'FROM verifications WHERE \(key = \? OR phone = \?\)',
+     ['sqlite_autoindex_verifications_1', 'idx_verifications_phone']),
+    # Single tickets
+    (r'^(SELECT .* FROM|UPDATE|DELETE FROM) queues (SET .* )?WHERE id (= \?|IN)', ['sqlite_autoindex_queues_1']),
+    (r'FROM queues q JOIN users u ON u\.phone = q\.phone WHERE q\.id = \?$',
+     ['sqlite_autoindex_queues_1', 'sqlite_autoindex_users_1']),
+    (r'^SELECT \* FROM queues_archive WHERE id = \?$', ['idx_queues_archive_id']),
+    (r'FROM queues_all WHERE id = \?$', ['sqlite_autoindex_queues_1', 'idx_queues_archive_id']),
+    # Patients
+    (r'^SELECT \* FROM queues WHERE phone = \?', ['idx_queues_phone_date']),
+    (r'FROM queues_all q LEFT JOIN services s .* WHERE q\.phone = \? AND q\.status = \?',
+     ['idx_queues_phone_status_created', 'idx_queues_archive_phone_status_created']),
+    # Branch days, boards and call-next
+    (r'^SELECT time FROM queues WHERE date = \? AND branch_id = \?', ['idx_queues_branch_date']),
+    (r'WHERE q\.branch_id = \? AND q\.status IN \(\.\.\.\) AND q\.date = \?', ['idx_queues_branch_date']),
+    (r'WHERE (q\.)?branch_id = \? AND (q\.)?status = \? ORDER BY (q\.)?created_at', ['idx_queues_branch_status_created']),
+    (r'^SELECT id FROM queues WHERE date = \? AND time = \? AND staff_id = \?', ['idx_queues_staff_date_time']),
+    (r'^SELECT \* FROM queues WHERE org_id = \? AND status = \? ORDER BY created_at', ['idx_queues_org_status_created_id']),
+    (r'^SELECT \* FROM queues WHERE status = \? ORDER BY created_at', ['idx_queues_status_created_id']),
+    # Today's tickets and the waiting set
+    (r'^SELECT \* FROM queues WHERE date = \? AND org_id = \? UNION ALL',
+     ['idx_queues_date_org_status', 'idx_queues_org_status_created_id']),
+    (r'^SELECT \* FROM queues WHERE date = \? UNION ALL', ['idx_queues_date_org_status', 'idx_queues_status_created_id']),
+    (r'^SELECT id, branch_id, service_id, created_at FROM queues WHERE status = \?$', ['idx_queues_status_created_id']),
+    (r'^SELECT id, date, time, notification_level FROM queues WHERE status = \? AND date >= \?',
+     ['idx_queues_status_created_id']),
+    (r'^SELECT id FROM queues WHERE status IN \(\.\.\.\) AND created_at < \?', ['idx_queues_status_created_id']),
+    # Admin listing (keyset pages)
+    (r'WHERE q\.org_id = \? AND \(q\.created_at, q\.id\) < \(\?, \?\)', ['idx_queues_org_created_id']),
+    (r'WHERE q\.org_id = \? AND q\.status = \?', ['idx_queues_org_status_created_id']),
+    (r'WHERE q\.branch_id = \? AND q\.service_id = \?', ['idx_queues_service_branch_status_created']),
+    # Counters and rollups
+    (r'^SELECT .* FROM daily_counters WHERE day = \? AND scope = \?', ['PRIMARY KEY']),
+    (r'FROM analytics_(hourly|daily|hour_profile) WHERE .* AND org_id = \?', ['PRIMARY KEY']),
+    (r'FROM analytics_hourly WHERE .* AND branch_id = \?', ['idx_analytics_hourly_branch_hour']),
+    (r'FROM analytics_daily WHERE .* AND branch_id = \?', ['idx_analytics_daily_branch_day']),
+    (r'FROM analytics_hour_profile WHERE .* AND branch_id = \?', ['idx_analytics_hour_profile_branch_month']),
+    (r'FROM analytics_hourly WHERE hour BETWEEN \? AND \? GROUP BY', ['idx_analytics_hourly_hour']),
+    (r'FROM analytics_daily WHERE day BETWEEN \? AND \? GROUP BY', ['idx_analytics_daily_day']),
+    # Ratings
+    (r'FROM ratings r JOIN services s .* WHERE r\.org_id = \?', ['idx_ratings_org_created', 'sqlite_autoindex_services_1']),
+    (r'FROM ratings r JOIN queues_all q .* WHERE r\.org_id = \?',
+     ['idx_ratings_org_created', 'sqlite_autoindex_queues_1', 'idx_queues_archive_id']),
+    # Outbox, bus and leases
+    (r'telegram_outbox WHERE status (IN \(\.\.\.\)|= \?) AND next_attempt_at', ['idx_telegram_outbox_status_next']),
+    (r'^UPDATE telegram_outbox SET .* WHERE id (= \?|IN)', ['PRIMARY KEY']),
+    (r'FROM bus_messages WHERE id > \?', ['PRIMARY KEY']),
+    (r'^DELETE FROM bus_messages WHERE created_at < \?$', ['idx_bus_messages_created']),
+    (r'leases WHERE name = \?', ['sqlite_autoindex_leases_1']),
+]
+
+def _has_filter(sql):
+    return re.search(r'\bWHERE\b', sql, re.IGNORECASE) is not None
+
+def _expected_indexes(sql):
+    shape = normalize_sql(sql)
+    for pattern, indexes in EXPECTED_INDEXES:
+        if re.search(pattern, shape):
+            return indexes
+    return None
+
+def _uses_index(plan, index):
+    if index == 'PRIMARY KEY':
+        return any('PRIMARY KEY' in step for step in plan)
+    return any(re.search(rf'USING (COVERING )?INDEX {re.escape(index)}\b', step) for step in plan)
+
+def check():
+    database.init_db()
+    seed = _seed()
+
+    statements = []
+    conn = database.get_db_connection()
+    conn.set_trace_callback(statements.append)
+    try:
+        _workload(*seed)
+    finally:
+        conn.set_trace_callback(None)
+
+    failures = []
+    seen = set()
+    for sql in statements:
+        sql = sql.strip()
+        if sql in seen or not sql.upper().startswith(CHECKED_VERBS):
+            continue
+        seen.add(sql)
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()]
+        # Scanning a materialized subquery result is fine; scanning a table is not
+        derived = {step.split()[1] for step in plan if step.startswith(('MATERIALIZE', 'CO-ROUTINE'))}
+        scans = [step for step in plan if step.startswith('SCAN') and 'CONSTANT ROW' not in step
+                 and step.split()[1] not in derived and not step.startswith('SCAN (subquery')]
+        status = 'ok'
+        if _has_filter(sql):
+            expected = _expected_indexes(sql)
+            if scans:
+                status = 'SCAN'
+            elif expected is None:
+                status = 'no expected index'
+            else:
+                missing = [index for index in expected if not _uses_index(plan, index)]
+                if missing:
+                    status = f"missing {', '.join(missing)}"
+            if status != 'ok':
+                failures.append((sql, plan))
+        elif scans:
+            status = 'full (unfiltered)'
+        print(f"[{status}] {' '.join(sql.split())[:110]}")
+        for step in plan:
+            print(f"        {step}")
+
+    database.close_all_connections()
+    if failures:
+        print(f"\n❌ {len(failures)} filtered statement(s) scan or miss their expected index")
+        return 1
+    print(f"\n✅ {len(seen)} statements checked, every filtered one uses its expected index")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(check())
@@ -5,6 +5,10 @@ def clear_db():
     try:
         conn.execute('DELETE FROM queues')
         conn.commit()
+        database.position_index.reset()
+        database.reminder_scheduler.reset()
+        database.board_snapshots.reset()
+        database.response_cache.clear()
         print("✅ Database cleared successfully!")
     except Exception as e:
         print(f"❌ Error clearing database: {e}")
@@ -1,118 +1,276 @@
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+import contextvars
 import json
 import os
+import threading
+import time
+import hashlib
+import weakref
 from dotenv import load_dotenv
+from queue_index import position_index
+from reminders import reminder_scheduler
+from ticket_deltas import delta_publisher
+from board import board_snapshots
+from microcache import response_cache
+import offload
 
 load_dotenv()
 
 # Database configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_NAME = os.path.join(BASE_DIR, "queue_system.db")
+DB_NAME = os.getenv("DB_NAME") or os.path.join(BASE_DIR, "queue_system.db")
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+# --- Query Accounting ---
+# While a QueryStats is installed (track_queries(), e.g. for one HTTP request)
+# every statement run through a pooled connection or its cursors is counted
+# and timed into it. With none installed the only cost is a context lookup.
+
+class QueryStats:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def record(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+
+_query_stats = contextvars.ContextVar('query_stats', default=None)
+
+def track_queries(stats=None):
+    """Install stats (a new QueryStats by default) for the current context and return it."""
+    stats = stats or QueryStats()
+    _query_stats.set(stats)
+    return stats
+
+def untrack_queries():
+    _query_stats.set(None)
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        stats = _query_stats.get()
+        if stats is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            stats.record(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        stats = _query_stats.get()
+        if stats is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            stats.record(sql, time.perf_counter() - started)
+
+# --- Connection Management ---
+# Connections are reused per thread (per greenlet when gevent/eventlet patch
+# threading) instead of being opened and torn down on every call. When a
+# thread or greenlet exits, its thread-local (and the _Lease in it) is
+# dropped and the connection goes back to an idle pool for the next one
+# instead of being closed: SQLite keeps the descriptor of a database file
+# closed while other connections of the process hold locks on it open until
+# they all let go, which on a busy server is never. The pool therefore grows
+# to the peak number of concurrent users, not with their total.
+DB_POOLING = os.getenv("DB_POOLING", "1") != "0"
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+
+_local = threading.local()
+_all_connections = weakref.WeakSet()
+_idle_connections = []  # list.append/pop only: _release_connection may run from the garbage collector
+_all_connections_lock = offload.Lock()
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that survives close() so the thread can reuse it.
+
+    Inside a transaction() block commit() and close() are deferred to the
+    outermost block, so helpers such as add_queue can be composed freely.
+    """
+    _session_depth = 0
+    _pooled = True
+
+    # Statements run through TimedCursor so they show up in QueryStats
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if self._session_depth:
+            return
+        super().commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+
+    def rollback(self):
+        self._after_commit = []
+        super().rollback()
+
+    def close(self):
+        if not self._pooled:
+            return super().close()
+        if self._session_depth:
+            return
+        # Never hand a half-finished write transaction to the next caller
+        if self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        self._closed = True
+        super().close()
+
+def _configure_connection(conn):
     conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+def _open_connection(pooled):
+    conn = sqlite3.connect(
+        DB_NAME,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000.0,
+        cached_statements=DB_STATEMENT_CACHE,
+        check_same_thread=False,
+        factory=PooledConnection
+    )
+    conn._pooled = pooled
+    conn._after_commit = []
+    conn._closed = False
+    conn._pid = os.getpid()
+    conn._db_name = DB_NAME
+    _configure_connection(conn)
     return conn
 
-def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Organizations table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS organizations (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            license_status TEXT DEFAULT 'active',
-            created_at TEXT
-        )
-    ''')
-
-    # Branches table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS branches (
-            id TEXT PRIMARY KEY,
-            org_id TEXT,
-            name TEXT NOT NULL,
-            address TEXT,
-            FOREIGN KEY (org_id) REFERENCES organizations(id)
-        )
-    ''')
-
-    # queues table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS queues (
-            id TEXT PRIMARY KEY,
-            phone TEXT NOT NULL,
-            number TEXT,
-            status TEXT DEFAULT 'waiting',
-            date TEXT,
-            time TEXT,
-            staff_id TEXT,
-            service_id TEXT,
-            branch_id TEXT,
-            org_id TEXT,
-            created_at TEXT,
-            last_notified TEXT,
-            notification_level INTEGER DEFAULT 0,
-            notes TEXT, -- Medical notes or results
-            parent_queue_id TEXT, -- For tracking referrals/transfers
-            FOREIGN KEY (org_id) REFERENCES organizations(id)
-        )
-    ''')
-    
-    # users table (Roles: system_admin, org_admin, staff, user)
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            phone TEXT PRIMARY KEY,
-            user_id TEXT,
-            username TEXT,
-            role TEXT DEFAULT 'user',
-            org_id TEXT,
-            branch_id TEXT,
-            password_hash TEXT,
-            created_at TEXT,
-            FOREIGN KEY (org_id) REFERENCES organizations(id)
-        )
-    ''')
-    
-    # Simple migration helper for existing structures
-    try:
-        c.execute('ALTER TABLE users ADD COLUMN role TEXT DEFAULT "user"')
-        c.execute('ALTER TABLE users ADD COLUMN org_id TEXT')
-        c.execute('ALTER TABLE users ADD COLUMN branch_id TEXT')
-        c.execute('ALTER TABLE users ADD COLUMN password_hash TEXT')
-    except: pass
+class _Lease:
+    """Lives in the owner's thread-local; hands the connection back when the owner is gone."""
+    __slots__ = ('__weakref__',)
 
-    try:
-        c.execute('ALTER TABLE queues ADD COLUMN org_id TEXT')
-    except: pass
+    def __init__(self, conn):
+        weakref.finalize(self, _release_connection, conn)
 
+def _release_connection(conn):
+    # A forked child must leave the parent's handle alone
+    if conn._closed or conn._pid != os.getpid():
+        return
     try:
-        c.execute('ALTER TABLE queues ADD COLUMN notes TEXT')
-        c.execute('ALTER TABLE queues ADD COLUMN parent_queue_id TEXT')
-    except: pass
-
-    # services table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS services (
-            id TEXT PRIMARY KEY,
-            org_id TEXT,
-            name_uz TEXT,
-            name_ru TEXT,
-            name_en TEXT,
-            branch_id TEXT,
-            estimated_duration INTEGER DEFAULT 15,
-            FOREIGN KEY (org_id) REFERENCES organizations(id)
-        )
-    ''')
+        conn._session_depth = 0
+        if conn.in_transaction:
+            conn.rollback()
+        if conn._db_name == DB_NAME:
+            _idle_connections.append(conn)
+        else:
+            conn.really_close()
+    except sqlite3.Error:
+        pass
+
+def _reuse_idle_connection():
+    while True:
+        try:
+            conn = _idle_connections.pop()
+        except IndexError:
+            return None
+        if not conn._closed and conn._pid == os.getpid() and conn._db_name == DB_NAME:
+            return conn
+
+def get_db_connection():
+    # Helpers called inside transaction() share its connection
+    session = getattr(_local, 'session', None)
+    if session is not None:
+        return session
+    if not DB_POOLING:
+        return _open_connection(pooled=False)
+
+    conn = getattr(_local, 'conn', None)
+    # A forked worker must not share the parent's sqlite handle
+    if conn is not None and (conn._closed or conn._pid != os.getpid() or conn._db_name != DB_NAME):
+        _local.conn = _local.lease = conn = None
+    if conn is None:
+        conn = _reuse_idle_connection()
+        if conn is None:
+            conn = _open_connection(pooled=True)
+            with _all_connections_lock:
+                _all_connections.add(conn)
+        _local.conn = conn
+        _local.lease = _Lease(conn)
+    return conn
+
+@contextmanager
+def transaction(immediate=True):
+    """Run several statements on one connection as a single transaction.
+
+        with database.transaction() as conn:
+            conn.execute(...)
+            database.update_queue_status(q_id, 'waiting')
+
+    Database helpers called inside the block share the same connection and
+    their commit()/close() calls are deferred until the block exits.
+    """
+    conn = get_db_connection()
+    outermost = conn._session_depth == 0
+    if outermost:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        _local.session = conn
+    conn._session_depth += 1
     try:
-        c.execute('ALTER TABLE services ADD COLUMN org_id TEXT')
-    except: pass
+        yield conn
+    except Exception:
+        conn._session_depth -= 1
+        if outermost:
+            _local.session = None
+            conn.rollback()
+            conn.close()
+        raise
+    else:
+        conn._session_depth -= 1
+        if outermost:
+            _local.session = None
+            conn.commit()
+            conn.close()
 
-    conn.commit()
-    conn.close()
+def after_commit(conn, callback):
+    """Run callback once conn's pending changes are committed; dropped on rollback."""
+    if conn._session_depth or conn.in_transaction:
+        conn._after_commit.append(callback)
+    else:
+        callback()
+
+def close_all_connections():
+    """Really close every pooled connection (tests, shutdown, after fork)."""
+    with _all_connections_lock:
+        conns = list(_all_connections)
+        _all_connections.clear()
+        del _idle_connections[:]
+    for conn in conns:
+        try:
+            conn.really_close()
+        except Exception:
+            pass
+    _local.conn = None
+    _local.lease = None
+    _local.session = None
+
+def init_db():
+    # Schema lives in migrations.py as ordered, versioned steps
+    import migrations
+    migrations.migrate()
     print("Database initialized with Multi-Tenant schema")
 
 # --- Organization Management ---
@@ -144,6 +302,8 @@ def add_service(org_id, branch_id, name_uz, duration):
             VALUES (?, ?, ?, ?, ?)
         ''', (svc_id, org_id, branch_id, name_uz, duration))
         conn.commit()
+        _record_duration(conn, svc_id, duration)
+        _touch_scopes(conn, {'org_id': org_id, 'branch_id': branch_id, 'service_id': svc_id})
         return svc_id
     finally:
         conn.close()
@@ -151,11 +311,13 @@ def add_service(org_id, branch_id, name_uz, duration):
 def delete_service(service_id, org_id):
     conn = get_db_connection()
     # Security: Ensure service belongs to org
-    svc = conn.execute('SELECT id FROM services WHERE id = ? AND org_id = ?', (service_id, org_id)).fetchone()
+    svc = conn.execute('SELECT id, branch_id FROM services WHERE id = ? AND org_id = ?', (service_id, org_id)).fetchone()
     if not svc: return False
     
     conn.execute('DELETE FROM services WHERE id = ?', (service_id,))
     conn.commit()
+    _record_duration(conn, service_id, None)
+    _touch_scopes(conn, {'org_id': org_id, 'branch_id': svc['branch_id'], 'service_id': service_id})
     conn.close()
     return True
 
@@ -187,6 +349,7 @@ def add_branch(org_id, name, address):
         conn.execute('INSERT INTO branches (id, org_id, name, address) VALUES (?, ?, ?, ?)', 
                      (branch_id, org_id, name, address))
         conn.commit()
+        _touch_scopes(conn, {'org_id': org_id, 'branch_id': branch_id, 'catalog': ''})
         return branch_id
     finally:
         conn.close()
@@ -227,27 +390,40 @@ def add_queue(queue_data):
         # Generate internal ID if not provided
         import uuid
         internal_id = queue_data.get('id') or str(uuid.uuid4())
+        status = queue_data.get('status', 'waiting')
+        created_at = queue_data.get('created_at', datetime.now().isoformat())
+        branch_id = queue_data.get('branchId')
+        org_id = queue_data.get('org_id') or queue_data.get('orgId')
+        if not org_id and branch_id:
+            # Tickets from the public booking page only carry the branch
+            branch = conn.execute('SELECT org_id FROM branches WHERE id = ?', (branch_id,)).fetchone()
+            org_id = branch['org_id'] if branch else None
         
         c.execute('''
-            INSERT INTO queues (id, phone, number, status, date, time, staff_id, service_id, branch_id, created_at, last_notified, notification_level, notes, parent_queue_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO queues (id, phone, number, status, date, time, staff_id, service_id, branch_id, org_id, created_at, last_notified, notification_level, notes, parent_queue_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             internal_id,
             normalize_phone(queue_data['phone']),
             queue_data['number'],
-            queue_data.get('status', 'waiting'),
+            status,
             date,
             time,
             staff_id,
             queue_data.get('serviceId'),
-            queue_data.get('branchId'),
-            queue_data.get('created_at', datetime.now().isoformat()),
+            branch_id,
+            org_id,
+            created_at,
             queue_data.get('last_notified', datetime.now().isoformat()),
             0, # notification_level
-            0, # placeholder for something else if needed
             queue_data.get('notes'),
             queue_data.get('parent_queue_id')
         ))
+        _record_transition(conn, None, {
+            "id": internal_id, "status": status, "date": date, "org_id": org_id,
+            "branch_id": branch_id, "service_id": queue_data.get('serviceId'),
+            "staff_id": staff_id, "created_at": created_at, "time": time, "notification_level": 0
+        })
         conn.commit()
         return True
     except Exception as e:
@@ -271,6 +447,9 @@ def get_booked_slots(date, branch_id, staff_id=None):
 def get_queue(queue_id):
     conn = get_db_connection()
     queue = conn.execute('SELECT * FROM queues WHERE id = ?', (queue_id,)).fetchone()
+    if not queue:
+        # Old tickets may already have been moved to cold storage
+        queue = conn.execute('SELECT * FROM queues_archive WHERE id = ?', (queue_id,)).fetchone()
     conn.close()
     if queue:
         return dict(queue)
@@ -292,10 +471,10 @@ def get_queues_by_phone(phone, date=None):
 def get_patient_history(phone):
     phone = normalize_phone(phone)
     conn = get_db_connection()
-    # Join with services to get service name
+    # Join with services to get service name (live and archived visits)
     queues = conn.execute('''
         SELECT q.*, s.name_uz as service_name 
-        FROM queues q
+        FROM queues_all q
         LEFT JOIN services s ON q.service_id = s.id
         WHERE q.phone = ? AND q.status = 'completed'
         ORDER BY q.created_at DESC
@@ -306,41 +485,299 @@ def get_patient_history(phone):
 def get_todays_queues(org_id=None):
     today = datetime.now().strftime('%Y-%m-%d')
     conn = get_db_connection()
-    query = 'SELECT * FROM queues WHERE (date = ? OR status = "waiting")'
-    params = [today]
-    if org_id:
-        query += ' AND org_id = ?'
-        params.append(org_id)
-        
-    queues = conn.execute(query, params).fetchall()
+    # Two indexed halves instead of one OR, which SQLite can only serve from
+    # the org's whole history: today's tickets by (date, org_id), plus older
+    # tickets still waiting by (org_id, status)
+    org_filter = ' AND org_id = ?' if org_id else ''
+    params = [today, org_id] if org_id else [today]
+    query = (f'SELECT * FROM queues WHERE date = ?{org_filter} '
+             f'UNION ALL SELECT * FROM queues WHERE status = "waiting" AND date IS NOT ?{org_filter}')
+    queues = conn.execute(query, params * 2).fetchall()
     conn.close()
     return {q['id']: dict(q) for q in queues} 
 
-def get_all_queues_list():
+QUEUE_PAGE_DEFAULT = 200
+QUEUE_PAGE_MAX = 1000
+
+def encode_queue_cursor(created_at, queue_id):
+    import base64
+    return base64.urlsafe_b64encode(json.dumps([created_at, queue_id]).encode()).decode()
+
+def decode_queue_cursor(cursor):
+    import base64
+    try:
+        created_at, queue_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return created_at, queue_id
+    except (ValueError, TypeError):
+        return None
+
+_queue_json_entry = None
+
+def _queue_json_entry_sql(conn):
+    """SQL for a '"<id>":{<queue row + service>}' JSON map entry, or None without JSON1."""
+    global _queue_json_entry
+    if _queue_json_entry is None:
+        try:
+            conn.execute("SELECT json_object('a', 1)")
+        except sqlite3.OperationalError:
+            _queue_json_entry = ''
+        else:
+            columns = [row['name'] for row in conn.execute('PRAGMA table_info(queues)')]
+            pairs = ', '.join(f"'{c}', q.{c}" for c in columns)
+            _queue_json_entry = (f"json_quote(q.id) || ':' || "
+                                 f"json_object({pairs}, 'service', COALESCE(s.name_uz, 'Umumiy'))")
+    return _queue_json_entry or None
+
+def iter_queues_page(org_id=None, status=None, date_from=None, date_to=None,
+                     branch_id=None, service_id=None, cursor=None, limit=QUEUE_PAGE_DEFAULT,
+                     encoded=False, oldest_first=False):
+    """Stream one page of queues, newest first (oldest first with oldest_first),
+    keyset-paginated on (created_at, id).
+
+    Yields row dicts (with the service name joined in as 'service') and finally
+    ('next_cursor', cursor_or_None). Filtering and the join happen in SQL and
+    rows are fetched in batches, so memory stays flat for any table size.
+    With encoded=True rows come as ready '"id":{...}' JSON strings built by
+    SQLite, skipping the per-row dicts.
+    """
+    limit = max(1, min(int(limit or QUEUE_PAGE_DEFAULT), QUEUE_PAGE_MAX))
     conn = get_db_connection()
-    queues = conn.execute('SELECT * FROM queues ORDER BY created_at DESC').fetchall()
-    conn.close()
-    return [dict(q) for q in queues]
+    entry_sql = _queue_json_entry_sql(conn) if encoded else None
+    columns = f"q.id, q.created_at, {entry_sql} AS entry" if entry_sql else "q.*, COALESCE(s.name_uz, 'Umumiy') as service"
+    query = f'''
+        SELECT {columns}
+        FROM queues q
+        LEFT JOIN services s ON s.id = q.service_id
+    '''
+    conditions, params = [], []
+    for column, value in (('org_id', org_id), ('status', status), ('branch_id', branch_id), ('service_id', service_id)):
+        if value:
+            conditions.append(f'q.{column} = ?')
+            params.append(value)
+    if date_from:
+        conditions.append('q.date >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append('q.date <= ?')
+        params.append(date_to)
+    if cursor:
+        conditions.append(f"(q.created_at, q.id) {'>' if oldest_first else '<'} (?, ?)")
+        params.extend(cursor)
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    direction = 'ASC' if oldest_first else 'DESC'
+    query += f' ORDER BY q.created_at {direction}, q.id {direction} LIMIT ?'
+    params.append(limit + 1)
+
+    try:
+        cur = conn.execute(query, params)
+        sent, last = 0, None
+        while True:
+            rows = cur.fetchmany(100)
+            if not rows:
+                break
+            for row in rows:
+                if sent == limit:
+                    # One extra row fetched: there is another page
+                    cur.close()
+                    yield ('next_cursor', encode_queue_cursor(last['created_at'], last['id']))
+                    return
+                sent += 1
+                last = row
+                if entry_sql:
+                    yield row['entry']
+                elif encoded:
+                    yield json.dumps(row['id']) + ':' + json.dumps(dict(row))
+                else:
+                    yield dict(row)
+        yield ('next_cursor', None)
+    finally:
+        conn.close()
+
+# --- Scope Versions ---
+# In-memory change counters per org, branch and service for conditional GETs.
+# Every committed queue transition bumps the scopes it touched (in other
+# workers too, via apply_remote_transition); other changes that polled
+# endpoints show go through _touch_scopes. scope_etag() hashes the counters a
+# response was built from, so an unchanged scope is answered with 304 before
+# any SQL runs. SCOPE_EPOCH keeps ETags of different processes apart. A bump
+# also drops the micro-cached responses tagged with that scope (microcache.py);
+# the 'catalog' scope is only touched when branches are added.
+
+SCOPE_VERSION_FIELDS = (('all', None), ('org', 'org_id'), ('branch', 'branch_id'), ('service', 'service_id'),
+                        ('catalog', 'catalog'))
+SCOPE_EPOCH = os.urandom(4).hex()
+
+_scope_versions = {}     # (scope, scope_id) -> int
+_scope_versions_lock = offload.Lock()
+_scope_listeners = []
+
+def add_scope_listener(fn):
+    _scope_listeners.append(fn)
+
+def bump_scopes(*states):
+    bumped = set()
+    with _scope_versions_lock:
+        for state in states:
+            if not state:
+                continue
+            for scope, field in SCOPE_VERSION_FIELDS:
+                scope_id = '' if field is None else state.get(field)
+                if scope_id is not None:
+                    _scope_versions[(scope, scope_id)] = _scope_versions.get((scope, scope_id), 0) + 1
+                    bumped.add((scope, scope_id))
+    response_cache.invalidate(*bumped)
+
+def _touch_scopes(conn, state):
+    """Bump scope versions on commit for a change made outside _record_transition."""
+    state = {field: state.get(field) for _, field in SCOPE_VERSION_FIELDS if field}
+    after_commit(conn, lambda: bump_scopes(state))
+    for listener in _scope_listeners:
+        after_commit(conn, lambda listener=listener: listener(state))
+
+def scope_etag(*parts):
+    """ETag for a response built from (scope, scope_id) pairs plus plain values (dates, args)."""
+    tokens = [SCOPE_EPOCH]
+    for part in parts:
+        if isinstance(part, tuple):
+            scope, scope_id = part
+            tokens.append(f"{scope}:{scope_id}={_scope_versions.get((scope, scope_id or ''), 0)}")
+        else:
+            tokens.append(str(part))
+    return hashlib.sha1('|'.join(tokens).encode()).hexdigest()[:20]
+
+# --- Queue Transitions ---
+# Every queue mutation goes through _record_transition so the daily counters
+# change in the same transaction and the in-memory indexes follow on commit.
+
+def _queue_state(conn, queue_id):
+    row = conn.execute('''
+        SELECT id, status, date, time, org_id, branch_id, service_id, staff_id, created_at, called_at,
+               notification_level
+        FROM queues WHERE id = ?
+    ''', (queue_id,)).fetchone()
+    return dict(row) if row else None
+
+# Called as fn(before, after) after each committed transition (e.g. to tell
+# other worker processes, see app.py / bus.py)
+_transition_listeners = []
+
+_duration_listeners = []
+
+def add_transition_listener(fn):
+    _transition_listeners.append(fn)
+
+def add_duration_listener(fn):
+    _duration_listeners.append(fn)
+
+def _record_duration(conn, service_id, duration):
+    after_commit(conn, lambda: position_index.set_duration(service_id, duration))
+    for listener in _duration_listeners:
+        after_commit(conn, lambda listener=listener: listener(service_id, duration))
+
+def _sync_in_memory(before, after):
+    bump_scopes(before, after)
+    if after and after['status'] == 'waiting':
+        position_index.set_waiting(after['id'], after['branch_id'], after['service_id'], after['created_at'])
+        reminder_scheduler.schedule(after['id'], after['date'], after.get('time'), after.get('notification_level'))
+    elif before:
+        position_index.discard(before['id'])
+        reminder_scheduler.cancel(before['id'])
+
+def apply_remote_transition(before, after):
+    """Update this process's in-memory index/reminders for another process's commit."""
+    _sync_in_memory(before, after)
+    # Deltas and boards are pushed by every worker to its own clients, whoever committed
+    delta_publisher.mark(before, after)
+    board_snapshots.mark(before, after)
+
+def _record_transition(conn, before, after):
+    _bump_daily_counters(conn, before, after)
+    _bump_analytics_rollups(conn, before, after)
+    after_commit(conn, lambda: _sync_in_memory(before, after))
+    # After the index update, so the flush sees the new line order
+    after_commit(conn, lambda: delta_publisher.mark(before, after))
+    after_commit(conn, lambda: board_snapshots.mark(before, after))
+    for listener in _transition_listeners:
+        after_commit(conn, lambda listener=listener: listener(before, after))
 
 def update_queue_status(queue_id, status):
-    conn = get_db_connection()
-    c = conn.cursor()
-    # If completed, set completed_at
-    now = datetime.now().isoformat()
-    if status in ['completed', 'no-show', 'noshow']:
-        c.execute('UPDATE queues SET status = ?, last_notified = ?, completed_at = ? WHERE id = ?', (status, now, now, queue_id))
-    else:
-        c.execute('UPDATE queues SET status = ?, last_notified = ? WHERE id = ?', (status, now, queue_id))
-    conn.commit()
-    conn.close()
+    # The before snapshot is read under the write lock, so two concurrent
+    # transitions of one ticket can't both count from the same state
+    with transaction() as conn:
+        before = _queue_state(conn, queue_id)
+        # If completed, set completed_at
+        now = datetime.now().isoformat()
+        if status in ['completed', 'no-show', 'noshow']:
+            conn.execute('UPDATE queues SET status = ?, last_notified = ?, completed_at = ? WHERE id = ?', (status, now, now, queue_id))
+        elif status in ['called', 'serving']:
+            # Keep the first call time so wait/service durations can be measured
+            conn.execute('UPDATE queues SET status = ?, last_notified = ?, called_at = COALESCE(called_at, ?) WHERE id = ?', (status, now, now, queue_id))
+        else:
+            conn.execute('UPDATE queues SET status = ?, last_notified = ? WHERE id = ?', (status, now, queue_id))
+        if before:
+            after = dict(before, status=status)
+            if status in ['called', 'serving'] and not before['called_at']:
+                after['called_at'] = now
+            _record_transition(conn, before, after)
+
+def transfer_queue(queue_id, service_id):
+    """Send a ticket back to 'waiting' in another service (staff unassigned)."""
+    with transaction() as conn:
+        before = _queue_state(conn, queue_id)
+        conn.execute('UPDATE queues SET status = "waiting", service_id = ?, staff_id = NULL WHERE id = ?', (service_id, queue_id))
+        if before:
+            _record_transition(conn, before, dict(before, status='waiting', service_id=service_id, staff_id=None))
+
+def call_next_in_branch(branch_id):
+    """Mark the oldest waiting ticket of a branch as 'called' and return it."""
+    with transaction() as conn:
+        queue = conn.execute('''
+            SELECT * FROM queues 
+            WHERE branch_id = ? AND status = 'waiting'
+            ORDER BY created_at ASC LIMIT 1
+        ''', (branch_id,)).fetchone()
+        if not queue:
+            return None
+        now_iso = datetime.now().isoformat()
+        conn.execute("UPDATE queues SET status = 'called', called_at = ? WHERE id = ?", (now_iso, queue['id']))
+        before = dict(queue)
+        _record_transition(conn, before, dict(before, status='called', called_at=now_iso))
+    q_dict = dict(queue)
+    q_dict['status'] = 'called'
+    q_dict['called_at'] = now_iso
+    return q_dict
+
+def call_next_in_org(org_id=None):
+    """Mark the oldest waiting ticket of an org (of every org for None) as 'serving' and return it."""
+    with transaction() as conn:
+        if org_id:
+            queue = conn.execute('''
+                SELECT * FROM queues
+                WHERE org_id = ? AND status = 'waiting'
+                ORDER BY created_at ASC LIMIT 1
+            ''', (org_id,)).fetchone()
+        else:
+            queue = conn.execute('''
+                SELECT * FROM queues WHERE status = 'waiting'
+                ORDER BY created_at ASC LIMIT 1
+            ''').fetchone()
+        if not queue:
+            return None
+        update_queue_status(queue['id'], 'serving')
+    return dict(queue)
 
 def add_rating(queue_id, rating, comment):
     conn = get_db_connection()
     try:
+        queue = conn.execute('SELECT org_id, service_id FROM queues_all WHERE id = ?', (queue_id,)).fetchone()
         conn.execute('''
-            INSERT INTO ratings (queue_id, rating, comment, created_at)
-            VALUES (?, ?, ?, ?)
-        ''', (queue_id, rating, comment, datetime.now().isoformat()))
+            INSERT INTO ratings (queue_id, rating, comment, created_at, org_id, service_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (queue_id, rating, comment, datetime.now().isoformat(),
+              queue['org_id'] if queue else None, queue['service_id'] if queue else None))
+        if queue:
+            _touch_scopes(conn, dict(queue))
         conn.commit()
         return True
     except Exception as e:
@@ -355,12 +792,11 @@ def get_average_ratings(org_id=None):
         query = '''
             SELECT s.name_uz as service_name, AVG(r.rating) as avg_rating, COUNT(r.id) as count
             FROM ratings r
-            JOIN queues q ON r.queue_id = q.id
-            JOIN services s ON q.service_id = s.id
+            JOIN services s ON r.service_id = s.id
         '''
         params = []
         if org_id:
-            query += ' WHERE q.org_id = ?'
+            query += ' WHERE r.org_id = ?'
             params.append(org_id)
         
         query += ' GROUP BY s.id'
@@ -375,11 +811,11 @@ def get_recent_feedback(org_id=None, limit=20):
         query = '''
             SELECT r.*, q.number as queue_number
             FROM ratings r
-            JOIN queues q ON r.queue_id = q.id
+            JOIN queues_all q ON r.queue_id = q.id
         '''
         params = []
         if org_id:
-            query += ' WHERE q.org_id = ?'
+            query += ' WHERE r.org_id = ?'
             params.append(org_id)
             
         query += ' ORDER BY r.created_at DESC LIMIT ?'
@@ -391,18 +827,456 @@ def get_recent_feedback(org_id=None, limit=20):
         conn.close()
 
 def update_notification_level(queue_id, level):
+    """Raise a ticket's reminder level. False if it was already at or past level."""
     conn = get_db_connection()
-    c = conn.cursor()
+    cur = conn.execute('''
+        UPDATE queues SET notification_level = ?, last_notified = ?
+        WHERE id = ? AND COALESCE(notification_level, 0) < ?
+    ''', (level, datetime.now().isoformat(), queue_id, level))
     conn.commit()
     conn.close()
+    return cur.rowcount > 0
+
+def get_reminder_target(queue_id):
+    """Ticket number and Telegram chat for a reminder, or None."""
+    conn = get_db_connection()
+    try:
+        row = conn.execute('''
+            SELECT q.id, q.number, q.status, u.user_id AS chat_id
+            FROM queues q JOIN users u ON u.phone = q.phone
+            WHERE q.id = ?
+        ''', (queue_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+def ensure_reminders(now=None):
+    """Reminder heap for this process, (re)built on first use and each new day."""
+    now = now or datetime.now()
+    if not reminder_scheduler.ready or reminder_scheduler.loaded_for != now.strftime('%Y-%m-%d'):
+        conn = get_db_connection()
+        try:
+            reminder_scheduler.rebuild(conn, now)
+        finally:
+            conn.close()
+    return reminder_scheduler
 
 def update_queue_notes(queue_id, notes):
     conn = get_db_connection()
     c = conn.cursor()
     c.execute('UPDATE queues SET notes = ? WHERE id = ?', (notes, queue_id))
+    state = _queue_state(conn, queue_id)
+    if state:
+        _touch_scopes(conn, state)
+    conn.commit()
+    conn.close()
+
+# --- Archival ---
+# Finished tickets older than a cutoff move from the hot queues table to
+# queues_archive in small batches, each in its own short write transaction.
+# History readers go through the queues_all view or fall back to the archive.
+
+FINISHED_STATUSES = ('completed', 'cancelled', 'no-show', 'noshow')
+
+def archive_finished_queues(older_than_days=90, batch_size=500, pause=0.05):
+    """Move finished queues created more than older_than_days ago. Returns rows moved."""
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+    status_marks = ', '.join('?' for _ in FINISHED_STATUSES)
+    moved = 0
+    while True:
+        with transaction() as conn:
+            columns = ', '.join(r['name'] for r in conn.execute('PRAGMA table_info(queues)').fetchall())
+            ids = [r['id'] for r in conn.execute(f'''
+                SELECT id FROM queues
+                WHERE status IN ({status_marks}) AND created_at < ?
+                LIMIT ?
+            ''', (*FINISHED_STATUSES, cutoff, batch_size)).fetchall()]
+            if ids:
+                id_marks = ', '.join('?' for _ in ids)
+                conn.execute(f'INSERT OR REPLACE INTO queues_archive ({columns}) SELECT {columns} FROM queues WHERE id IN ({id_marks})', ids)
+                conn.execute(f'DELETE FROM queues WHERE id IN ({id_marks})', ids)
+        moved += len(ids)
+        if len(ids) < batch_size:
+            break
+        # Let request threads grab the write lock between batches
+        time.sleep(pause)
+    if moved:
+        print(f"Archived {moved} finished queues older than {older_than_days} days")
+    return moved
+
+# --- Telegram Outbox ---
+# Request handlers only insert a row; notifier.py delivers it with rate
+# limiting and retries. A claimed row is leased by pushing next_attempt_at
+# forward, so a row left in 'sending' by a crashed worker is picked up again.
+
+OUTBOX_LEASE_SECONDS = 60
+
+def enqueue_outbox(chat_id, payload, method='sendMessage', on_commit=None):
+    """Queue a Bot API call; on_commit runs once the row is visible to workers."""
+    conn = get_db_connection()
+    cur = conn.execute('''
+        INSERT INTO telegram_outbox (chat_id, method, payload, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (str(chat_id), method, json.dumps(payload, ensure_ascii=False), time.time(), datetime.now().isoformat()))
+    if on_commit:
+        after_commit(conn, on_commit)
+    conn.commit()
+    conn.close()
+    return cur.lastrowid
+
+def claim_outbox(limit=1, lease=OUTBOX_LEASE_SECONDS):
+    """Lease up to limit due messages to the calling worker."""
+    now = time.time()
+    with transaction() as conn:
+        rows = conn.execute('''
+            SELECT * FROM telegram_outbox
+            WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+            ORDER BY next_attempt_at, id LIMIT ?
+        ''', (now, limit)).fetchall()
+        if rows:
+            ids = [r['id'] for r in rows]
+            conn.execute(f'''
+                UPDATE telegram_outbox SET status = 'sending', next_attempt_at = ?
+                WHERE id IN ({', '.join('?' for _ in ids)})
+            ''', (now + lease, *ids))
+    return [dict(r) for r in rows]
+
+def mark_outbox_sent(outbox_id):
+    conn = get_db_connection()
+    conn.execute('''
+        UPDATE telegram_outbox SET status = 'sent', attempts = attempts + 1, next_attempt_at = ?, sent_at = ?
+        WHERE id = ?
+    ''', (time.time(), datetime.now().isoformat(), outbox_id))
+    conn.commit()
+    conn.close()
+
+def retry_outbox(outbox_id, delay, error=None, count_attempt=True):
+    """Put a leased message back as pending, due again in delay seconds."""
+    conn = get_db_connection()
+    conn.execute('''
+        UPDATE telegram_outbox SET status = 'pending', attempts = attempts + ?, next_attempt_at = ?,
+            last_error = COALESCE(?, last_error)
+        WHERE id = ?
+    ''', (1 if count_attempt else 0, time.time() + delay, error, outbox_id))
+    conn.commit()
+    conn.close()
+
+def dead_letter_outbox(outbox_id, error):
+    conn = get_db_connection()
+    conn.execute('''
+        UPDATE telegram_outbox SET status = 'dead', attempts = attempts + 1, last_error = ?
+        WHERE id = ?
+    ''', (error, outbox_id))
+    conn.commit()
+    conn.close()
+
+def get_outbox_stats():
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('SELECT status, COUNT(*) AS n FROM telegram_outbox GROUP BY status').fetchall()
+        return {r['status']: r['n'] for r in rows}
+    finally:
+        conn.close()
+
+def prune_outbox(older_than_days=7):
+    """Delete delivered messages; dead letters are kept for inspection."""
+    cutoff = time.time() - older_than_days * 86400
+    conn = get_db_connection()
+    cur = conn.execute("DELETE FROM telegram_outbox WHERE status = 'sent' AND next_attempt_at < ?", (cutoff,))
+    conn.commit()
+    conn.close()
+    return cur.rowcount
+
+# --- Message Bus & Leases ---
+# Storage for bus.SQLiteBus (MESSAGE_QUEUE=sqlite) and leader.LeaderElector.
+
+def publish_bus_message(channel, origin, payload):
+    conn = get_db_connection()
+    conn.execute('INSERT INTO bus_messages (channel, origin, payload, created_at) VALUES (?, ?, ?, ?)',
+                 (channel, origin, payload, time.time()))
+    conn.commit()
+    conn.close()
+
+def get_bus_cursor():
+    conn = get_db_connection()
+    try:
+        return conn.execute('SELECT COALESCE(MAX(id), 0) FROM bus_messages').fetchone()[0]
+    finally:
+        conn.close()
+
+def read_bus_messages(after_id, limit=500):
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('''
+            SELECT id, channel, origin, payload FROM bus_messages WHERE id > ? ORDER BY id LIMIT ?
+        ''', (after_id, limit)).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+def prune_bus_messages(older_than_seconds=60):
+    conn = get_db_connection()
+    conn.execute('DELETE FROM bus_messages WHERE created_at < ?', (time.time() - older_than_seconds,))
     conn.commit()
     conn.close()
 
+def acquire_lease(name, holder, ttl):
+    """Take or renew a named lease. True if holder owns it for the next ttl seconds."""
+    now = time.time()
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+        ''', (name, holder, now + ttl, now))
+        conn.commit()
+        row = conn.execute('SELECT holder FROM leases WHERE name = ?', (name,)).fetchone()
+        return row is not None and row['holder'] == holder
+    finally:
+        conn.close()
+
+def release_lease(name, holder):
+    conn = get_db_connection()
+    conn.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (name, holder))
+    conn.commit()
+    conn.close()
+
+# --- Daily Counters ---
+# Materialized per-day counts by status for the whole system and per org,
+# branch, service and staff. Maintained incrementally by _record_transition and
+# repaired by reconcile_daily_counters().
+
+COUNTER_SCOPES = (('all', None), ('org', 'org_id'), ('branch', 'branch_id'), ('service', 'service_id'), ('staff', 'staff_id'))
+STATUS_COUNTER_COLUMNS = {
+    'waiting': 'waiting',
+    'called': 'called',
+    'serving': 'serving',
+    'completed': 'completed',
+    'no-show': 'no_show',
+    'noshow': 'no_show',
+    'cancelled': 'cancelled',
+}
+COUNTER_COLUMNS = ('total', 'waiting', 'called', 'serving', 'completed', 'no_show', 'cancelled')
+
+def _counter_keys(state):
+    day = state.get('date') or ''
+    for scope, field in COUNTER_SCOPES:
+        scope_id = '' if field is None else state.get(field)
+        if scope_id is not None:
+            yield (day, scope, scope_id)
+
+def _bump_daily_counters(conn, before, after):
+    deltas = {}
+    for state, sign in ((before, -1), (after, 1)):
+        if not state:
+            continue
+        column = STATUS_COUNTER_COLUMNS.get(state.get('status'))
+        for key in _counter_keys(state):
+            row = deltas.setdefault(key, dict.fromkeys(COUNTER_COLUMNS, 0))
+            row['total'] += sign
+            if column:
+                row[column] += sign
+    for (day, scope, scope_id), row in deltas.items():
+        if not any(row.values()):
+            continue
+        conn.execute(f'''
+            INSERT INTO daily_counters (day, scope, scope_id, {', '.join(COUNTER_COLUMNS)})
+            VALUES (?, ?, ?, {', '.join('?' for _ in COUNTER_COLUMNS)})
+            ON CONFLICT(day, scope, scope_id) DO UPDATE SET
+            {', '.join(f'{c} = {c} + excluded.{c}' for c in COUNTER_COLUMNS)}
+        ''', (day, scope, scope_id, *(row[c] for c in COUNTER_COLUMNS)))
+
+def _counter_select_columns():
+    status_sums = []
+    for column in COUNTER_COLUMNS[1:]:
+        statuses = ', '.join(f"'{s}'" for s, c in STATUS_COUNTER_COLUMNS.items() if c == column)
+        status_sums.append(f'SUM(status IN ({statuses}))')
+    return 'COUNT(*), ' + ', '.join(status_sums)
+
+def _rebuild_daily_counters(conn, day=None, source='queues_all'):
+    """Recompute counters from live + archived queues (all days when day is None)."""
+    if day is None:
+        conn.execute('DELETE FROM daily_counters')
+        queue_filter, params = '', ()
+    else:
+        conn.execute('DELETE FROM daily_counters WHERE day = ?', (day,))
+        queue_filter, params = 'WHERE date = ?', (day,)
+    for scope, field in COUNTER_SCOPES:
+        scope_expr = "''" if field is None else field
+        conn.execute(f'''
+            INSERT INTO daily_counters (day, scope, scope_id, {', '.join(COUNTER_COLUMNS)})
+            SELECT COALESCE(date, ''), '{scope}', {scope_expr}, {_counter_select_columns()}
+            FROM {source} {queue_filter}
+            GROUP BY COALESCE(date, ''), {scope_expr}
+            HAVING {scope_expr} IS NOT NULL
+        ''', params)
+
+def reconcile_daily_counters(day=None):
+    """Fix drift (e.g. rows written by seed scripts). Returns the number of drifted rows."""
+    with transaction() as conn:
+        day_filter = '' if day is None else 'WHERE day = ?'
+        params = () if day is None else (day,)
+        snapshot = f'SELECT * FROM daily_counters {day_filter}'
+        # Rows decremented back to zero are equivalent to missing rows
+        before = {tuple(r) for r in conn.execute(snapshot, params).fetchall() if any(tuple(r)[3:])}
+        _rebuild_daily_counters(conn, day)
+        after = {tuple(r) for r in conn.execute(snapshot, params).fetchall()}
+    drift = len(before ^ after)
+    if drift:
+        print(f"Daily counters reconciled ({day or 'all days'}): {drift} rows drifted")
+    return drift
+
+def get_daily_counters(scope='all', scope_id='', day=None):
+    day = day or datetime.now().strftime('%Y-%m-%d')
+    conn = get_db_connection()
+    row = conn.execute('SELECT * FROM daily_counters WHERE day = ? AND scope = ? AND scope_id = ?',
+                       (day, scope, scope_id)).fetchone()
+    conn.close()
+    if row:
+        return {c: row[c] for c in COUNTER_COLUMNS}
+    return dict.fromkeys(COUNTER_COLUMNS, 0)
+
+def get_staff_loads(day=None):
+    day = day or datetime.now().strftime('%Y-%m-%d')
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT scope_id, waiting FROM daily_counters
+        WHERE day = ? AND scope = 'staff' AND waiting > 0
+    ''', (day,)).fetchall()
+    conn.close()
+    return {r['scope_id']: r['waiting'] for r in rows}
+
+def get_branch_waiting(day=None):
+    """{branch_id: waiting tickets} for every branch with tickets that day."""
+    day = day or datetime.now().strftime('%Y-%m-%d')
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT scope_id, waiting FROM daily_counters
+        WHERE day = ? AND scope = 'branch'
+    ''', (day,)).fetchall()
+    conn.close()
+    return {r['scope_id']: r['waiting'] for r in rows}
+
+# --- Verification Sessions ---
+# Telegram login handshake: /start <uid> stores the chat under 'uid_<uid>',
+# sharing the contact adds the phone, and the site polls by uid or phone.
+# Rows expire after VERIFICATION_TTL_HOURS; expired rows are ignored on read
+# and deleted on the next write.
+
+VERIFICATION_TTL_HOURS = float(os.getenv("VERIFICATION_TTL_HOURS", "24"))
+
+def _verification_dict(row):
+    data = {"user_id": row['user_id'], "timestamp": row['created_at']}
+    if row['phone']:
+        data["phone"] = row['phone']
+    if row['username']:
+        data["username"] = row['username']
+    if row['verified']:
+        data["verified"] = True
+    return data
+
+def _save_verification(key, user_id=None, phone=None, username=None, verified=False, created_at=None, expires_at=None):
+    now = time.time()
+    conn = get_db_connection()
+    conn.execute('''
+        INSERT INTO verifications (key, user_id, phone, username, verified, created_at, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            user_id = COALESCE(excluded.user_id, verifications.user_id),
+            phone = COALESCE(excluded.phone, verifications.phone),
+            username = COALESCE(excluded.username, verifications.username),
+            verified = MAX(excluded.verified, verifications.verified),
+            expires_at = excluded.expires_at
+    ''', (key, str(user_id) if user_id is not None else None, phone, username, 1 if verified else 0,
+          created_at or datetime.now().isoformat(), expires_at or now + VERIFICATION_TTL_HOURS * 3600))
+    conn.execute('DELETE FROM verifications WHERE expires_at < ?', (now,))
+    conn.commit()
+    conn.close()
+
+def save_session_uid(uid, chat_id):
+    _save_verification(f"uid_{uid}", user_id=chat_id)
+
+def update_uid_with_phone(uid, phone):
+    """Attach the shared phone to a pending login session (no-op if it expired)."""
+    conn = get_db_connection()
+    conn.execute('''
+        UPDATE verifications SET phone = ?, verified = 1, expires_at = ?
+        WHERE key = ? AND expires_at >= ?
+    ''', (normalize_phone(phone), time.time() + VERIFICATION_TTL_HOURS * 3600, f"uid_{uid}", time.time()))
+    conn.commit()
+    conn.close()
+
+def save_phone_verification(phone, user_id, username=None):
+    phone = normalize_phone(phone)
+    _save_verification(phone, user_id=user_id, phone=phone, username=username)
+
+def get_verification_by_uid(uid):
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT * FROM verifications WHERE key = ? AND expires_at >= ?',
+                           (f"uid_{uid}", time.time())).fetchone()
+        return _verification_dict(row) if row else None
+    finally:
+        conn.close()
+
+def find_verification_by_phone(phone):
+    """Newest live record for a phone, whether keyed by the phone or by a session uid."""
+    phone = normalize_phone(phone)
+    conn = get_db_connection()
+    try:
+        row = conn.execute('''
+            SELECT * FROM verifications
+            WHERE (key = ? OR phone = ?) AND expires_at >= ?
+            ORDER BY created_at DESC LIMIT 1
+        ''', (phone, phone, time.time())).fetchone()
+        return _verification_dict(row) if row else None
+    finally:
+        conn.close()
+
+def _legacy_created_at(value):
+    """A legacy record's timestamp (ISO string or unix time) as a datetime, or None."""
+    try:
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value)
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+def import_verifications_json(path):
+    """Load a legacy verifications.json into the table. Returns rows imported.
+
+    Records keep the expiry they had: created_at + VERIFICATION_TTL_HOURS.
+    Records already past it, or without a readable timestamp, are skipped.
+    """
+    with open(path, 'r') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError:
+            data = {}
+    imported = skipped = 0
+    now = time.time()
+    with transaction():
+        for key, val in data.items():
+            if not isinstance(val, dict):
+                continue
+            created = _legacy_created_at(val.get('timestamp') or val.get('time'))
+            expires_at = created.timestamp() + VERIFICATION_TTL_HOURS * 3600 if created else None
+            if expires_at is None or expires_at < now:
+                skipped += 1
+                continue
+            created_at = created.isoformat()
+            if key.startswith('uid_'):
+                _save_verification(key, val.get('user_id'), normalize_phone(val['phone']) if val.get('phone') else None,
+                                   val.get('username'), val.get('verified', False), created_at, expires_at)
+            else:
+                phone = normalize_phone(key)
+                _save_verification(phone, val.get('user_id'), phone, val.get('username'),
+                                   created_at=created_at, expires_at=expires_at)
+            imported += 1
+    print(f"Imported {imported} verification records from {path} ({skipped} expired or undated skipped)")
+    return imported
+
 # --- User Operations ---
 
 def normalize_phone(phone):
@@ -464,29 +1338,41 @@ def check_system_admin_exists():
 # --- Analytics ---
 
 def get_admin_stats(org_id=None):
-    conn = get_db_connection()
-    today = datetime.now().strftime('%Y-%m-%d')
-    
-    where_clause = ' WHERE date = ?'
-    params = [today]
-    if org_id:
-        where_clause += ' AND org_id = ?'
-        params.append(org_id)
-        
+    counters = get_daily_counters('org', org_id) if org_id else get_daily_counters()
     stats = {
-        "total_today": conn.execute(f'SELECT COUNT(*) FROM queues {where_clause}', params).fetchone()[0],
-        "waiting": conn.execute(f'SELECT COUNT(*) FROM queues {where_clause} AND status = "waiting"', params).fetchone()[0],
-        "completed": conn.execute(f'SELECT COUNT(*) FROM queues {where_clause} AND status = "completed"', params).fetchone()[0],
-        "total_users": conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] # Global for system_admin usually, filter if needed
+        "total_today": counters['total'],
+        "waiting": counters['waiting'],
+        "completed": counters['completed'],
     }
     
+    conn = get_db_connection()
     if org_id:
         stats["total_users"] = conn.execute('SELECT COUNT(*) FROM users WHERE org_id = ?', (org_id,)).fetchone()[0]
-        
+    else:
+        stats["total_users"] = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] # Global for system_admin
     conn.close()
     return stats
 
+def _ensure_position_index():
+    if not position_index.ready:
+        conn = get_db_connection()
+        try:
+            position_index.rebuild(conn)
+        except sqlite3.Error as e:
+            print(f"Queue index rebuild failed, using SQL: {e}")
+        finally:
+            conn.close()
+    return position_index
+
+def get_line_positions(branch_id, service_id):
+    return _ensure_position_index().line_positions(branch_id, service_id)
+
 def get_queue_position(q_id):
+    # Fast path: waiting tickets are answered from the in-memory index
+    pos = _ensure_position_index().position(q_id)
+    if pos:
+        return pos
+
     conn = get_db_connection()
     try:
         target = conn.execute('SELECT service_id, branch_id, created_at, status FROM queues WHERE id = ?', (q_id,)).fetchone()
@@ -494,6 +1380,7 @@ def get_queue_position(q_id):
         if target['status'] != 'waiting':
             return {"status": target['status'], "position": 0, "people_ahead": 0, "estimated_wait": 0}
             
+        # Waiting but not indexed (index cold or row written by another process)
         count = conn.execute('''
             SELECT COUNT(*) FROM queues 
             WHERE service_id = ? AND branch_id = ? AND status = "waiting" AND created_at < ?
@@ -511,44 +1398,267 @@ def get_queue_position(q_id):
     finally:
         conn.close()
 
-def get_analytics_data(org_id=None):
+# --- Branch Board ---
+
+BOARD_NEXT_COUNT = int(os.getenv("BOARD_NEXT_COUNT", "5"))
+
+def get_branch_board(branch_id, next_count=BOARD_NEXT_COUNT):
+    """Hallway display data: tickets being served, the next few waiting, today's
+    counts. None if there is no such branch."""
+    today = datetime.now().strftime('%Y-%m-%d')
     conn = get_db_connection()
+    try:
+        branch = conn.execute('''
+            SELECT b.name, o.name AS org_name FROM branches b
+            LEFT JOIN organizations o ON o.id = b.org_id WHERE b.id = ?
+        ''', (branch_id,)).fetchone()
+        if branch is None:
+            return None
+        serving = conn.execute('''
+            SELECT q.id, q.number, q.status, q.service_id, s.name_uz AS service_name, q.called_at
+            FROM queues q LEFT JOIN services s ON s.id = q.service_id
+            WHERE q.branch_id = ? AND q.status IN ('called', 'serving') AND q.date = ?
+            ORDER BY q.called_at DESC
+        ''', (branch_id, today)).fetchall()
+        # Same order call_next_in_branch uses
+        waiting = conn.execute('''
+            SELECT q.id, q.number, q.service_id, s.name_uz AS service_name
+            FROM queues q LEFT JOIN services s ON s.id = q.service_id
+            WHERE q.branch_id = ? AND q.status = 'waiting'
+            ORDER BY q.created_at ASC LIMIT ?
+        ''', (branch_id, next_count)).fetchall()
+    finally:
+        conn.close()
+    return {
+        "branch_id": branch_id,
+        "branch_name": branch['name'],
+        "org_name": branch['org_name'],
+        "date": today,
+        "serving": [dict(r) for r in serving],
+        "next": [dict(r) for r in waiting],
+        "counts": get_daily_counters('branch', branch_id, today)
+    }
+
+# --- Analytics Rollups ---
+# Hourly and daily event counts per (org, branch, service): arrivals, completions,
+# no-shows and summed wait/service seconds, plus arrivals by hour of day per
+# month so long ranges never touch the hourly table. Updated on every
+# transition and rebuilt from the queues table by backfill_analytics_rollups().
+
+ROLLUP_COLUMNS = ('arrivals', 'completions', 'no_shows', 'wait_seconds', 'waits', 'service_seconds', 'serviced')
+
+def _seconds_between(start, end):
+    try:
+        return max((datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+def _bump_analytics_rollups(conn, before, after):
+    if not after:
+        return
+    now = datetime.now().isoformat()
+    events = []  # (timestamp, {column: delta})
+    if before is None:
+        events.append((after.get('created_at') or now, {'arrivals': 1}))
+    else:
+        old_status, new_status = before.get('status'), after.get('status')
+        if new_status != old_status:
+            if old_status == 'waiting' and new_status in ('called', 'serving'):
+                wait = _seconds_between(after.get('created_at'), now)
+                if wait is not None:
+                    events.append((now, {'wait_seconds': wait, 'waits': 1}))
+            elif new_status == 'completed':
+                delta = {'completions': 1}
+                service = _seconds_between(before.get('called_at'), now)
+                if service is not None:
+                    delta.update(service_seconds=service, serviced=1)
+                events.append((now, delta))
+            elif new_status in ('no-show', 'noshow'):
+                events.append((now, {'no_shows': 1}))
+
+    key = (after.get('org_id') or '', after.get('branch_id') or '', after.get('service_id') or '')
+    for ts, delta in events:
+        values = [delta.get(c, 0) for c in ROLLUP_COLUMNS]
+        for table, bucket in (('analytics_hourly', ts[:13]), ('analytics_daily', ts[:10])):
+            period = 'hour' if table == 'analytics_hourly' else 'day'
+            conn.execute(f'''
+                INSERT INTO {table} (org_id, {period}, branch_id, service_id, {', '.join(ROLLUP_COLUMNS)})
+                VALUES (?, ?, ?, ?, {', '.join('?' for _ in ROLLUP_COLUMNS)})
+                ON CONFLICT(org_id, {period}, branch_id, service_id) DO UPDATE SET
+                {', '.join(f'{c} = {c} + excluded.{c}' for c in ROLLUP_COLUMNS)}
+            ''', (key[0], bucket, key[1], key[2], *values))
+        if delta.get('arrivals'):
+            conn.execute('''
+                INSERT INTO analytics_hour_profile (org_id, month, hod, branch_id, service_id, arrivals)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(org_id, month, hod, branch_id, service_id) DO UPDATE SET
+                arrivals = arrivals + excluded.arrivals
+            ''', (key[0], ts[:7], ts[11:13], key[1], key[2], delta['arrivals']))
+
+_ROLLUP_EVENTS_SQL = '''
+    SELECT COALESCE(org_id, '') AS org_id, substr(created_at, 1, 13) AS hour,
+           COALESCE(branch_id, '') AS branch_id, COALESCE(service_id, '') AS service_id,
+           1 AS arrivals, 0 AS completions, 0 AS no_shows, 0 AS wait_seconds, 0 AS waits,
+           0 AS service_seconds, 0 AS serviced
+    FROM {source} WHERE created_at IS NOT NULL
+    UNION ALL
+    SELECT COALESCE(org_id, ''), substr(completed_at, 1, 13), COALESCE(branch_id, ''), COALESCE(service_id, ''),
+           0, 1, 0, 0, 0,
+           CASE WHEN called_at IS NOT NULL THEN MAX((julianday(completed_at) - julianday(called_at)) * 86400, 0) ELSE 0 END,
+           called_at IS NOT NULL
+    FROM {source} WHERE status = 'completed' AND completed_at IS NOT NULL
+    UNION ALL
+    SELECT COALESCE(org_id, ''), substr(completed_at, 1, 13), COALESCE(branch_id, ''), COALESCE(service_id, ''),
+           0, 0, 1, 0, 0, 0, 0
+    FROM {source} WHERE status IN ('no-show', 'noshow') AND completed_at IS NOT NULL
+    UNION ALL
+    SELECT COALESCE(org_id, ''), substr(called_at, 1, 13), COALESCE(branch_id, ''), COALESCE(service_id, ''),
+           0, 0, 0, MAX((julianday(called_at) - julianday(created_at)) * 86400, 0), 1, 0, 0
+    FROM {source} WHERE called_at IS NOT NULL AND created_at IS NOT NULL
+'''
+
+def backfill_analytics_rollups(date_from=None, date_to=None, source='queues_all'):
+    """Rebuild hourly/daily rollups from live + archived queues for a date range (inclusive)."""
+    hour_from = (date_from or '0000-00-00') + 'T00'
+    hour_to = (date_to or '9999-99-99') + 'T99'
+    sums = ', '.join(f'SUM({c})' for c in ROLLUP_COLUMNS)
+    with transaction() as conn:
+        conn.execute('DELETE FROM analytics_hourly WHERE hour BETWEEN ? AND ?', (hour_from, hour_to))
+        conn.execute('DELETE FROM analytics_daily WHERE day BETWEEN ? AND ?', (hour_from[:10], hour_to[:10]))
+        conn.execute(f'''
+            INSERT INTO analytics_hourly (org_id, hour, branch_id, service_id, {', '.join(ROLLUP_COLUMNS)})
+            SELECT org_id, hour, branch_id, service_id, {sums}
+            FROM ({_ROLLUP_EVENTS_SQL.format(source=source)})
+            WHERE hour BETWEEN ? AND ?
+            GROUP BY org_id, hour, branch_id, service_id
+        ''', (hour_from, hour_to))
+        conn.execute(f'''
+            INSERT INTO analytics_daily (org_id, day, branch_id, service_id, {', '.join(ROLLUP_COLUMNS)})
+            SELECT org_id, substr(hour, 1, 10), branch_id, service_id, {sums}
+            FROM analytics_hourly
+            WHERE hour BETWEEN ? AND ?
+            GROUP BY org_id, substr(hour, 1, 10), branch_id, service_id
+        ''', (hour_from, hour_to))
+        # Month buckets overlapping the range are rebuilt whole
+        month_from, month_to = hour_from[:7], hour_to[:7]
+        conn.execute('DELETE FROM analytics_hour_profile WHERE month BETWEEN ? AND ?', (month_from, month_to))
+        conn.execute(f'''
+            INSERT INTO analytics_hour_profile (org_id, month, hod, branch_id, service_id, arrivals)
+            SELECT COALESCE(org_id, ''), substr(created_at, 1, 7), substr(created_at, 12, 2),
+                   COALESCE(branch_id, ''), COALESCE(service_id, ''), COUNT(*)
+            FROM {source}
+            WHERE created_at IS NOT NULL AND substr(created_at, 1, 7) BETWEEN ? AND ?
+            GROUP BY 1, 2, 3, 4, 5
+        ''', (month_from, month_to))
+        return conn.execute('SELECT COUNT(*) FROM analytics_hourly WHERE hour BETWEEN ? AND ?', (hour_from, hour_to)).fetchone()[0]
+
+def _full_month_span(date_from, date_to):
+    """Whole calendar months inside [date_from, date_to] as ('YYYY-MM', 'YYYY-MM'), or None."""
+    start = datetime.strptime(date_from, '%Y-%m-%d')
+    end = datetime.strptime(date_to, '%Y-%m-%d')
+    if start.day != 1:
+        start = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+    if (end + timedelta(days=1)).day != 1:
+        end = end.replace(day=1) - timedelta(days=1)
+    if start > end:
+        return None
+    return start.strftime('%Y-%m'), end.strftime('%Y-%m')
+
+def _hour_profile(conn, where, params, date_from, date_to):
+    """Arrivals by hour of day: monthly profile for whole months, hourly rows for the edges."""
+    profile = {}
+    def add(rows):
+        for row in rows:
+            profile[row['hod']] = profile.get(row['hod'], 0) + row['count']
+
+    hour_query = f'''
+        SELECT substr(hour, 12, 2) as hod, SUM(arrivals) as count
+        FROM analytics_hourly {where.format(period='hour')}
+        GROUP BY substr(hour, 12, 2)
+    '''
+    months = _full_month_span(date_from, date_to)
+    if not months:
+        add(conn.execute(hour_query, [date_from + 'T00', date_to + 'T99', *params]).fetchall())
+    else:
+        add(conn.execute(f'''
+            SELECT hod, SUM(arrivals) as count
+            FROM analytics_hour_profile {where.format(period='month')}
+            GROUP BY hod
+        ''', [months[0], months[1], *params]).fetchall())
+        head_end = (datetime.strptime(months[0] + '-01', '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+        tail_start = (datetime.strptime(months[1] + '-01', '%Y-%m-%d') + timedelta(days=32)).replace(day=1).strftime('%Y-%m-%d')
+        if date_from <= head_end:
+            add(conn.execute(hour_query, [date_from + 'T00', head_end + 'T99', *params]).fetchall())
+        if tail_start <= date_to:
+            add(conn.execute(hour_query, [tail_start + 'T00', date_to + 'T99', *params]).fetchall())
+    return {hod: count for hod, count in profile.items() if count}
+
+def _avg_minutes(total_seconds, count):
+    return round(total_seconds / count / 60, 1) if count else 0
+
+def get_analytics_data(org_id=None, date_from=None, date_to=None, branch_id=None):
     today = datetime.now().strftime('%Y-%m-%d')
+    date_from = date_from or today
+    date_to = date_to or date_from
+
+    where = ' WHERE {period} BETWEEN ? AND ?'
+    params = []
+    if org_id:
+        where += ' AND org_id = ?'
+        params.append(org_id)
+    if branch_id:
+        where += ' AND branch_id = ?'
+        params.append(branch_id)
+
+    conn = get_db_connection()
     try:
-        # 1. Hourly traffic (Today)
-        query_hourly = '''
-            SELECT strftime('%H', created_at) as hour, COUNT(*) as count 
-            FROM queues 
-            WHERE date = ? 
-        '''
-        params_hourly = [today]
-        if org_id:
-            query_hourly += ' AND org_id = ?'
-            params_hourly.append(org_id)
-            
-        query_hourly += ' GROUP BY hour'
-        
-        hourly_data = conn.execute(query_hourly, params_hourly).fetchall()
-        
-        # 2. Service distribution
-        query_services = '''
-            SELECT s.name_uz, COUNT(q.id) as count 
-            FROM services s
-            LEFT JOIN queues q ON s.id = q.service_id
-            WHERE (q.date = ? OR q.date IS NULL)
-        '''
-        params_services = [today]
-        if org_id:
-            query_services += ' AND s.org_id = ?'
-            params_services.append(org_id)
-            
-        query_services += ' GROUP BY s.id HAVING count > 0'
-        
-        service_data = conn.execute(query_services, params_services).fetchall()
-        
-        return {
-            "hourly": {row['hour']: row['count'] for row in hourly_data},
-            "services": {row['name_uz']: row['count'] for row in service_data}
-        }
+        # 1. Arrivals by hour of day
+        hourly = _hour_profile(conn, where, params, date_from, date_to)
+
+        # 2. Per-day series
+        daily_rows = conn.execute(f'''
+            SELECT day, {', '.join(f'SUM({c}) as {c}' for c in ROLLUP_COLUMNS)}
+            FROM analytics_daily {where.format(period='day')}
+            GROUP BY day ORDER BY day
+        ''', [date_from, date_to, *params]).fetchall()
+
+        # 3. Service distribution
+        service_rows = conn.execute(f'''
+            SELECT s.name_uz, t.count FROM (
+                SELECT service_id, SUM(arrivals) as count
+                FROM analytics_daily {where.format(period='day')}
+                GROUP BY service_id
+            ) t
+            JOIN services s ON s.id = t.service_id
+            WHERE t.count > 0
+        ''', [date_from, date_to, *params]).fetchall()
     finally:
         conn.close()
+
+    totals = dict.fromkeys(ROLLUP_COLUMNS, 0)
+    daily = {}
+    for row in daily_rows:
+        for c in ROLLUP_COLUMNS:
+            totals[c] += row[c] or 0
+        daily[row['day']] = {
+            "arrivals": row['arrivals'],
+            "completions": row['completions'],
+            "no_shows": row['no_shows'],
+            "avg_wait_minutes": _avg_minutes(row['wait_seconds'], row['waits']),
+            "avg_service_minutes": _avg_minutes(row['service_seconds'], row['serviced'])
+        }
+
+    return {
+        "from": date_from,
+        "to": date_to,
+        "hourly": hourly,
+        "services": {row['name_uz']: row['count'] for row in service_rows},
+        "daily": daily,
+        "totals": {
+            "arrivals": totals['arrivals'],
+            "completions": totals['completions'],
+            "no_shows": totals['no_shows'],
+            "avg_wait_minutes": _avg_minutes(totals['wait_seconds'], totals['waits']),
+            "avg_service_minutes": _avg_minutes(totals['service_seconds'], totals['serviced'])
+        }
+    }
@@ -0,0 +1,339 @@
+"""Synthetic dataset for benchmarks: a multi-tenant catalog plus months of queue history.
+
+Creates --orgs organizations x --branches branches x --services services and
+--staff staff accounts per branch, then simulates every branch day of the
+--days before --end: arrivals follow a morning-heavy hourly curve scaled by
+weekday, each ticket waits for the first free staff member of its service
+(FIFO), is served for a log-normal duration around the service's estimate,
+or is a no-show, or leaves after MAX_WAIT_MINUTES. Some completed visits are
+transferred to another service (a parent_queue_id chain keeping the ticket
+number) and some are rated. The end date gets --waiting open tickets per
+branch. Finished tickets older than --archive-after-days land in
+queues_archive, as archive_worker would have moved them.
+
+Rows are written with executemany in --batch sized chunks inside one
+transaction, with the journal off, synchronous off and the secondary indexes
+dropped; indexes, WAL mode, daily counters and analytics rollups are restored
+afterwards. The output depends only on the arguments: the same --seed and
+--end give the same database, so benchmark numbers stay comparable.
+
+    python generate_dataset.py --db /tmp/bench.db --orgs 20 --days 180 --seed 1
+"""
+import argparse
+import heapq
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+# Arrivals per opening hour, relative (morning rush, lunch dip, small afternoon bump)
+HOUR_WEIGHTS = {8: 7, 9: 14, 10: 15, 11: 12, 12: 7, 13: 6, 14: 9, 15: 9, 16: 8, 17: 5, 18: 3}
+# Monday .. Sunday
+WEEKDAY_FACTORS = (1.2, 1.05, 1.0, 1.0, 0.9, 0.5, 0.15)
+OPENING_HOUR = 8
+CLOSING_HOUR = 19
+MAX_WAIT_MINUTES = 180
+MAX_TRANSFER_DEPTH = 3
+NO_SHOW_MINUTES = 2
+SERVICE_DURATION_SIGMA = 0.35
+SERVICE_CATALOG = (
+    ("Terapevt", 15), ("Pediatr", 15), ("Stomatolog", 30), ("Ginekolog", 20), ("Kardiolog", 20),
+    ("Nevrolog", 20), ("Laboratoriya", 10), ("UZI", 15), ("Okulist", 15), ("LOR", 15),
+)
+RATING_WEIGHTS = (3, 4, 10, 28, 55)   # 1..5 stars
+RATING_COMMENTS = ("", "", "", "Rahmat!", "Juda yaxshi xizmat", "Navbat uzoq bo'ldi", "Shifokor e'tiborli")
+STAFF_PASSWORD = "bench12345"
+# bcrypt of STAFF_PASSWORD, fixed so the output is byte-for-byte reproducible
+STAFF_PASSWORD_HASH = "$2b$12$6TS7n8vuJyku0WfKLdlR6.2gwit4ZH9hSRAmX7mL.MHGrw3WzNoBK"
+
+QUEUE_COLUMNS = ('id', 'phone', 'number', 'status', 'date', 'time', 'staff_id', 'service_id', 'branch_id',
+                 'org_id', 'created_at', 'last_notified', 'notification_level', 'notes', 'parent_queue_id',
+                 'called_at', 'completed_at')
+RATING_COLUMNS = ('queue_id', 'rating', 'comment', 'created_at', 'org_id', 'service_id')
+BULK_TABLES = ('queues', 'queues_archive', 'ratings')
+
+def _insert_sql(table, columns):
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+
+class BatchWriter:
+    """Buffers rows per table and flushes them with executemany."""
+
+    def __init__(self, conn, batch):
+        self.conn = conn
+        self.batch = batch
+        self.buffers = {}
+        self.written = {}
+        self.rows = 0
+
+    def add(self, table, columns, row):
+        buffer = self.buffers.setdefault((table, columns), [])
+        buffer.append(row)
+        self.rows += 1
+        if len(buffer) >= self.batch:
+            self.flush(table, columns)
+
+    def flush(self, table=None, columns=None):
+        keys = [(table, columns)] if table else list(self.buffers)
+        for key in keys:
+            rows = self.buffers.get(key)
+            if rows:
+                self.conn.executemany(_insert_sql(*key), rows)
+                self.written[key[0]] = self.written.get(key[0], 0) + len(rows)
+                rows.clear()
+
+class Generator:
+    def __init__(self, conn, args):
+        self.conn = conn
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.writer = BatchWriter(conn, args.batch)
+        self.archive_before = (args.end - timedelta(days=args.archive_after_days)).isoformat() if args.archive_after_days else None
+
+    def new_id(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def short_id(self):
+        return f"{self.rng.getrandbits(32):08x}"
+
+    # --- Catalog ---
+
+    def catalog(self):
+        password_hash = STAFF_PASSWORD_HASH
+        created = datetime.combine(self.args.end - timedelta(days=self.args.days + 30), datetime.min.time()).isoformat()
+        branches = []
+        user_seq = 0
+        for o in range(self.args.orgs):
+            org_id = self.short_id()
+            self.conn.execute('INSERT INTO organizations (id, name, created_at) VALUES (?, ?, ?)',
+                              (org_id, f"Klinika {o + 1}", created))
+            user_seq += 1
+            self.conn.execute(
+                'INSERT INTO users (phone, user_id, username, role, org_id, password_hash, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (f"+99899{user_seq:07d}", f"admin-{org_id}", f"Admin {o + 1}", 'org_admin', org_id, password_hash, created))
+            for b in range(self.args.branches):
+                branch_id = self.short_id()
+                self.conn.execute('INSERT INTO branches (id, org_id, name, address) VALUES (?, ?, ?, ?)',
+                                  (branch_id, org_id, f"Filial {b + 1}", f"{b + 1}-ko'cha"))
+                services = []
+                for s in range(self.args.services):
+                    name, minutes = SERVICE_CATALOG[s % len(SERVICE_CATALOG)]
+                    service_id = self.short_id()
+                    self.conn.execute(
+                        'INSERT INTO services (id, org_id, branch_id, name_uz, estimated_duration) VALUES (?, ?, ?, ?, ?)',
+                        (service_id, org_id, branch_id, name, minutes))
+                    services.append({"id": service_id, "name": name, "minutes": minutes,
+                                     "letter": chr(ord('A') + s % 26), "staff": []})
+                # Some services are far busier than others
+                weights = [1 / (i + 1) for i in range(len(services))]
+                self.rng.shuffle(weights)
+                staff_ids = []
+                for k in range(self.args.staff):
+                    user_seq += 1
+                    staff_id = f"staff-{branch_id}-{k + 1}"
+                    self.conn.execute(
+                        'INSERT INTO users (phone, user_id, username, role, org_id, branch_id, password_hash, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (f"+99899{user_seq:07d}", staff_id, f"Xodim {k + 1}", 'staff', org_id, branch_id, password_hash, created))
+                    staff_ids.append(staff_id)
+                self.assign_staff(services, weights, staff_ids)
+                branches.append({"id": branch_id, "org_id": org_id, "services": services, "weights": weights})
+        return branches
+
+    @staticmethod
+    def assign_staff(services, weights, staff_ids):
+        """One staff member per service, the rest to the services with the most work per head."""
+        if len(staff_ids) < len(services):
+            for i, service in enumerate(services):
+                service["staff"].append(staff_ids[i % len(staff_ids)])
+            return
+        for service, staff_id in zip(services, staff_ids):
+            service["staff"].append(staff_id)
+        load = [weight * service["minutes"] for weight, service in zip(weights, services)]
+        for staff_id in staff_ids[len(services):]:
+            busiest = max(range(len(services)), key=lambda i: load[i] / len(services[i]["staff"]))
+            services[busiest]["staff"].append(staff_id)
+
+    # --- Queue History ---
+
+    def patient_phone(self):
+        return f"+99890{self.rng.randrange(self.args.patients):07d}"
+
+    def write_queue(self, row, finished):
+        table = 'queues'
+        if finished and self.archive_before and row[10] < self.archive_before:
+            table = 'queues_archive'
+        self.writer.add(table, QUEUE_COLUMNS, row)
+
+    def simulate_day(self, branch, day):
+        rng = self.rng
+        mean = self.args.patients_per_day * WEEKDAY_FACTORS[day.weekday()]
+        arrivals = max(0, round(rng.gauss(mean, math.sqrt(mean)))) if mean else 0
+        midnight = datetime.combine(day, datetime.min.time())
+        opening = midnight + timedelta(hours=OPENING_HOUR)
+        hours = rng.choices(list(HOUR_WEIGHTS), list(HOUR_WEIGHTS.values()), k=arrivals)
+        services = rng.choices(range(len(branch["services"])), branch["weights"], k=arrivals)
+        pending = []   # (arrival, seq, service index, parent ticket or None)
+        for seq, (hour, service) in enumerate(zip(hours, services)):
+            pending.append((midnight + timedelta(seconds=hour * 3600 + rng.randrange(3600)), seq, service, None))
+        heapq.heapify(pending)
+        seq = arrivals
+        staff_free = {}
+        numbers = {}
+        date_str = day.isoformat()
+        closing = midnight + timedelta(hours=CLOSING_HOUR)
+
+        while pending:
+            arrival, _, s, parent = heapq.heappop(pending)
+            service = branch["services"][s]
+            staff_id = min(service["staff"], key=lambda sid: staff_free.get(sid, opening))
+            called = max(arrival, staff_free.get(staff_id, opening))
+            q_id = self.new_id()
+            if parent:
+                phone, number, notes, parent_id, depth = parent
+            else:
+                numbers[s] = numbers.get(s, 0) + 1
+                phone, number, notes, parent_id, depth = self.patient_phone(), f"{service['letter']}-{numbers[s]:03d}", None, None, 0
+            called_at = completed_at = None
+            if called - arrival > timedelta(minutes=MAX_WAIT_MINUTES) or called >= closing:
+                status = 'cancelled'   # left without being seen
+            elif rng.random() < self.args.no_show_rate:
+                status = 'no-show'
+                called_at, completed_at = called, called + timedelta(minutes=NO_SHOW_MINUTES)
+                staff_free[staff_id] = completed_at
+            else:
+                status = 'completed'
+                seconds = service["minutes"] * 60 * rng.lognormvariate(0, SERVICE_DURATION_SIGMA)
+                called_at, completed_at = called, called + timedelta(seconds=round(seconds))
+                staff_free[staff_id] = completed_at
+            created_at = arrival.isoformat()
+            self.write_queue((
+                q_id, phone, number, status, date_str, arrival.strftime('%H:%M'), staff_id, service["id"],
+                branch["id"], branch["org_id"], created_at, created_at, 0, notes, parent_id,
+                called_at and called_at.isoformat(), completed_at and completed_at.isoformat(),
+            ), finished=True)
+            if status != 'completed':
+                continue
+            if rng.random() < self.args.rating_rate:
+                rated_at = completed_at + timedelta(minutes=rng.randrange(1, 120))
+                self.writer.add('ratings', RATING_COLUMNS, (
+                    q_id, rng.choices(range(1, 6), RATING_WEIGHTS)[0], rng.choice(RATING_COMMENTS),
+                    rated_at.isoformat(), branch["org_id"], service["id"]))
+            if depth < MAX_TRANSFER_DEPTH and len(branch["services"]) > 1 and rng.random() < self.args.transfer_rate:
+                target = rng.choice([i for i in range(len(branch["services"])) if i != s])
+                referral = completed_at + timedelta(minutes=rng.randrange(1, 10))
+                seq += 1
+                heapq.heappush(pending, (referral, seq, target, (
+                    phone, number, f"Yo'llanma: {service['name']}", q_id, depth + 1)))
+
+    def open_tickets(self, branch, day):
+        """Waiting walk-ins on the end date, in arrival order."""
+        opening = datetime.combine(day, datetime.min.time()) + timedelta(hours=OPENING_HOUR)
+        for i in range(self.args.waiting):
+            s = self.rng.choices(range(len(branch["services"])), branch["weights"])[0]
+            service = branch["services"][s]
+            created_at = (opening + timedelta(seconds=i * 45)).isoformat()
+            self.write_queue((
+                self.new_id(), self.patient_phone(), f"{service['letter']}-{900 + i:03d}", 'waiting',
+                day.isoformat(), None, None, service["id"], branch["id"], branch["org_id"],
+                created_at, created_at, 0, None, None, None, None,
+            ), finished=False)
+
+    def run(self):
+        branches = self.catalog()
+        print(f"Catalog: {self.args.orgs} orgs, {len(branches)} branches, "
+              f"{len(branches) * self.args.services} services, {len(branches) * self.args.staff} staff")
+        start = self.args.end - timedelta(days=self.args.days)
+        started = time.perf_counter()
+        for d in range(self.args.days):
+            day = start + timedelta(days=d)
+            for branch in branches:
+                self.simulate_day(branch, day)
+            if (d + 1) % 10 == 0 or d + 1 == self.args.days:
+                rows = self.writer.rows
+                print(f"  {day}  {rows:>12,} rows  {rows / (time.perf_counter() - started):>10,.0f} rows/s")
+        for branch in branches:
+            self.open_tickets(branch, self.args.end)
+        self.writer.flush()
+        return self.writer.written
+
+# --- Bulk Load ---
+
+def _drop_secondary_indexes(conn):
+    marks = ', '.join('?' for _ in BULK_TABLES)
+    indexes = conn.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+                           f"AND tbl_name IN ({marks})", BULK_TABLES).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", required=True, help="database file to create")
+    parser.add_argument("--overwrite", action="store_true", help="replace --db if it exists")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today(),
+                        help="YYYY-MM-DD, the 'today' of the dataset (default: today)")
+    parser.add_argument("--days", type=int, default=90, help="days of history before --end")
+    parser.add_argument("--orgs", type=int, default=5)
+    parser.add_argument("--branches", type=int, default=3, help="per organization")
+    parser.add_argument("--services", type=int, default=6, help="per branch")
+    parser.add_argument("--staff", type=int, default=8, help="per branch")
+    parser.add_argument("--patients-per-day", type=float, default=200, help="mean arrivals per branch on a weekday")
+    parser.add_argument("--patients", type=int, default=200000, help="distinct patient phones")
+    parser.add_argument("--no-show-rate", type=float, default=0.08)
+    parser.add_argument("--transfer-rate", type=float, default=0.12)
+    parser.add_argument("--rating-rate", type=float, default=0.3)
+    parser.add_argument("--waiting", type=int, default=40, help="open tickets per branch on --end")
+    parser.add_argument("--archive-after-days", type=int, default=90, help="0 keeps all history live")
+    parser.add_argument("--batch", type=int, default=50000, help="rows per executemany")
+    args = parser.parse_args()
+
+    estimate = args.orgs * args.branches * args.days * args.patients_per_day * (1 + args.transfer_rate)
+    print(f"Generating ~{estimate:,.0f} queue rows into {args.db} (seed {args.seed}, end {args.end})")
+    if os.path.exists(args.db):
+        if not args.overwrite:
+            sys.exit(f"{args.db} exists; pass --overwrite to replace it")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    # Schema through the regular migrations, then a private connection for the load
+    os.environ["DB_NAME"] = args.db
+    import database
+    database.init_db()
+    database.close_all_connections()
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('BEGIN')
+    index_sql = _drop_secondary_indexes(conn)
+    written = Generator(conn, args).run()
+    print(f"Rebuilding {len(index_sql)} indexes...")
+    for sql in index_sql:
+        conn.execute(sql)
+    print("Rebuilding daily counters...")
+    database._rebuild_daily_counters(conn)
+    conn.execute('COMMIT')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.close()
+
+    print("Rebuilding analytics rollups...")
+    database.backfill_analytics_rollups()
+    conn = database.get_db_connection()
+    conn.execute('ANALYZE')
+    conn.close()
+    database.close_all_connections()
+
+    for table, rows in sorted(written.items()):
+        print(f"  {table:<16}{rows:>14,}")
+    print(f"✅ Done in {time.perf_counter() - started:.1f}s. Staff password: {STAFF_PASSWORD}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import argparse
+import os
+import database
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a legacy verifications.json into the verifications table")
+    parser.add_argument("path", nargs="?", default=os.path.join(database.BASE_DIR, "verifications.json"))
+    args = parser.parse_args()
+
+    database.init_db()
+    if not os.path.exists(args.path):
+        print(f"❌ Fayl topilmadi: {args.path}")
+        return
+    count = database.import_verifications_json(args.path)
+    print(f"✅ {count} ta yozuv import qilindi")
+
+if __name__ == "__main__":
+    main()
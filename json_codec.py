@@ -0,0 +1,60 @@
+import decimal
+import json
+import sqlite3
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- JSON Encoding ---
+# API responses are encoded with orjson when it is installed (several times
+# faster than the stdlib on the big listings), otherwise with the stdlib.
+# Both produce compact UTF-8 with keys in insertion order. orjson writes
+# datetimes as ISO 8601; the API itself only returns the strings SQLite
+# stores.
+
+def _default(o):
+    if isinstance(o, sqlite3.Row):
+        return dict(o)
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+if orjson is not None:
+    def dumps_bytes(obj):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    loads = orjson.loads
+else:
+    def dumps_bytes(obj):
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    loads = json.loads
+
+def dumps(obj):
+    return dumps_bytes(obj).decode('utf-8')
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider (app.json) backed by dumps_bytes/loads."""
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Explicit options (indent, sort_keys) go through the stdlib
+            kwargs.setdefault('default', _default)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        # jsonify(): encode straight to bytes, no str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
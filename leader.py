@@ -0,0 +1,74 @@
+import atexit
+import os
+import socket
+import time
+import uuid
+import database
+import offload
+
+# --- Leader Election ---
+# Background jobs that must run once per deployment (reminder scheduler, bot
+# polling, counter reconcile, archival) run only in the process holding the
+# 'background-jobs' lease in SQLite. The leader renews it every ttl/3; if it
+# dies the lease expires and another worker takes over within ttl seconds.
+
+LEADER_LEASE_SECONDS = int(os.getenv("LEADER_LEASE_SECONDS", "30"))
+
+class LeaderElector:
+    def __init__(self, name='background-jobs', ttl=LEADER_LEASE_SECONDS):
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._elected = offload.Event()
+        self._on_lost = []
+        self._thread = None
+        self._released = False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = offload.start_thread(self._run)
+            atexit.register(self.release)
+        return self
+
+    def on_lost(self, callback):
+        self._on_lost.append(callback)
+
+    def wait_until_leader(self, timeout=None):
+        return self._elected.wait(timeout)
+
+    def release(self):
+        """Give the lease up now (shutdown) instead of letting it expire."""
+        self._released = True
+        if self.is_leader:
+            self._set_leader(False)
+            try:
+                database.release_lease(self.name, self.holder)
+            except Exception:
+                pass
+
+    def _set_leader(self, leader):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        if leader:
+            print(f"Leader election: {self.holder} now runs background jobs")
+            self._elected.set()
+        else:
+            print(f"Leader election: {self.holder} lost the lease")
+            self._elected.clear()
+            for callback in self._on_lost:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Leader on_lost error: {e}")
+
+    def _run(self):
+        while not self._released:
+            try:
+                self._set_leader(database.acquire_lease(self.name, self.holder, self.ttl))
+            except Exception as e:
+                # Can't confirm the lease: stop acting as leader before it lapses
+                print(f"Leader election error: {e}")
+                self._set_leader(False)
+            time.sleep(self.ttl / 3.0)
@@ -0,0 +1,86 @@
+import math
+import os
+import time
+from collections import OrderedDict
+import offload
+
+# --- Login Throttling ---
+# Password logins are rate limited per client IP and per phone with token
+# buckets: each attempt takes a token, tokens refill at a steady rate, and an
+# empty bucket is answered with 429 + Retry-After instead of sleeping the
+# request thread. The IP bucket is roomier (a clinic's staff may share one
+# NAT address); a successful login refills the phone's bucket. Buckets live
+# in LRU-bounded dicts of at most LOGIN_LIMITER_MAX_KEYS entries each.
+#
+# At most BCRYPT_WORKERS bcrypt checks run at once (each is ~250 ms of CPU);
+# up to BCRYPT_BACKLOG may wait for a slot and further logins are turned away
+# (503) rather than piling more request threads up behind them.
+
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "30"))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "30"))
+LOGIN_PHONE_BURST = int(os.getenv("LOGIN_PHONE_BURST", "5"))
+LOGIN_PHONE_PER_MINUTE = float(os.getenv("LOGIN_PHONE_PER_MINUTE", "2"))
+LOGIN_LIMITER_MAX_KEYS = int(os.getenv("LOGIN_LIMITER_MAX_KEYS", "10000"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "4"))
+BCRYPT_BACKLOG = int(os.getenv("BCRYPT_BACKLOG", "16"))
+
+class TokenBuckets:
+    def __init__(self, capacity, per_minute, maxsize=LOGIN_LIMITER_MAX_KEYS):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.maxsize = maxsize
+        self._lock = offload.Lock()
+        self._buckets = OrderedDict()   # key -> (tokens, monotonic stamp)
+
+    def take(self, key):
+        """Take a token for key. Returns 0 if allowed, else seconds until one is due."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - stamp) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def refill(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+ip_buckets = TokenBuckets(LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE)
+phone_buckets = TokenBuckets(LOGIN_PHONE_BURST, LOGIN_PHONE_PER_MINUTE)
+
+def _phone_key(phone):
+    return (phone or '').strip().lower()
+
+def throttle(ip, phone):
+    """Whole seconds the caller must wait before another attempt (0: go ahead)."""
+    wait = max(ip_buckets.take(ip or ''), phone_buckets.take(_phone_key(phone)))
+    return math.ceil(wait)
+
+def forgive(phone):
+    phone_buckets.refill(_phone_key(phone))
+
+class PasswordCheckBusy(Exception):
+    pass
+
+_bcrypt_workers = offload.BoundedSemaphore(BCRYPT_WORKERS)
+_bcrypt_backlog = offload.BoundedSemaphore(BCRYPT_WORKERS + BCRYPT_BACKLOG)
+
+def check_password(check, *args):
+    """Run check(*args) (a bcrypt comparison) within the bcrypt bounds and return its result."""
+    if not _bcrypt_backlog.acquire(blocking=False):
+        raise PasswordCheckBusy()
+    try:
+        with _bcrypt_workers:
+            return check(*args)
+    finally:
+        _bcrypt_backlog.release()
@@ -0,0 +1,195 @@
+import bisect
+import math
+import sys
+import time
+from contextlib import contextmanager
+import offload
+
+# --- Metrics ---
+# Counters, gauges and histograms rendered in the Prometheus text exposition
+# format by render() (served at /metrics). The hot path takes no lock: every
+# native thread updates its own shard (greenlets on one thread never
+# interleave inside an update), and render() sums the shards. Shards of
+# threads that have exited are folded into a retired shard at render time.
+# Label values are passed positionally, in the order of the metric's labels.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+class _Shard:
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}      # (metric, label values) -> number
+        self.histograms = {}    # (metric, label values) -> [bucket counts..., +Inf count, sum]
+
+_shards = {}                # native thread id -> _Shard
+_retired = _Shard()
+_render_lock = offload.Lock()
+_metrics = []
+
+def _shard():
+    shard = _shards.get(offload.get_ident())
+    if shard is None:
+        shard = _shards.setdefault(offload.get_ident(), _Shard())
+    return shard
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        _metrics.append(self)
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        counters = _shard().counters
+        key = (self, label_values)
+        counters[key] = counters.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """set() values (last write wins), inc()/dec() deltas, or a collect() callback.
+
+    collect() returns {label values tuple: value} and runs at render time.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None):
+        super().__init__(name, help, labels)
+        self.collect = collect
+        self._values = {}
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        counters = _shard().counters
+        key = (self, label_values)
+        counters[key] = counters.get(key, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        histograms = _shard().histograms
+        key = (self, label_values)
+        data = histograms.get(key)
+        if data is None:
+            data = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        data[bisect.bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+# --- Exposition ---
+
+def _retire_dead_shards():
+    alive = sys._current_frames().keys()
+    for ident in [ident for ident in list(_shards) if ident not in alive]:
+        shard = _shards.pop(ident, None)
+        if shard is not None:
+            _merge_into(_retired.counters, _retired.histograms, shard)
+
+def _merge_into(counters, histograms, shard):
+    for key, value in list(shard.counters.items()):
+        counters[key] = counters.get(key, 0) + value
+    for key, data in list(shard.histograms.items()):
+        total = histograms.get(key)
+        if total is None:
+            histograms[key] = list(data)
+        else:
+            for i, value in enumerate(data):
+                total[i] += value
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _render_lock:
+        _retire_dead_shards()
+        counters, histograms = {}, {}
+        _merge_into(counters, histograms, _retired)
+        for shard in list(_shards.values()):
+            _merge_into(counters, histograms, shard)
+
+    lines = []
+    for metric in _metrics:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        if isinstance(metric, Histogram):
+            for (m, label_values), data in histograms.items():
+                if m is not metric:
+                    continue
+                cumulative = 0
+                for le, count in zip(metric.buckets + (math.inf,), data):
+                    cumulative += count
+                    lines.append(f'{metric.name}_bucket{_labels(metric.labels, label_values, [("le", _number(le))])} {cumulative}')
+                lines.append(f'{metric.name}_sum{_labels(metric.labels, label_values)} {_number(data[-1])}')
+                lines.append(f'{metric.name}_count{_labels(metric.labels, label_values)} {cumulative}')
+            continue
+        values = {label_values: value for (m, label_values), value in counters.items() if m is metric}
+        if isinstance(metric, Gauge):
+            for label_values, value in list(metric._values.items()):
+                values[label_values] = values.get(label_values, 0) + value
+            if metric.collect is not None:
+                try:
+                    values.update(metric.collect())
+                except Exception as e:
+                    print(f"Metrics collect error ({metric.name}): {e}")
+        for label_values, value in values.items():
+            lines.append(f'{metric.name}{_labels(metric.labels, label_values)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+# --- Application Metrics ---
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency (its _count is the request count)',
+    ('route', 'method', 'status'))
+SQLITE_QUERIES_PER_REQUEST = Histogram(
+    'sqlite_queries_per_request', 'SQLite statements executed per HTTP request',
+    ('route',), buckets=QUERY_COUNT_BUCKETS)
+SQLITE_SECONDS_PER_REQUEST = Histogram(
+    'sqlite_query_seconds_per_request', 'Time spent executing SQLite statements per HTTP request', ('route',))
+OUTBOUND_SECONDS = Histogram(
+    'outbound_request_duration_seconds', 'Latency of calls to external APIs', ('service',))
+OUTBOUND_ERRORS = Counter(
+    'outbound_request_errors_total', 'Failed calls to external APIs', ('service',))
+SOCKET_CLIENTS = Gauge('socketio_connected_clients', 'Connected Socket.IO clients')
+SOCKET_EMITS = Counter('socketio_emits_total', 'Socket.IO events emitted', ('event',))
+JOB_LAST_TICK = Gauge(
+    'background_job_last_tick_timestamp_seconds', 'Unix time a background job last completed a pass', ('job',))
+WAITING_TICKETS = Gauge('waiting_tickets', "Today's waiting tickets per branch", ('branch_id',))
+
+@contextmanager
+def outbound(service):
+    """Time a call to an external API; an exception counts as an error."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        OUTBOUND_ERRORS.inc(service)
+        raise
+    finally:
+        OUTBOUND_SECONDS.observe(time.perf_counter() - started, service)
+
+def tick(job):
+    JOB_LAST_TICK.set(time.time(), job)
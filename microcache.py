@@ -0,0 +1,110 @@
+import os
+import time
+from collections import OrderedDict
+import offload
+
+# --- Response Micro-Cache ---
+# Short-lived cache for public read endpoints that every patient page hits
+# (branch list, wait times, booked slots, bot username). Identical concurrent
+# requests share one computation (single flight); entries expire after a few
+# seconds, are evicted LRU beyond RESPONSE_CACHE_SIZE, and are dropped
+# explicitly when database.py commits a change to a scope they were tagged
+# with. Tags are (scope, scope_id) pairs, like the scope versions.
+#
+# Under gevent the callers are request threads in offload's native pool, so
+# the cache uses offload's native locks.
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "2"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+
+class _Flight:
+    def __init__(self):
+        self._done = offload.Lock()
+        self._done.acquire()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        with self._done:
+            pass
+
+    def set(self):
+        self._done.release()
+
+class ResponseCache:
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = offload.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value, tags)
+        self._inflight = {}             # key -> _Flight
+        self._tag_seq = {}              # tag -> sequence number of its last invalidation
+        self._seq = 0
+        self.hits = self.misses = self.coalesced = self.evictions = self.invalidations = 0
+
+    def get(self, key, compute, ttl=None, tags=()):
+        """Cached value for key, else compute() once for all concurrent callers."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                started_seq = self._seq
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        else:
+            with self._lock:
+                # A mutation committed while computing: serve this result, don't keep it
+                if not any(self._tag_seq.get(tag, -1) > started_seq for tag in tags):
+                    self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), flight.value, tuple(tags))
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+            return flight.value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.set()
+
+    def invalidate(self, *tags):
+        tags = set(tags)
+        with self._lock:
+            self._seq += 1
+            for tag in tags:
+                self._tag_seq[tag] = self._seq
+            stale = [key for key, (_, _, entry_tags) in self._entries.items() if tags.intersection(entry_tags)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "coalesced": self.coalesced, "evictions": self.evictions, "invalidations": self.invalidations
+            }
+
+response_cache = ResponseCache()
@@ -1,33 +1,533 @@
-import sqlite3
-from flask_bcrypt import Bcrypt
-from flask import Flask
 import database
+import json
 import os
+import time
+from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = Flask(__name__)
-bcrypt = Bcrypt(app)
+# --- Versioned Schema Migrations ---
+# Each step runs once, in order, inside its own transaction and is recorded in
+# the schema_version table. Steps are written to be idempotent so databases
+# created by the old ad-hoc ALTER TABLE code upgrade cleanly.
+
+def _columns(conn, table):
+    return {row['name'] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()}
+
+def _add_column(conn, table, column, definition):
+    if column not in _columns(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def _m001_base_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS organizations (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            license_status TEXT DEFAULT 'active',
+            created_at TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS branches (
+            id TEXT PRIMARY KEY,
+            org_id TEXT,
+            name TEXT NOT NULL,
+            address TEXT,
+            FOREIGN KEY (org_id) REFERENCES organizations(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS queues (
+            id TEXT PRIMARY KEY,
+            phone TEXT NOT NULL,
+            number TEXT,
+            status TEXT DEFAULT 'waiting',
+            date TEXT,
+            time TEXT,
+            staff_id TEXT,
+            service_id TEXT,
+            branch_id TEXT,
+            org_id TEXT,
+            created_at TEXT,
+            last_notified TEXT,
+            notification_level INTEGER DEFAULT 0,
+            notes TEXT, -- Medical notes or results
+            parent_queue_id TEXT, -- For tracking referrals/transfers
+            FOREIGN KEY (org_id) REFERENCES organizations(id)
+        )
+    ''')
+    # users table (Roles: system_admin, org_admin, staff, user)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            phone TEXT PRIMARY KEY,
+            user_id TEXT,
+            username TEXT,
+            role TEXT DEFAULT 'user',
+            org_id TEXT,
+            branch_id TEXT,
+            password_hash TEXT,
+            created_at TEXT,
+            FOREIGN KEY (org_id) REFERENCES organizations(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS services (
+            id TEXT PRIMARY KEY,
+            org_id TEXT,
+            name_uz TEXT,
+            name_ru TEXT,
+            name_en TEXT,
+            branch_id TEXT,
+            estimated_duration INTEGER DEFAULT 15,
+            FOREIGN KEY (org_id) REFERENCES organizations(id)
+        )
+    ''')
+
+def _m002_multi_tenant_columns(conn):
+    # Databases created before multi-tenancy are missing these
+    _add_column(conn, 'users', 'role', "TEXT DEFAULT 'user'")
+    _add_column(conn, 'users', 'org_id', 'TEXT')
+    _add_column(conn, 'users', 'branch_id', 'TEXT')
+    _add_column(conn, 'users', 'password_hash', 'TEXT')
+    _add_column(conn, 'queues', 'org_id', 'TEXT')
+    _add_column(conn, 'queues', 'notes', 'TEXT')
+    _add_column(conn, 'queues', 'parent_queue_id', 'TEXT')
+    _add_column(conn, 'services', 'org_id', 'TEXT')
+
+def _m003_lifecycle_columns_and_ratings(conn):
+    # Written by call-next / complete / no-show but never created before
+    _add_column(conn, 'queues', 'called_at', 'TEXT')
+    _add_column(conn, 'queues', 'completed_at', 'TEXT')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ratings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            queue_id TEXT,
+            rating INTEGER,
+            comment TEXT,
+            created_at TEXT,
+            FOREIGN KEY (queue_id) REFERENCES queues(id)
+        )
+    ''')
+
+def _m004_hot_path_indexes(conn):
+    # Staff queue list and call-next: branch + status ordered by arrival
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_branch_status_created ON queues (branch_id, status, created_at)')
+    # Queue position and per-service wait times
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_service_branch_status_created ON queues (service_id, branch_id, status, created_at)')
+    # Daily booking limit and patient history
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_phone_date ON queues (phone, date)')
+    # Today's queues, admin stats, analytics and booked slots
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_date_org_status ON queues (date, org_id, status)')
+    # Double-booking check
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_staff_date_time ON queues (staff_id, date, time)')
+    # "OR status = 'waiting'" branch of get_todays_queues and admin call-next
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_status_created ON queues (status, created_at)')
+    # Per-org ratings and feedback
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_org_created ON queues (org_id, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ratings_queue ON ratings (queue_id)')
+    # Catalog lookups by tenant
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_branches_org ON branches (org_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_services_org ON services (org_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_services_branch ON services (branch_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_org ON users (org_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)')
+
+def _m005_daily_counters(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_counters (
+            day TEXT NOT NULL,
+            scope TEXT NOT NULL, -- all, org, branch, service, staff
+            scope_id TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            waiting INTEGER NOT NULL DEFAULT 0,
+            called INTEGER NOT NULL DEFAULT 0,
+            serving INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            no_show INTEGER NOT NULL DEFAULT 0,
+            cancelled INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, scope, scope_id)
+        ) WITHOUT ROWID
+    ''')
+    # Backfill existing history (queues_all does not exist yet at this version).
+    # Inline SQL so this step keeps doing what it did when it was written,
+    # whatever database.py's counter code becomes.
+    conn.execute('DELETE FROM daily_counters')
+    for scope, scope_expr in (('all', "''"), ('org', 'org_id'), ('branch', 'branch_id'),
+                              ('service', 'service_id'), ('staff', 'staff_id')):
+        conn.execute(f'''
+            INSERT INTO daily_counters (day, scope, scope_id, total, waiting, called, serving, completed, no_show, cancelled)
+            SELECT COALESCE(date, ''), '{scope}', {scope_expr}, COUNT(*),
+                   SUM(status = 'waiting'), SUM(status = 'called'), SUM(status = 'serving'),
+                   SUM(status = 'completed'), SUM(status IN ('no-show', 'noshow')), SUM(status = 'cancelled')
+            FROM queues
+            GROUP BY COALESCE(date, ''), {scope_expr}
+            HAVING {scope_expr} IS NOT NULL
+        ''')
+
+def _m006_analytics_rollups(conn):
+    for table, period in (('analytics_hourly', 'hour'), ('analytics_daily', 'day')):
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                org_id TEXT NOT NULL,
+                {period} TEXT NOT NULL, -- {'YYYY-MM-DDTHH' if period == 'hour' else 'YYYY-MM-DD'}
+                branch_id TEXT NOT NULL,
+                service_id TEXT NOT NULL,
+                arrivals INTEGER NOT NULL DEFAULT 0,
+                completions INTEGER NOT NULL DEFAULT 0,
+                no_shows INTEGER NOT NULL DEFAULT 0,
+                wait_seconds REAL NOT NULL DEFAULT 0,
+                waits INTEGER NOT NULL DEFAULT 0,
+                service_seconds REAL NOT NULL DEFAULT 0,
+                serviced INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (org_id, {period}, branch_id, service_id)
+            ) WITHOUT ROWID
+        ''')
+        # System-admin ranges span every org
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{period} ON {table} ({period})')
+    # Arrivals by hour of day per month, for long-range traffic charts
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_hour_profile (
+            org_id TEXT NOT NULL,
+            month TEXT NOT NULL, -- YYYY-MM
+            hod TEXT NOT NULL, -- 00..23
+            branch_id TEXT NOT NULL,
+            service_id TEXT NOT NULL,
+            arrivals INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (org_id, month, hod, branch_id, service_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_analytics_hour_profile_month ON analytics_hour_profile (month)')
+    # Backfill existing history (queues_all does not exist yet at this version),
+    # inline for the same reason as 005: arrivals at created_at, completions
+    # and no-shows at completed_at, waits at called_at
+    conn.execute('DELETE FROM analytics_hourly')
+    conn.execute('DELETE FROM analytics_daily')
+    conn.execute('DELETE FROM analytics_hour_profile')
+    conn.execute('''
+        INSERT INTO analytics_hourly (org_id, hour, branch_id, service_id, arrivals, completions, no_shows,
+                                      wait_seconds, waits, service_seconds, serviced)
+        SELECT org_id, hour, branch_id, service_id, SUM(arrivals), SUM(completions), SUM(no_shows),
+               SUM(wait_seconds), SUM(waits), SUM(service_seconds), SUM(serviced)
+        FROM (
+            SELECT COALESCE(org_id, '') AS org_id, substr(created_at, 1, 13) AS hour,
+                   COALESCE(branch_id, '') AS branch_id, COALESCE(service_id, '') AS service_id,
+                   1 AS arrivals, 0 AS completions, 0 AS no_shows, 0 AS wait_seconds, 0 AS waits,
+                   0 AS service_seconds, 0 AS serviced
+            FROM queues WHERE created_at IS NOT NULL
+            UNION ALL
+            SELECT COALESCE(org_id, ''), substr(completed_at, 1, 13), COALESCE(branch_id, ''), COALESCE(service_id, ''),
+                   0, 1, 0, 0, 0,
+                   CASE WHEN called_at IS NOT NULL THEN MAX((julianday(completed_at) - julianday(called_at)) * 86400, 0) ELSE 0 END,
+                   called_at IS NOT NULL
+            FROM queues WHERE status = 'completed' AND completed_at IS NOT NULL
+            UNION ALL
+            SELECT COALESCE(org_id, ''), substr(completed_at, 1, 13), COALESCE(branch_id, ''), COALESCE(service_id, ''),
+                   0, 0, 1, 0, 0, 0, 0
+            FROM queues WHERE status IN ('no-show', 'noshow') AND completed_at IS NOT NULL
+            UNION ALL
+            SELECT COALESCE(org_id, ''), substr(called_at, 1, 13), COALESCE(branch_id, ''), COALESCE(service_id, ''),
+                   0, 0, 0, MAX((julianday(called_at) - julianday(created_at)) * 86400, 0), 1, 0, 0
+            FROM queues WHERE called_at IS NOT NULL AND created_at IS NOT NULL
+        )
+        GROUP BY org_id, hour, branch_id, service_id
+    ''')
+    conn.execute('''
+        INSERT INTO analytics_daily (org_id, day, branch_id, service_id, arrivals, completions, no_shows,
+                                     wait_seconds, waits, service_seconds, serviced)
+        SELECT org_id, substr(hour, 1, 10), branch_id, service_id, SUM(arrivals), SUM(completions), SUM(no_shows),
+               SUM(wait_seconds), SUM(waits), SUM(service_seconds), SUM(serviced)
+        FROM analytics_hourly
+        GROUP BY org_id, substr(hour, 1, 10), branch_id, service_id
+    ''')
+    conn.execute('''
+        INSERT INTO analytics_hour_profile (org_id, month, hod, branch_id, service_id, arrivals)
+        SELECT COALESCE(org_id, ''), substr(created_at, 1, 7), substr(created_at, 12, 2),
+               COALESCE(branch_id, ''), COALESCE(service_id, ''), COUNT(*)
+        FROM queues
+        WHERE created_at IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5
+    ''')
+
+def _m007_queue_listing_indexes(conn):
+    # Keyset pagination of the admin listing on (created_at, id), per org and global
+    conn.execute('DROP INDEX IF EXISTS idx_queues_org_created')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_org_created_id ON queues (org_id, created_at, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_created_id ON queues (created_at, id)')
+
+QUEUES_ALL_COLUMNS_V8 = ('id', 'phone', 'number', 'status', 'date', 'time', 'staff_id', 'service_id', 'branch_id',
+                         'org_id', 'created_at', 'last_notified', 'notification_level', 'notes', 'parent_queue_id',
+                         'called_at', 'completed_at')
+
+def _m008_queue_archive(conn):
+    # Cold storage for finished tickets: the queues columns as of this version
+    # (001-003). A column added to queues later needs its own migration that
+    # adds it here too and recreates queues_all with it.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS queues_archive (
+            id TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            number TEXT,
+            status TEXT,
+            date TEXT,
+            time TEXT,
+            staff_id TEXT,
+            service_id TEXT,
+            branch_id TEXT,
+            org_id TEXT,
+            created_at TEXT,
+            last_notified TEXT,
+            notification_level INTEGER,
+            notes TEXT,
+            parent_queue_id TEXT,
+            called_at TEXT,
+            completed_at TEXT
+        )
+    ''')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_queues_archive_id ON queues_archive (id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_archive_phone_date ON queues_archive (phone, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_archive_date_org_status ON queues_archive (date, org_id, status)')
+    conn.execute('DROP VIEW IF EXISTS queues_all')
+    # Explicit columns: queues of a legacy database may have them in another order
+    columns = ', '.join(QUEUES_ALL_COLUMNS_V8)
+    conn.execute(f'CREATE VIEW queues_all AS SELECT {columns} FROM queues UNION ALL SELECT {columns} FROM queues_archive')
+
+    # Ratings carry their org/service so reports don't depend on the live table
+    _add_column(conn, 'ratings', 'org_id', 'TEXT')
+    _add_column(conn, 'ratings', 'service_id', 'TEXT')
+    conn.execute('''
+        UPDATE ratings SET
+            org_id = (SELECT org_id FROM queues WHERE queues.id = ratings.queue_id),
+            service_id = (SELECT service_id FROM queues WHERE queues.id = ratings.queue_id)
+        WHERE org_id IS NULL
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ratings_org_created ON ratings (org_id, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ratings_created ON ratings (created_at)')
+
+def _m009_telegram_outbox(conn):
+    # Outgoing Telegram messages, drained by notifier.py outside the request
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS telegram_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            method TEXT NOT NULL DEFAULT 'sendMessage',
+            payload TEXT NOT NULL, -- JSON body for the Bot API method
+            status TEXT NOT NULL DEFAULT 'pending', -- pending, sending, sent, dead
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL, -- unix time
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_telegram_outbox_status_next ON telegram_outbox (status, next_attempt_at)')
+
+# Frozen copy of database.import_verifications_json as of this version, run on
+# the migration's own connection and transaction
+LEGACY_VERIFICATION_TTL_HOURS = float(os.getenv("VERIFICATION_TTL_HOURS", "24"))
+
+def _legacy_phone(phone):
+    if any(c.isalpha() for c in phone):
+        return phone
+    digits = "".join(filter(str.isdigit, phone))
+    if not phone.startswith('+') and len(digits) == 9:
+        return "+998" + digits
+    return "+" + digits
+
+def _legacy_created_at(value):
+    try:
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value)
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+def _import_legacy_verifications(conn, path):
+    with open(path, 'r') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError:
+            data = {}
+    imported = skipped = 0
+    now = time.time()
+    for key, val in data.items():
+        if not isinstance(val, dict):
+            continue
+        # Records keep the expiry they had; expired or undated ones are dropped
+        created = _legacy_created_at(val.get('timestamp') or val.get('time'))
+        expires_at = created.timestamp() + LEGACY_VERIFICATION_TTL_HOURS * 3600 if created else None
+        if expires_at is None or expires_at < now:
+            skipped += 1
+            continue
+        if key.startswith('uid_'):
+            phone = _legacy_phone(val['phone']) if val.get('phone') else None
+            verified = val.get('verified', False)
+        else:
+            key = phone = _legacy_phone(key)
+            verified = False
+        user_id = val.get('user_id')
+        conn.execute('''
+            INSERT INTO verifications (key, user_id, phone, username, verified, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                user_id = COALESCE(excluded.user_id, verifications.user_id),
+                phone = COALESCE(excluded.phone, verifications.phone),
+                username = COALESCE(excluded.username, verifications.username),
+                verified = MAX(excluded.verified, verifications.verified),
+                expires_at = excluded.expires_at
+        ''', (key, str(user_id) if user_id is not None else None, phone, val.get('username'),
+              1 if verified else 0, created.isoformat(), expires_at))
+        imported += 1
+    print(f"Imported {imported} verification records from {path} ({skipped} expired or undated skipped)")
+
+def _m010_verifications(conn):
+    # Telegram login sessions (key 'uid_<uid>') and phone -> chat records
+    # (key = phone), formerly kept in verifications.json
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS verifications (
+            key TEXT PRIMARY KEY,
+            user_id TEXT,
+            phone TEXT,
+            username TEXT,
+            verified INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            expires_at REAL NOT NULL -- unix time
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_verifications_phone ON verifications (phone)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_verifications_expires ON verifications (expires_at)')
+    # One-shot import of the legacy file, if this deployment still has it
+    for path in dict.fromkeys((os.path.join(database.BASE_DIR, 'verifications.json'), os.path.abspath('verifications.json'))):
+        if os.path.exists(path):
+            _import_legacy_verifications(conn, path)
+
+def _m011_bus_and_leases(conn):
+    # Local cross-process pub/sub (MESSAGE_QUEUE=sqlite) and leader leases
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bus_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            created_at REAL NOT NULL -- unix time
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bus_messages_created ON bus_messages (created_at)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL -- unix time
+        )
+    ''')
+
+def _m012_selective_queue_indexes(conn):
+    # Patient history: one phone's completed visits, newest first, live and archived
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_phone_status_created ON queues (phone, status, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_archive_phone_status_created ON queues_archive (phone, status, created_at)')
+    # Older tickets of one org still waiting (second half of get_todays_queues)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_org_status_date ON queues (org_id, status, date)')
+    # Booked slots and the hallway board: one branch's day
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_branch_date ON queues (branch_id, date)')
+    # Branch-scoped analytics ranges (the primary keys lead with org_id)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_analytics_hourly_branch_hour ON analytics_hourly (branch_id, hour)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_analytics_daily_branch_day ON analytics_daily (branch_id, day)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_analytics_hour_profile_branch_month ON analytics_hour_profile (branch_id, month)')
+
+def _m013_org_call_next_index(conn):
+    # Admin call-next: an org's oldest waiting ticket. The same (org_id, status)
+    # prefix serves the waiting half of get_todays_queues, so it replaces 012's
+    conn.execute('DROP INDEX IF EXISTS idx_queues_org_status_date')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_org_status_created ON queues (org_id, status, created_at)')
+
+def _m014_status_keyset_indexes(conn):
+    # Admin dashboard: the newest serving / oldest waiting ticket through the
+    # listing's (created_at, id) keyset. With id in the index the status
+    # filter is a range scan instead of a walk over every ticket of the org;
+    # the old prefixes (call-next, waiting set, archival) are served as before
+    conn.execute('DROP INDEX IF EXISTS idx_queues_org_status_created')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_org_status_created_id ON queues (org_id, status, created_at, id)')
+    conn.execute('DROP INDEX IF EXISTS idx_queues_status_created')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_queues_status_created_id ON queues (status, created_at, id)')
+
+MIGRATIONS = [
+    (1, 'base multi-tenant schema', _m001_base_schema),
+    (2, 'multi-tenant columns for legacy databases', _m002_multi_tenant_columns),
+    (3, 'called_at/completed_at columns and ratings table', _m003_lifecycle_columns_and_ratings),
+    (4, 'hot-path indexes', _m004_hot_path_indexes),
+    (5, 'daily status counters', _m005_daily_counters),
+    (6, 'hourly/daily analytics rollups', _m006_analytics_rollups),
+    (7, 'keyset pagination indexes for the queue listing', _m007_queue_listing_indexes),
+    (8, 'queues_archive, queues_all view and denormalized ratings', _m008_queue_archive),
+    (9, 'telegram outbox', _m009_telegram_outbox),
+    (10, 'verification sessions table', _m010_verifications),
+    (11, 'message bus and leader leases', _m011_bus_and_leases),
+    (12, 'selective indexes for patient history, waiting tickets and branch scopes', _m012_selective_queue_indexes),
+    (13, 'org call-next index', _m013_org_call_next_index),
+    (14, 'status keyset indexes for the admin dashboard', _m014_status_keyset_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TEXT
+        )
+    ''')
+
+def get_schema_version(conn=None):
+    conn = conn or database.get_db_connection()
+    _ensure_version_table(conn)
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+def migrate():
+    """Apply every pending migration in order. Returns the applied versions."""
+    conn = database.get_db_connection()
+    _ensure_version_table(conn)
+    conn.commit()
+    # Usual case on every start after a deploy: nothing to lock or re-check
+    if get_schema_version(conn) >= MIGRATIONS[-1][0]:
+        return []
+
+    applied = []
+    for version, name, step in MIGRATIONS:
+        # BEGIN IMMEDIATE serializes concurrent workers; re-check inside the lock
+        with database.transaction() as tx:
+            if get_schema_version(tx) >= version:
+                continue
+            step(tx)
+            tx.execute('INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                       (version, name, datetime.now().isoformat()))
+        applied.append(version)
+        print(f"Migration {version:03d} applied: {name}")
+    return applied
 
 def run_migrations():
+    from flask import Flask
+    from flask_bcrypt import Bcrypt
+    bcrypt = Bcrypt(Flask(__name__))
+
     print("🚀 Migratsiya boshlandi...")
-    
+
     # 1. Initialize DB structure
     database.init_db()
-    
+
     # 2. Add default admin if not exists
     admin_phone = "Xamidov" # Example admin phone
     admin_password = os.getenv("ADMIN_PASSWORD", "Xusniddin1212121")
     hashed_pw = bcrypt.generate_password_hash(admin_password).decode('utf-8')
-    
+
     conn = database.get_db_connection()
     cursor = conn.cursor()
-    
+
     # Check if admin exists
     cursor.execute("SELECT * FROM users WHERE role = 'admin'")
     admin = cursor.fetchone()
-    
+
     if not admin:
         print(f"👤 Admin yaratilmoqda: {admin_phone}")
         database.add_user(
@@ -44,7 +544,7 @@ def run_migrations():
         cursor.execute("UPDATE users SET password_hash = ? WHERE role = 'admin'", (hashed_pw,))
         conn.commit()
         print("✅ Admin paroli yangilandi.")
-        
+
     conn.close()
     print("✨ Migratsiya yakunlandi.")
 
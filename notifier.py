@@ -0,0 +1,213 @@
+import os
+import random
+import time
+import requests
+import database
+import metrics
+import offload
+
+# --- Telegram Notification Dispatcher ---
+# HTTP handlers call send_message(), which only inserts a row into the
+# telegram_outbox table. A small pool of worker threads drains the outbox,
+# paced by a global token bucket and one bucket per chat (Telegram allows
+# roughly 30 msg/s overall and 1 msg/s into a single chat). Network errors
+# and 5xx are retried with exponential backoff, 429 honours retry_after, and
+# anything else (blocked bot, unknown chat) or too many failures is
+# dead-lettered.
+
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "6"))
+NOTIFY_BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", "2"))
+NOTIFY_BACKOFF_MAX = 300
+NOTIFY_HTTP_TIMEOUT = 10
+OUTBOX_PRUNE_SECONDS = 3600
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = offload.Lock()
+
+    def try_take(self):
+        """Take a token if one is available, else return seconds until one is."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def idle(self):
+        with self._lock:
+            return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+class ChatLimiter:
+    """One token bucket per chat, dropped again once the chat has gone quiet."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._buckets = {}
+        self._lock = offload.Lock()
+        self._takes = 0
+
+    def try_take(self, chat_id):
+        with self._lock:
+            bucket = self._buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._buckets[chat_id] = TokenBucket(self.rate, capacity=1)
+            self._takes += 1
+            if self._takes % 1000 == 0:
+                for key in [k for k, b in self._buckets.items() if b.idle() and k != chat_id]:
+                    del self._buckets[key]
+        return bucket.try_take()
+
+class Dispatcher:
+    def __init__(self, token, api_base=TELEGRAM_API_BASE, workers=NOTIFY_WORKERS,
+                 global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE,
+                 max_attempts=NOTIFY_MAX_ATTEMPTS, backoff_base=NOTIFY_BACKOFF_BASE,
+                 poll_interval=1.0):
+        self.token = token
+        self.api_base = api_base.rstrip('/')
+        self.workers = workers
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_limiter = ChatLimiter(chat_rate)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.poll_interval = poll_interval
+        self._wake = offload.Event()
+        self._stop = offload.Event()
+        self._hold_until = 0.0   # set by a global 429
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            self._threads.append(offload.start_thread(self._run, i))
+        print(f"Notification dispatcher started ({self.workers} workers)")
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        for done in self._threads:
+            done.wait(timeout)
+        self._threads = []
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self, index):
+        session = requests.Session()
+        next_prune = time.monotonic() + OUTBOX_PRUNE_SECONDS
+        while not self._stop.is_set():
+            try:
+                jobs = database.claim_outbox()
+                if not jobs:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+                    continue
+                for job in jobs:
+                    self._process(session, job)
+                if index == 0 and time.monotonic() >= next_prune:
+                    database.prune_outbox()
+                    next_prune = time.monotonic() + OUTBOX_PRUNE_SECONDS
+            except Exception as e:
+                print(f"Notifier worker error: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def _process(self, session, job):
+        self._acquire_global()
+        # Over the per-chat limit: hand it back instead of blocking this worker.
+        # Checked after the global wait so the spacing holds at send time.
+        wait = self.chat_limiter.try_take(job['chat_id'])
+        if wait:
+            database.retry_outbox(job['id'], wait, count_attempt=False)
+            return
+        started = time.perf_counter()
+        outcome, detail = self._send(session, job)
+        metrics.OUTBOUND_SECONDS.observe(time.perf_counter() - started, 'telegram')
+        if outcome != 'sent':
+            metrics.OUTBOUND_ERRORS.inc('telegram')
+        if outcome == 'sent':
+            database.mark_outbox_sent(job['id'])
+        elif outcome == 'throttled':
+            database.retry_outbox(job['id'], detail, f"429 retry_after={detail}", count_attempt=False)
+        elif outcome == 'retry' and job['attempts'] + 1 < self.max_attempts:
+            database.retry_outbox(job['id'], self._backoff(job['attempts']), detail)
+        else:
+            print(f"Telegram message {job['id']} dead-lettered: {detail}")
+            database.dead_letter_outbox(job['id'], detail)
+
+    def _acquire_global(self):
+        while True:
+            hold = self._hold_until - time.monotonic()
+            if hold > 0:
+                time.sleep(hold)
+                continue
+            wait = self.global_bucket.try_take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def _backoff(self, attempts):
+        delay = min(NOTIFY_BACKOFF_MAX, self.backoff_base * (2 ** attempts))
+        return delay * (0.5 + random.random())
+
+    def _send(self, session, job):
+        url = f"{self.api_base}/bot{self.token}/{job['method']}"
+        try:
+            res = session.post(url, data=job['payload'].encode('utf-8'),
+                               headers={"Content-Type": "application/json"},
+                               timeout=NOTIFY_HTTP_TIMEOUT)
+        except requests.RequestException as e:
+            return 'retry', f"network: {e}"
+        try:
+            body = res.json()
+        except ValueError:
+            body = {}
+        if res.status_code == 200 and body.get('ok', True):
+            return 'sent', None
+        description = f"{res.status_code} {body.get('description', '')}".strip()
+        if res.status_code == 429:
+            retry_after = (body.get('parameters') or {}).get('retry_after') or 1
+            # Flood control applies to the whole bot, not just this chat
+            self._hold_until = max(self._hold_until, time.monotonic() + retry_after)
+            return 'throttled', retry_after
+        if res.status_code >= 500:
+            return 'retry', description
+        return 'dead', description
+
+_dispatcher = None
+
+def start(token, **kwargs):
+    """Start the worker pool for this process (no-op without a bot token)."""
+    global _dispatcher
+    if not token or _dispatcher is not None:
+        return _dispatcher
+    _dispatcher = Dispatcher(token, **kwargs)
+    _dispatcher.start()
+    return _dispatcher
+
+def stop():
+    global _dispatcher
+    if _dispatcher is not None:
+        _dispatcher.stop()
+        _dispatcher = None
+
+def _wake():
+    if _dispatcher is not None:
+        _dispatcher.wake()
+
+def send_message(chat_id, text, parse_mode=None, reply_markup=None):
+    """Queue a Telegram message; delivered asynchronously by the dispatcher."""
+    payload = {"chat_id": chat_id, "text": text}
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    if reply_markup:
+        payload["reply_markup"] = reply_markup
+    return database.enqueue_outbox(chat_id, payload, on_commit=_wake)
@@ -0,0 +1,235 @@
+import contextvars
+import io
+import os
+from collections import deque
+
+try:
+    from gevent import monkey as _monkey
+    _allocate_lock, _start_new_thread, _CRLock, get_ident = (
+        _monkey.get_original('_thread', ['allocate_lock', 'start_new_thread', 'RLock', 'get_ident']))
+except ImportError:
+    from _thread import allocate_lock as _allocate_lock, start_new_thread as _start_new_thread, RLock as _CRLock, get_ident
+
+# --- Evented Serving ---
+# Under gevent (serve.py, or gunicorn -k gevent) every socket and long-poll is
+# a greenlet on one event loop, so anything that blocks inside C without
+# yielding -- SQLite, bcrypt, the Gemini client -- would stall every connected
+# display at once. Plain HTTP requests therefore run on a bounded pool of
+# native threads (which also bounds the pooled SQLite connections), while
+# Socket.IO traffic is handled on the loop. Without gevent everything here is
+# a pass-through.
+
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "32"))
+BODY_BATCH = 64   # response chunks pulled per pool round-trip
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+EVENTED = _gevent_patched()
+
+_pool = None
+_pool_lock = _allocate_lock()
+_loop_hub = None
+_loop_thread_id = None
+
+if EVENTED:
+    import gevent
+    _loop_hub = gevent.get_hub()
+    _loop_thread_id = get_ident()
+
+def _threadpool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from gevent.threadpool import ThreadPool
+                _pool = ThreadPool(BLOCKING_POOL_SIZE, hub=_loop_hub)
+    return _pool
+
+def on_loop_thread():
+    return not EVENTED or get_ident() == _loop_thread_id
+
+def run_blocking(fn, *args, **kwargs):
+    """Call fn on the thread pool when evented; a plain call otherwise."""
+    if not EVENTED or not on_loop_thread():
+        return fn(*args, **kwargs)
+    return _threadpool().apply(contextvars.copy_context().run, (fn,) + args, kwargs)
+
+def call_on_loop(fn, *args):
+    """Run fn(*args) in a greenlet on the event loop (socket emits from pool threads)."""
+    if on_loop_thread():
+        return fn(*args)
+    _loop_hub.loop.run_callback_threadsafe(gevent.spawn, fn, *args)
+
+# --- Native Primitives ---
+# gevent's patched Lock/Event/Semaphore park the *greenlet* and rely on the
+# current thread's event loop to wake it. In offload's pool threads (and the
+# background loops below) nothing drives that loop, so a contended patched
+# lock can hang for good or raise InvalidThreadUseError. Anything shared with
+# those threads uses these instead: real OS locks whether or not gevent is
+# loaded. Never wait on them from a greenlet on the event loop -- that would
+# block every connection -- and never yield (run_blocking) while holding one.
+
+def Lock():
+    return _allocate_lock()
+
+def RLock():
+    return _CRLock()
+
+class Event:
+    """threading.Event on native locks: one pre-acquired lock per waiter."""
+
+    def __init__(self):
+        self._lock = _allocate_lock()
+        self._waiters = []
+        self._flag = False
+
+    def is_set(self):
+        return self._flag
+
+    def set(self):
+        with self._lock:
+            self._flag = True
+            for waiter in self._waiters:
+                waiter.release()
+            self._waiters.clear()
+
+    def clear(self):
+        with self._lock:
+            self._flag = False
+
+    def wait(self, timeout=None):
+        with self._lock:
+            if self._flag:
+                return True
+            waiter = _allocate_lock()
+            waiter.acquire()
+            self._waiters.append(waiter)
+        if waiter.acquire(timeout=-1 if timeout is None else max(timeout, 0)):
+            return True
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            return self._flag
+
+class BoundedSemaphore:
+    """threading.BoundedSemaphore on native locks; release() hands the slot to the oldest waiter."""
+
+    def __init__(self, value=1):
+        self._lock = _allocate_lock()
+        self._initial = self._value = value
+        self._waiters = deque()
+
+    def acquire(self, blocking=True, timeout=None):
+        with self._lock:
+            if self._value > 0:
+                self._value -= 1
+                return True
+            if not blocking:
+                return False
+            waiter = _allocate_lock()
+            waiter.acquire()
+            self._waiters.append(waiter)
+        if waiter.acquire(timeout=-1 if timeout is None else max(timeout, 0)):
+            return True
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return False
+        return True   # release() handed us the slot just as we timed out
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().release()
+                return
+            if self._value >= self._initial:
+                raise ValueError("Semaphore released too many times")
+            self._value += 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def start_thread(target, *args):
+    """Run target(*args) on a new native thread (a real OS thread even under
+    gevent, so its SQLite calls never stall the loop). Returns an Event that is
+    set when target returns."""
+    done = Event()
+
+    def run():
+        try:
+            target(*args)
+        finally:
+            done.set()
+
+    _start_new_thread(run, ())
+    return done
+
+def _buffer_input(environ):
+    # gevent sockets belong to the loop's thread: read the body here, hand the pool a copy
+    stream = environ['wsgi.input']
+    length = environ.get('CONTENT_LENGTH')
+    if length:
+        body = stream.read(int(length))
+    elif 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower():
+        body = stream.read()
+    else:
+        body = b''
+    environ['wsgi.input'] = io.BytesIO(body)
+    environ['CONTENT_LENGTH'] = str(len(body))
+
+def _take_chunks(state):
+    chunks = []
+    for chunk in state['iter']:
+        chunks.append(chunk)
+        if len(chunks) >= BODY_BATCH:
+            return chunks, False
+    _close_body(state)
+    return chunks, True
+
+def _close_body(state):
+    if not state['closed']:
+        state['closed'] = True
+        close = getattr(state['body'], 'close', None)
+        if close is not None:
+            close()
+
+def _pooled_body(body, context, pool):
+    # Streamed responses (stream_with_context generators reading SQLite) are
+    # pulled on the pool in batches, inside the request's own context.
+    state = {'body': body, 'iter': iter(body), 'closed': False}
+    try:
+        done = False
+        while not done:
+            chunks, done = pool.apply(context.run, (_take_chunks, state))
+            yield from chunks
+    finally:
+        if not state['closed']:
+            pool.apply(context.run, (_close_body, state))
+
+class BlockingWorkMiddleware:
+    """WSGI middleware that runs each request and its response body on the pool."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if not EVENTED:
+            return self.wsgi_app(environ, start_response)
+        _buffer_input(environ)
+        context = contextvars.copy_context()
+        pool = _threadpool()
+        body = pool.apply(context.run, (self.wsgi_app, environ, start_response))
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(body, file_wrapper):
+            # Static files: leave the body to the server so it can sendfile() it
+            return body
+        return _pooled_body(body, context, pool)
@@ -0,0 +1,160 @@
+import logging
+import os
+import re
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+
+import database
+import offload
+
+# --- Query Profiler ---
+# Opt-in (QUERY_PROFILE=1) per-unit-of-work SQL profiling. While a profile is
+# active -- one per HTTP request, one per background job pass -- every
+# statement run through a pooled connection is recorded with its duration
+# (database.TimedCursor feeds QueryProfile.record). Statements are grouped by
+# shape: the SQL with literals replaced by ? and IN lists collapsed, so
+# get_user('a') and get_user('b') are the same shape. At the end of the unit:
+#   - a shape run N_PLUS_ONE_THRESHOLD times or more is flagged as N+1;
+#   - every shape is folded into the process-wide table that /debug/queries
+#     shows (top statements by total time, count or max).
+# Statements slower than SLOW_QUERY_MS go to a rotating log right away.
+
+QUERY_PROFILE = os.getenv("QUERY_PROFILE") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG") or os.path.join(database.BASE_DIR, "logs", "slow_queries.log")
+SLOW_QUERY_LOG_BYTES = int(os.getenv("SLOW_QUERY_LOG_BYTES", str(5 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "3"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+PROFILE_MAX_SHAPES = 1000
+PROFILE_RECENT_N_PLUS_ONE = 50
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """Statement shape: literals -> ?, IN (?, ?, ...) -> IN (...), whitespace collapsed."""
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+class QueryProfile(database.QueryStats):
+    """QueryStats that also keeps every statement of the unit of work."""
+    __slots__ = ('label', 'statements')
+
+    def __init__(self, label=''):
+        super().__init__()
+        self.label = label
+        self.statements = []    # (sql, seconds)
+
+    def record(self, sql, seconds):
+        super().record(sql, seconds)
+        self.statements.append((sql, seconds))
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            _slow_log().warning("%s %.1fms %s", self.label or '-', seconds * 1000, _SPACE.sub(' ', sql).strip())
+
+_slow_logger = None
+_lock = offload.Lock()
+_shapes = {}            # shape -> {'count', 'seconds', 'max', 'units', 'n_plus_one'}
+_n_plus_one = deque(maxlen=PROFILE_RECENT_N_PLUS_ONE)
+_units = 0
+
+def _slow_log():
+    global _slow_logger
+    if _slow_logger is None:
+        with _lock:
+            if _slow_logger is None:
+                logger = logging.getLogger('slow_queries')
+                logger.propagate = False
+                os.makedirs(os.path.dirname(SLOW_QUERY_LOG), exist_ok=True)
+                handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES,
+                                              backupCount=SLOW_QUERY_LOG_BACKUPS, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+                logger.addHandler(handler)
+                _slow_logger = logger
+    return _slow_logger
+
+def start(label=''):
+    """Install a QueryProfile for the current context (a plain QueryStats when profiling is off)."""
+    return database.track_queries(QueryProfile(label) if QUERY_PROFILE else None)
+
+def finish(stats):
+    """Uninstall stats and, if it is a QueryProfile, fold it into the profile table."""
+    global _units
+    database.untrack_queries()
+    if not isinstance(stats, QueryProfile) or not stats.statements:
+        return
+    per_shape = {}
+    for sql, seconds in stats.statements:
+        entry = per_shape.setdefault(normalize_sql(sql), [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+    flagged = [(shape, entry) for shape, entry in per_shape.items() if entry[0] >= N_PLUS_ONE_THRESHOLD]
+    for shape, (count, seconds, _) in flagged:
+        print(f"[N+1] {stats.label}: {count}x ({seconds * 1000:.1f}ms) {shape}")
+    with _lock:
+        _units += 1
+        for shape, (count, seconds, longest) in per_shape.items():
+            total = _shapes.get(shape)
+            if total is None:
+                if len(_shapes) >= PROFILE_MAX_SHAPES:
+                    continue
+                total = _shapes[shape] = {'count': 0, 'seconds': 0.0, 'max': 0.0, 'units': 0, 'n_plus_one': 0}
+            total['count'] += count
+            total['seconds'] += seconds
+            total['max'] = max(total['max'], longest)
+            total['units'] += 1
+        for shape, (count, seconds, _) in flagged:
+            if shape in _shapes:
+                _shapes[shape]['n_plus_one'] += 1
+            _n_plus_one.append({"label": stats.label, "shape": shape, "count": count,
+                                "ms": round(seconds * 1000, 2)})
+
+@contextmanager
+def profile(label):
+    """Profile a unit of work outside an HTTP request (a background job pass)."""
+    if not QUERY_PROFILE:
+        yield None
+        return
+    stats = start(label)
+    try:
+        yield stats
+    finally:
+        finish(stats)
+
+REPORT_ORDERS = {'total': 'seconds', 'count': 'count', 'max': 'max'}
+
+def report(limit=20, order='total'):
+    key = REPORT_ORDERS.get(order, 'seconds')
+    with _lock:
+        shapes = sorted(_shapes.items(), key=lambda item: item[1][key], reverse=True)[:limit]
+        top = [{
+            "shape": shape,
+            "count": s['count'],
+            "total_ms": round(s['seconds'] * 1000, 2),
+            "avg_ms": round(s['seconds'] * 1000 / s['count'], 3),
+            "max_ms": round(s['max'] * 1000, 2),
+            "per_unit": round(s['count'] / s['units'], 2),
+            "n_plus_one": s['n_plus_one'],
+        } for shape, s in shapes]
+        return {
+            "enabled": QUERY_PROFILE,
+            "units": _units,
+            "slow_query_ms": SLOW_QUERY_MS,
+            "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+            "top": top,
+            "recent_n_plus_one": list(reversed(_n_plus_one)),
+        }
+
+def reset():
+    global _units
+    with _lock:
+        _shapes.clear()
+        _n_plus_one.clear()
+        _units = 0
@@ -0,0 +1,159 @@
+from sortedcontainers import SortedList
+import offload
+
+# --- In-Memory Queue Position Index ---
+# Waiting tickets per (branch_id, service_id) ordered by (created_at, id), so
+# /api/queue-position is answered in O(log n) instead of a COUNT(*) per poll.
+# database.py keeps it in sync after every committed queue mutation and it is
+# rebuilt from SQLite lazily on first use.
+
+DEFAULT_DURATION = 15
+
+class QueuePositionIndex:
+    def __init__(self):
+        self._lock = offload.RLock()
+        self._lines = {}       # (branch_id, service_id) -> SortedList[(created_at, id)]
+        self._entries = {}     # queue_id -> (branch_id, service_id, created_at)
+        self._durations = {}   # service_id -> estimated_duration
+        self.ready = False
+
+    def rebuild(self, conn):
+        with self._lock:
+            self._lines.clear()
+            self._entries.clear()
+            self._durations = {
+                row['id']: row['estimated_duration']
+                for row in conn.execute('SELECT id, estimated_duration FROM services').fetchall()
+            }
+            rows = conn.execute('''
+                SELECT id, branch_id, service_id, created_at FROM queues WHERE status = 'waiting'
+            ''').fetchall()
+            for row in rows:
+                self._insert(row['id'], row['branch_id'], row['service_id'], row['created_at'])
+            self.ready = True
+
+    def reset(self):
+        with self._lock:
+            self._lines.clear()
+            self._entries.clear()
+            self._durations.clear()
+            self.ready = False
+
+    def _insert(self, q_id, branch_id, service_id, created_at):
+        self._remove(q_id)
+        self._entries[q_id] = (branch_id, service_id, created_at)
+        # SQL never counts a NULL created_at as "earlier", so keep it out of the order
+        if created_at is not None:
+            self._lines.setdefault((branch_id, service_id), SortedList()).add((created_at, q_id))
+
+    def _remove(self, q_id):
+        entry = self._entries.pop(q_id, None)
+        if entry is None:
+            return
+        branch_id, service_id, created_at = entry
+        if created_at is None:
+            return
+        line = self._lines.get((branch_id, service_id))
+        if line is not None:
+            line.discard((created_at, q_id))
+            if not line:
+                del self._lines[(branch_id, service_id)]
+
+    # --- Mutations (called by database.py after commit) ---
+
+    def set_waiting(self, q_id, branch_id, service_id, created_at):
+        with self._lock:
+            if self.ready:
+                self._insert(q_id, branch_id, service_id, created_at)
+
+    def discard(self, q_id):
+        with self._lock:
+            if self.ready:
+                self._remove(q_id)
+
+    def set_duration(self, service_id, duration):
+        with self._lock:
+            if duration is None:
+                self._durations.pop(service_id, None)
+            else:
+                self._durations[service_id] = duration
+
+    # --- Queries ---
+
+    def is_waiting(self, q_id):
+        with self._lock:
+            return q_id in self._entries
+
+    def people_ahead(self, q_id):
+        with self._lock:
+            entry = self._entries.get(q_id)
+            if entry is None:
+                return None
+            branch_id, service_id, created_at = entry
+            if created_at is None:
+                return 0
+            line = self._lines.get((branch_id, service_id))
+            # (created_at,) sorts before every (created_at, id): strictly-earlier count
+            return line.bisect_left((created_at,)) if line else 0
+
+    def waiting_count(self, branch_id, service_id):
+        with self._lock:
+            line = self._lines.get((branch_id, service_id))
+            return len(line) if line else 0
+
+    def position(self, q_id):
+        with self._lock:
+            ahead = self.people_ahead(q_id)
+            if ahead is None:
+                return None
+            service_id = self._entries[q_id][1]
+            duration = self._durations.get(service_id) or DEFAULT_DURATION
+            return {
+                "status": "waiting",
+                "position": ahead + 1,
+                "people_ahead": ahead,
+                "estimated_wait": (ahead + 1) * duration
+            }
+
+    def line_positions(self, branch_id, service_id):
+        """[(queue_id, position dict)] for every waiting ticket of one line."""
+        with self._lock:
+            line = self._lines.get((branch_id, service_id))
+            if not line:
+                return []
+            duration = self._durations.get(service_id) or DEFAULT_DURATION
+            positions = []
+            ahead, prev = 0, None
+            for i, (created_at, q_id) in enumerate(line):
+                # Equal created_at share a position, as with bisect_left above
+                if created_at != prev:
+                    ahead, prev = i, created_at
+                positions.append((q_id, {
+                    "status": "waiting",
+                    "position": ahead + 1,
+                    "people_ahead": ahead,
+                    "estimated_wait": (ahead + 1) * duration
+                }))
+            return positions
+
+    def verify(self, conn):
+        """Compare every indexed ticket with the SQL answer. Returns mismatches."""
+        mismatches = []
+        rows = conn.execute('''
+            SELECT id, branch_id, service_id, created_at FROM queues WHERE status = 'waiting'
+        ''').fetchall()
+        with self._lock:
+            waiting_ids = {row['id'] for row in rows}
+            for q_id in set(self._entries) - waiting_ids:
+                mismatches.append((q_id, 'indexed but not waiting in db'))
+            for row in rows:
+                expected = conn.execute('''
+                    SELECT COUNT(*) FROM queues
+                    WHERE service_id = ? AND branch_id = ? AND status = 'waiting' AND created_at < ?
+                ''', (row['service_id'], row['branch_id'], row['created_at'])).fetchone()[0]
+                actual = self.people_ahead(row['id'])
+                if actual != expected:
+                    mismatches.append((row['id'], f'people_ahead index={actual} sql={expected}'))
+        return mismatches
+
+position_index = QueuePositionIndex()
@@ -0,0 +1,123 @@
+import heapq
+from datetime import datetime, timedelta
+import offload
+
+# --- Appointment Reminder Scheduler ---
+# Min-heap of reminder deadlines for waiting tickets that have an appointment
+# time, so the scheduler thread only touches reminders that are due instead of
+# rescanning every queue each minute. database.py keeps it in sync after every
+# committed queue mutation; it is rebuilt from SQLite lazily and once a day.
+# Heap entries are never removed in place: a cancelled or moved booking just
+# leaves a stale entry that is skipped when it reaches the top.
+
+# (notification_level, minutes before the appointment)
+REMINDER_LEVELS = ((1, 60), (2, 30), (3, 10))
+# A reminder this late is skipped rather than sent (e.g. booked 20 minutes ahead)
+REMINDER_GRACE = timedelta(minutes=5)
+
+def appointment_time(date, time):
+    if not date or not time:
+        return None
+    try:
+        return datetime.fromisoformat(f"{date}T{time}")
+    except (TypeError, ValueError):
+        return None
+
+class ReminderScheduler:
+    def __init__(self):
+        self._lock = offload.Lock()
+        self._heap = []            # (fire_at, queue_id, level, appointment_at)
+        self._appointments = {}    # queue_id -> [appointment_at, last level sent]
+        self._wake = offload.Event()
+        self.ready = False
+        self.loaded_for = None     # date string of the last rebuild
+
+    def rebuild(self, conn, now=None):
+        now = now or datetime.now()
+        today = now.strftime('%Y-%m-%d')
+        rows = conn.execute('''
+            SELECT id, date, time, notification_level FROM queues
+            WHERE status = 'waiting' AND date >= ? AND time IS NOT NULL
+        ''', (today,)).fetchall()
+        with self._lock:
+            self._heap.clear()
+            self._appointments.clear()
+            for row in rows:
+                self._schedule(row['id'], appointment_time(row['date'], row['time']), row['notification_level'] or 0)
+            heapq.heapify(self._heap)
+            self.ready = True
+            self.loaded_for = today
+        self._wake.set()
+
+    def reset(self):
+        with self._lock:
+            self._heap.clear()
+            self._appointments.clear()
+            self.ready = False
+            self.loaded_for = None
+
+    def _push_next(self, q_id, appointment_at, sent_level):
+        for level, minutes in REMINDER_LEVELS:
+            if level > sent_level:
+                heapq.heappush(self._heap, (appointment_at - timedelta(minutes=minutes), q_id, level, appointment_at))
+                return
+
+    def _schedule(self, q_id, appointment_at, sent_level):
+        if appointment_at is None:
+            self._appointments.pop(q_id, None)
+            return
+        current = self._appointments.get(q_id)
+        if current and current[0] == appointment_at and current[1] >= sent_level:
+            return
+        self._appointments[q_id] = [appointment_at, sent_level]
+        self._push_next(q_id, appointment_at, sent_level)
+
+    # --- Mutations (called by database.py after commit) ---
+
+    def schedule(self, q_id, date, time, sent_level=0):
+        with self._lock:
+            if not self.ready:
+                return
+            self._schedule(q_id, appointment_time(date, time), sent_level or 0)
+        self._wake.set()
+
+    def cancel(self, q_id):
+        with self._lock:
+            if self.ready:
+                self._appointments.pop(q_id, None)
+
+    # --- Queries ---
+
+    def pop_due(self, now=None):
+        """Return [(queue_id, level)] for reminders due at now, oldest first."""
+        now = now or datetime.now()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, q_id, level, appointment_at = heapq.heappop(self._heap)
+                current = self._appointments.get(q_id)
+                if not current or current[0] != appointment_at or current[1] >= level:
+                    continue  # stale: cancelled, moved or already sent
+                current[1] = level
+                if now - fire_at <= REMINDER_GRACE:
+                    due.append((q_id, level))
+                if level == REMINDER_LEVELS[-1][0]:
+                    del self._appointments[q_id]
+                else:
+                    self._push_next(q_id, appointment_at, level)
+        return due
+
+    def next_due(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def wait(self, timeout):
+        """Sleep until timeout or until a booking may have moved the next deadline."""
+        self._wake.wait(timeout)
+        self._wake.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._appointments)
+
+reminder_scheduler = ReminderScheduler()
@@ -11,7 +11,10 @@ fi
 echo "Installing dependencies..."
 ./venv/bin/pip install -r requirements.txt
 
-# 3. Run the application
+# 3. Build hashed, pre-compressed frontend assets
+./venv/bin/python3 build_assets.py
+
+# 4. Run the application
 echo "Starting Application..."
 echo "Please open http://127.0.0.1:5000 in your browser"
-./venv/bin/python3 app.py
+./venv/bin/python3 serve.py
@@ -0,0 +1,35 @@
+"""Server entry point.
+
+    python serve.py                          gevent event loop (default)
+    SERVER_MODE=threading python serve.py    one OS thread per connection
+    gunicorn -k gevent --worker-connections 10000 -w 1 serve:app   (Procfile)
+
+Under gevent each connected display, tracker and staff page is a greenlet
+rather than a thread; SQLite, bcrypt and Gemini calls run on a bounded
+thread pool (offload.py) so they never stall the loop.
+"""
+import os
+
+SERVER_MODE = os.getenv("SERVER_MODE", "gevent")
+if SERVER_MODE == "gevent":
+    # Must run before anything imports socket, ssl, threading or requests
+    from gevent import monkey
+    monkey.patch_all()
+
+from app import create_app, socketio  # noqa: E402
+
+# Module level so gunicorn's serve:app gets a fully started app too
+app = create_app(start_services=True)
+
+def main():
+    abs_static = os.path.abspath(app.static_folder)
+    print(f"Static folder: {abs_static} (exists: {os.path.exists(abs_static)})")
+    port = int(os.environ.get("PORT", 5000))
+    print(f"Serving in {SERVER_MODE} mode on 0.0.0.0:{port}")
+    # Flask-SocketIO still warns that gevent-websocket is missing; WebSocket
+    # is served through simple-websocket instead.
+    socketio.run(app, host='0.0.0.0', port=port, debug=False, use_reloader=False,
+                 log_output=False, allow_unsafe_werkzeug=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import queue
+import socketio
+import offload
+
+class BusClientManager(socketio.PubSubManager):
+    """Socket.IO client manager that relays emits between processes over bus.py.
+
+    Every emit is published on the bus and delivered by each process
+    (including the sender) to the sockets it holds, like the Redis manager.
+    """
+    name = 'bus'
+
+    def __init__(self, bus, channel='socketio', write_only=False, logger=None):
+        self.bus = bus
+        self._inbox = queue.Queue()
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _publish(self, data):
+        self.bus.publish(self.channel, data)
+
+    def _put(self, data):
+        # The bus calls back on its own native thread; the inbox lives on the loop
+        offload.call_on_loop(self._inbox.put, data)
+
+    def _listen(self):
+        self.bus.subscribe(self.channel, self._put, include_own=True)
+        while True:
+            yield self._inbox.get()
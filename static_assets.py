@@ -0,0 +1,58 @@
+import json
+import mimetypes
+import os
+
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+
+# --- Static Assets ---
+# The frontend lives in t/operator-ai-pro. build_assets.py copies it to
+# ASSET_BUILD_DIR with content-hashed copies of every CSS/JS/image/audio file
+# (css/main.3f2a9c1b.css), HTML rewritten to point at them, a generated sw.js
+# and .br/.gz siblings. Hashed files never change, so they are served
+# immutable for a year; everything else (HTML, sw.js, unhashed names) is
+# revalidated through its ETag. Without a build the source folder is served
+# as-is.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_SOURCE_DIR = os.path.join(BASE_DIR, 't', 'operator-ai-pro')
+ASSET_BUILD_DIR = os.getenv("ASSET_BUILD_DIR") or os.path.join(BASE_DIR, 'build', 'static')
+ASSET_MANIFEST = 'asset-manifest.json'
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+# Preferred first; a sibling is only sent when the client accepts it
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+def _load_manifest():
+    try:
+        with open(os.path.join(ASSET_BUILD_DIR, ASSET_MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+_manifest = _load_manifest()
+STATIC_ROOT = ASSET_BUILD_DIR if _manifest else STATIC_SOURCE_DIR
+_hashed = set(_manifest['assets'].values()) if _manifest else set()
+
+def send_asset(path):
+    """Serve a frontend file, pre-compressed when the client allows it."""
+    filename = path
+    encoding = None
+    compressed = False
+    for name, suffix in PRECOMPRESSED:
+        sibling = safe_join(STATIC_ROOT, path + suffix)
+        if sibling and os.path.isfile(sibling):
+            compressed = True
+            if encoding is None and request.accept_encodings[name]:
+                filename, encoding = path + suffix, name
+
+    # Content-Type of the original, not of the .br/.gz sibling
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    response = send_from_directory(STATIC_ROOT, filename, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if compressed:
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if path in _hashed else REVALIDATE_CACHE_CONTROL
+    return response
@@ -72,18 +72,23 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // Buttons
         const btnCallNext = document.getElementById('btn-call-next');
+        const btnLoadMore = document.getElementById('btn-load-more');
         const btnComplete = document.getElementById('btn-complete');
         const btnRecall = document.getElementById('btn-recall');
         const btnNoShow = document.getElementById('btn-noshow');
         const btnTransfer = document.getElementById('btn-transfer');
 
         let currentQueueId = null;
+        // The listing comes in keyset pages (newest first); the current and next
+        // tickets and the counts have their own requests, never a page
+        let nextCursor = null;
+        let listGeneration = 0;
 
         // Load Initial Data
         fetchQueueData();
 
-        // Real-time updates via WebSockets
-        const socket = io();
+        // Real-time updates via WebSockets (joined to this admin's org room)
+        const socket = io({ auth: { token: localStorage.getItem('admin_token') } });
         socket.on('connect', () => {
             console.log('Connected to real-time server');
         });
@@ -246,6 +251,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (btnRecall) btnRecall.addEventListener('click', () => updateStatus('serving', true));
         if (btnNoShow) btnNoShow.addEventListener('click', () => updateStatus('noshow'));
         if (btnTransfer) btnTransfer.addEventListener('click', openTransferModal);
+        if (btnLoadMore) btnLoadMore.addEventListener('click', loadMoreQueues);
 
         async function openTransferModal() {
             if (!currentQueueId) return;
@@ -317,35 +323,66 @@ document.addEventListener('DOMContentLoaded', () => {
             return response;
         }
 
+        async function fetchQueues(params = {}) {
+            const response = await secureFetch(`/api/admin/queues?${new URLSearchParams(params)}`);
+            if (!response) return null;
+            const data = await response.json();
+            return data.success ? data : null;
+        }
+
         async function fetchQueueData() {
+            const generation = ++listGeneration;
             try {
-                const response = await secureFetch('/api/admin/queues');
-                if (!response) return;
-
-                const data = await response.json();
-                if (data.success) {
-                    renderTable(data.queues);
-                    updateStats(data.queues);
+                const [page, serving, waiting] = await Promise.all([
+                    fetchQueues(),
+                    fetchQueues({ status: 'serving', limit: 1 }),
+                    // Oldest waiting ticket of the org: the one call-next takes
+                    fetchQueues({ status: 'waiting', order: 'asc', limit: 1 })
+                ]);
+                if (generation !== listGeneration) return;
+                if (page) {
+                    queueTableBody.innerHTML = '';
+                    appendRows(page.queues);
+                    setNextCursor(page.next_cursor);
+                }
+                if (serving && waiting) {
+                    renderCurrent(Object.values(serving.queues)[0], Object.values(waiting.queues)[0]);
                 }
+                updateStats();
             } catch (error) {
                 console.error('Error fetching queues:', error);
             }
         }
 
-        function renderTable(queues) {
-            queueTableBody.innerHTML = '';
+        async function loadMoreQueues() {
+            if (!nextCursor) return;
+            const generation = listGeneration;
+            try {
+                const page = await fetchQueues({ cursor: nextCursor });
+                // A refresh started meanwhile: its first page replaces the table
+                if (!page || generation !== listGeneration) return;
+                appendRows(page.queues);
+                setNextCursor(page.next_cursor);
+            } catch (error) {
+                console.error('Error fetching queues:', error);
+            }
+        }
 
-            const sortedQueues = Object.values(queues).sort((a, b) => {
-                const statusOrder = { 'serving': 0, 'waiting': 1, 'completed': 2, 'noshow': 3 };
-                return statusOrder[a.status] - statusOrder[b.status] || a.created_at.localeCompare(b.created_at);
-            });
+        function setNextCursor(cursor) {
+            nextCursor = cursor;
+            if (btnLoadMore) btnLoadMore.classList.toggle('hidden', !cursor);
+        }
 
-            sortedQueues.forEach(q => {
-                if (q.status === 'serving') {
-                    currentNumberEl.textContent = q.number;
-                    currentQueueId = q.id;
-                }
+        function renderCurrent(serving, next) {
+            currentQueueId = serving ? serving.id : null;
+            currentNumberEl.textContent = serving ? serving.number : '---';
+            nextNumberEl.textContent = next ? next.number : '---';
+            btnCallNext.disabled = !!serving;
+        }
 
+        function appendRows(queues) {
+            // Keys are ticket ids, so the object keeps the server's newest-first order
+            Object.values(queues).forEach(q => {
                 const row = document.createElement('tr');
                 row.innerHTML = `
                 <td><strong>${q.number}</strong></td>
@@ -356,16 +393,17 @@ document.addEventListener('DOMContentLoaded', () => {
             `;
                 queueTableBody.appendChild(row);
             });
-
-            const nextQ = sortedQueues.find(q => q.status === 'waiting');
-            nextNumberEl.textContent = nextQ ? nextQ.number : '---';
-            btnCallNext.disabled = !!sortedQueues.find(q => q.status === 'serving');
         }
 
-        function updateStats(queues) {
-            const list = Object.values(queues);
-            waitingCountEl.textContent = list.filter(q => q.status === 'waiting').length;
-            servedCountEl.textContent = list.filter(q => q.status === 'completed').length;
+        async function updateStats() {
+            // Today's counters for the whole org, not just the rows on screen
+            const response = await secureFetch('/api/admin/stats');
+            if (!response) return;
+            const data = await response.json();
+            if (data.success) {
+                waitingCountEl.textContent = data.stats.waiting;
+                servedCountEl.textContent = data.stats.completed;
+            }
         }
 
         async function callNextClient() {
@@ -1,25 +1,21 @@
 // Display Screen JavaScript
 
 const DisplayApp = {
-    branchId: 'branch_001', // Demo - would be configured
+    // display.html?branch=<branch id>
+    branchId: new URLSearchParams(window.location.search).get('branch'),
+    version: 0,
 
     init() {
-        this.loadBranchInfo();
         this.updateTime();
-        this.loadServingQueues();
-        this.loadStats();
-        this.startRealTimeUpdates();
 
         // Update time every second
         setInterval(() => this.updateTime(), 1000);
-    },
-
-    loadBranchInfo() {
-        const branch = Database.getBranch(this.branchId);
-        if (!branch) return;
 
-        const org = Database.getOrganization(branch.organizationId);
-        document.getElementById('display-org').textContent = org?.name || 'Organization';
+        if (!this.branchId) {
+            this.renderEmpty("Filial tanlanmagan (display.html?branch=...)");
+            return;
+        }
+        this.startRealTimeUpdates();
     },
 
     updateTime() {
@@ -32,47 +28,47 @@ const DisplayApp = {
         document.getElementById('display-time').textContent = timeString;
     },
 
-    loadServingQueues() {
-        const serving = QueueManager.getCurrentlyServing(this.branchId);
-        const grid = document.getElementById('serving-grid');
-
-        if (serving.length === 0) {
-            grid.innerHTML = `
+    renderEmpty(message) {
+        document.getElementById('serving-grid').innerHTML = `
         <div class="no-serving">
           <div class="no-serving-icon">⏸️</div>
-          <p>Hozircha xizmat ko'rsatilmayapti</p>
+          <p>${message}</p>
         </div>
       `;
-            return;
-        }
+    },
+
+    render(board) {
+        // Snapshots carry an increasing version; ignore stale or repeated ones
+        if (!board || board.version <= this.version) return;
+        this.version = board.version;
 
-        grid.innerHTML = serving.map(queue => `
+        document.getElementById('display-org').textContent =
+            [board.org_name, board.branch_name].filter(Boolean).join(' — ') || 'Organization';
+
+        if (board.serving.length === 0) {
+            this.renderEmpty("Hozircha xizmat ko'rsatilmayapti");
+        } else {
+            document.getElementById('serving-grid').innerHTML = board.serving.map(queue => `
       <div class="serving-card">
-        <div class="serving-number">${queue.queueNumber}</div>
+        <div class="serving-number">${queue.number}</div>
         <div class="serving-arrow">→</div>
-        <div class="serving-counter">${queue.counter || 'Counter'}</div>
+        <div class="serving-counter">${queue.service_name || 'Counter'}</div>
       </div>
     `).join('');
-    },
-
-    loadStats() {
-        const stats = QueueManager.getStatistics(this.branchId);
+        }
 
-        document.getElementById('waiting-count').textContent = stats.waiting;
-        document.getElementById('completed-count').textContent = stats.completed;
+        document.getElementById('next-list').textContent =
+            board.next.map(queue => queue.number).join(', ') || '—';
+        document.getElementById('waiting-count').textContent = board.counts.waiting;
+        document.getElementById('completed-count').textContent = board.counts.completed;
     },
 
     startRealTimeUpdates() {
-        QueueManager.subscribe(() => {
-            this.loadServingQueues();
-            this.loadStats();
-        });
-
-        // Auto-refresh every 3 seconds
-        setInterval(() => {
-            this.loadServingQueues();
-            this.loadStats();
-        }, CONFIG.display.refreshInterval || 3000);
+        // The server sends the whole board on (re)connect and again only when
+        // a transition in this branch changes it -- no polling.
+        const socket = io({ auth: { board: this.branchId } });
+        socket.on('connect', () => console.log('Display connected to real-time server'));
+        socket.on('board_snapshot', (board) => this.render(board));
     }
 };
 
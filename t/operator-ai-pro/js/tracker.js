@@ -15,12 +15,16 @@ const Tracker = {
         // Initial update
         await this.updateUI();
 
-        // WebSocket setup for real-time updates
-        const socket = io();
-        socket.on('connect', () => console.log('Tracker connected to real-time server'));
-        socket.on('queue_updated', async (data) => {
-            console.log('Update received:', data);
-            await this.updateUI();
+        // WebSocket setup: the server pushes this ticket's position/ETA/status
+        const socket = io({ auth: { ticket: this.queueId } });
+        // Deltas sent while disconnected are lost: re-sync with a full fetch on every (re)connect
+        socket.on('connect', () => {
+            console.log('Tracker connected to real-time server');
+            this.updateUI();
+        });
+        socket.on('ticket_delta', (delta) => {
+            if (delta.queue_id !== this.queueId) return;
+            this.render(delta.status, delta);
         });
 
         this.initEventListeners();
@@ -53,45 +57,47 @@ const Tracker = {
             const pResp = await fetch(`/api/queue-position/${this.queueId}`);
             const pData = await pResp.json();
 
-            if (pData.success) {
-                const pos = pData.data;
-                document.getElementById('people-ahead').textContent = pos.people_ahead;
-
-                // Progress calculation
-                let progress = 100 - (pos.position * 10);
-                if (progress < 10) progress = 10;
-                if (pos.position === 1) progress = 95;
-                if (pos.status === 'called' || pos.status === 'serving') progress = 100;
-
-                document.getElementById('tracker-progress').style.width = `${progress}%`;
-                document.getElementById('progress-percent').textContent = `${progress}%`;
-                document.getElementById('wait-time').textContent = `${pos.estimated_wait} ${Language.t('minutes')}`;
-
-                const expectedTime = new Date(new Date().getTime() + pos.estimated_wait * 60000);
-                const timeStr = expectedTime.toLocaleTimeString('uz-UZ', { hour: '2-digit', minute: '2-digit' });
-                document.getElementById('expected-time').textContent = timeStr;
-            }
-
-            // Status message
-            const msgPane = document.getElementById('admin-message');
-            if (queue.status === 'called') {
-                msgPane.innerHTML = `<strong>${Language.t('your_turn_has_come')}!</strong><br>${Language.t('proceed_to_counter')}`;
-                msgPane.classList.add('highlight');
-                this.showPushNotification();
-            } else if (queue.status === 'serving') {
-                msgPane.textContent = Language.t('status_serving');
-            } else if (queue.status === 'completed') {
-                msgPane.textContent = Language.t('status_completed');
-            }
-
-            document.getElementById('last-update').textContent =
-                `${Language.t('last_updated_at')}: ${new Date().toLocaleTimeString('uz-UZ')}`;
-
+            this.render(queue.status, pData.success ? pData.data : null);
         } catch (err) {
             console.error('Tracker update error:', err);
         }
     },
 
+    render(status, pos) {
+        if (pos) {
+            document.getElementById('people-ahead').textContent = pos.people_ahead;
+
+            // Progress calculation
+            let progress = 100 - (pos.position * 10);
+            if (progress < 10) progress = 10;
+            if (pos.position === 1) progress = 95;
+            if (pos.status === 'called' || pos.status === 'serving') progress = 100;
+
+            document.getElementById('tracker-progress').style.width = `${progress}%`;
+            document.getElementById('progress-percent').textContent = `${progress}%`;
+            document.getElementById('wait-time').textContent = `${pos.estimated_wait} ${Language.t('minutes')}`;
+
+            const expectedTime = new Date(new Date().getTime() + pos.estimated_wait * 60000);
+            const timeStr = expectedTime.toLocaleTimeString('uz-UZ', { hour: '2-digit', minute: '2-digit' });
+            document.getElementById('expected-time').textContent = timeStr;
+        }
+
+        // Status message
+        const msgPane = document.getElementById('admin-message');
+        if (status === 'called') {
+            msgPane.innerHTML = `<strong>${Language.t('your_turn_has_come')}!</strong><br>${Language.t('proceed_to_counter')}`;
+            msgPane.classList.add('highlight');
+            this.showPushNotification();
+        } else if (status === 'serving') {
+            msgPane.textContent = Language.t('status_serving');
+        } else if (status === 'completed') {
+            msgPane.textContent = Language.t('status_completed');
+        }
+
+        document.getElementById('last-update').textContent =
+            `${Language.t('last_updated_at')}: ${new Date().toLocaleTimeString('uz-UZ')}`;
+    },
+
     showPushNotification() {
         if (!("Notification" in window)) return;
         if (Notification.permission === "granted") {
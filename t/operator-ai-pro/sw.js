@@ -1,27 +1,59 @@
-const CACHE_NAME = 'operator-ai-v1';
-const ASSETS = [
-    '/',
-    '/index.html',
-    '/tracker.html',
-    '/css/main.css',
-    '/css/landing.css',
-    '/css/tracker.css',
-    '/js/language.js',
-    '/config.js'
-];
+// Service worker. build_assets.py fills PRECACHE with the content-hashed
+// files the offline pages use; hashed URLs never change, so an update only
+// downloads the entries that are not cached yet and drops the stale ones.
+// Unbuilt (development) copies precache nothing and only keep the pages.
+const CACHE_NAME = 'operator-ai-assets';
+const PRECACHE = [];
+const PAGES = ['/', '/index.html', '/tracker.html'];
 
 self.addEventListener('install', (event) => {
-    event.waitUntil(
-        caches.open(CACHE_NAME).then((cache) => {
-            return cache.addAll(ASSETS);
-        })
-    );
+    event.waitUntil((async () => {
+        const cache = await caches.open(CACHE_NAME);
+        const missing = [];
+        for (const url of PRECACHE) {
+            if (!(await cache.match(url))) missing.push(url);
+        }
+        await cache.addAll(missing);
+        await cache.addAll(PAGES);
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil((async () => {
+        // Older worker versions used their own cache names (operator-ai-v1)
+        for (const name of await caches.keys()) {
+            if (name !== CACHE_NAME) await caches.delete(name);
+        }
+        const keep = new Set([...PRECACHE, ...PAGES]);
+        const cache = await caches.open(CACHE_NAME);
+        for (const request of await cache.keys()) {
+            if (!keep.has(new URL(request.url).pathname)) await cache.delete(request);
+        }
+        await self.clients.claim();
+    })());
 });
 
 self.addEventListener('fetch', (event) => {
-    event.respondWith(
-        caches.match(event.request).then((response) => {
-            return response || fetch(event.request);
-        })
-    );
+    const url = new URL(event.request.url);
+    if (event.request.method !== 'GET' || url.origin !== self.location.origin) return;
+
+    if (PRECACHE.includes(url.pathname)) {
+        // Hashed, immutable: cache first
+        event.respondWith(caches.match(event.request).then((response) => response || fetch(event.request)));
+    } else if (event.request.mode === 'navigate' || PAGES.includes(url.pathname)) {
+        // Pages: network first so new builds show up, cached copy when offline
+        event.respondWith((async () => {
+            try {
+                const response = await fetch(event.request);
+                if (response.ok && PAGES.includes(url.pathname)) {
+                    const cache = await caches.open(CACHE_NAME);
+                    cache.put(event.request, response.clone());
+                }
+                return response;
+            } catch (err) {
+                return (await caches.match(event.request)) || Response.error();
+            }
+        })());
+    }
 });
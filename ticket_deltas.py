@@ -0,0 +1,93 @@
+import os
+import time
+from datetime import datetime
+import offload
+
+# --- Per-Ticket Delta Events ---
+# database.py marks the ticket and the service line(s) touched by every
+# committed transition -- this process's and, via the bus, every other
+# worker's. A flusher thread waits TICKET_DELTA_WINDOW_MS so a burst of
+# transitions collapses into one pass, recomputes the position of every
+# waiting ticket in the dirty lines from the in-memory index and pushes one
+# 'ticket_delta' per ticket whose status/position/ETA actually changed to the
+# trackers connected to this process, so "changed" is judged against what
+# they were last sent. Tracker pages render it directly instead of
+# re-fetching two endpoints. The last-sent table is dropped every day.
+
+TICKET_DELTA_WINDOW_MS = int(os.getenv("TICKET_DELTA_WINDOW_MS", "100"))
+
+class DeltaPublisher:
+    def __init__(self, window=TICKET_DELTA_WINDOW_MS / 1000.0):
+        self.window = window
+        self._lock = offload.Lock()
+        self._wake = offload.Event()
+        self._lines = set()      # (branch_id, service_id)
+        self._tickets = set()    # queue ids that changed themselves
+        self._last = {}          # queue_id -> last pushed (status, position, people_ahead, estimated_wait)
+        self._last_day = None
+        self._emit = None
+        self._line_positions = None
+        self._ticket_position = None
+
+    def start(self, emit, line_positions, ticket_position):
+        """emit(queue_id, payload); the two lookups come from database.py."""
+        if self._emit is not None:
+            return
+        self._emit = emit
+        self._line_positions = line_positions
+        self._ticket_position = ticket_position
+        offload.start_thread(self._run)
+
+    def mark(self, before, after):
+        if self._emit is None:
+            return
+        with self._lock:
+            for state in (before, after):
+                if state:
+                    self._tickets.add(state['id'])
+                    if state.get('branch_id'):
+                        self._lines.add((state['branch_id'], state.get('service_id')))
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            # Let the rest of the burst land before computing anything
+            time.sleep(self.window)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Ticket delta error: {e}")
+
+    def flush(self):
+        """Push pending deltas now. Returns the number of events emitted."""
+        with self._lock:
+            lines, tickets = self._lines, self._tickets
+            self._lines, self._tickets = set(), set()
+        today = datetime.now().strftime('%Y-%m-%d')
+        if today != self._last_day:
+            # Tickets still waiting from earlier days would otherwise stay here for good
+            self._last = {}
+            self._last_day = today
+        updates = {}
+        for branch_id, service_id in lines:
+            updates.update(self._line_positions(branch_id, service_id))
+        for q_id in tickets - updates.keys():
+            pos = self._ticket_position(q_id)
+            if pos:
+                updates[q_id] = pos
+        emitted = 0
+        for q_id, pos in updates.items():
+            key = (pos['status'], pos['position'], pos['people_ahead'], pos['estimated_wait'])
+            if self._last.get(q_id) == key:
+                continue
+            if pos['status'] == 'waiting':
+                self._last[q_id] = key
+            else:
+                self._last.pop(q_id, None)
+            self._emit(q_id, dict(pos, queue_id=q_id))
+            emitted += 1
+        return emitted
+
+delta_publisher = DeltaPublisher()